@@ -1,11 +1,17 @@
 import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
+import os
+import sys
 
-# Načtení CSV souborů
-df1 = pd.read_csv('BR490.csv', delimiter=',')
-df2 = pd.read_csv('BR245.csv', delimiter=',')
-df3 = pd.read_csv('BR123.csv', delimiter=',')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Software'))
+from bluelight.analysis.oroboros import read_export
+
+# Načtení CSV souborů (jednou rozparsované se načítají z cache vedle CSV)
+CSV_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'CSV')
+df1 = read_export(os.path.join(CSV_DIR, 'difC', 'BR490.csv'))
+df2 = read_export(os.path.join(CSV_DIR, 'difC', 'BR245.csv'))
+df3 = read_export(os.path.join(CSV_DIR, 'difC', 'BR123.csv'))
 
 # Funkce pro zarovnání dat podle "light on"
 def align_data(df):
@@ -1,11 +1,18 @@
 import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
+import os
+import sys
 
-# Načtení CSV souborů
-df1 = pd.read_csv('BR490.csv', delimiter=',')
-df2 = pd.read_csv('BR245.csv', delimiter=',')
-df3 = pd.read_csv('BR123.csv', delimiter=',')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Software'))
+from bluelight.analysis.align import light_periods
+from bluelight.analysis.oroboros import read_export
+
+# Načtení CSV souborů (jednou rozparsované se načítají z cache vedle CSV)
+CSV_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'CSV')
+df1 = read_export(os.path.join(CSV_DIR, 'difC', 'BR490.csv'))
+df2 = read_export(os.path.join(CSV_DIR, 'difC', 'BR245.csv'))
+df3 = read_export(os.path.join(CSV_DIR, 'difC', 'BR123.csv'))
 
 # Funkce pro zarovnání dat podle "light on" a korekce časů (zachování dat před nulou)
 def align_data(df):
@@ -57,8 +64,8 @@ ax2.plot(df3['Time [min]'], df3['1B: O2 slope neg. [pmol/(s*mL)]'], color=cmap_s
 # Vyznačení "light on" a "light off"
 light_on_times = pd.concat([df1[df1['Event Name'] == 'light on'], df2[df2['Event Name'] == 'light on'], df3[df3['Event Name'] == 'light on']])
 
-# Light off times occur exactly 60 minutes after the light on times
-light_off_times = light_on_times['Time [min]'] + 60
+# Skutečné časy vypnutí podle událostí "light off" (dříve "light on" + 60)
+light_off_times = pd.Series(np.concatenate([light_periods(df['Time [min]'], df['Event Name'])[1] for df in (df1, df2, df3)])).dropna()
 
 for t in light_on_times['Time [min]']:
     ax1.axvline(x=t, color='green', linestyle='--', label="Light On")
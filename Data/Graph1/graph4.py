@@ -2,21 +2,27 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib as mpl
 import numpy as np
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Software'))
+from bluelight.analysis.align import light_periods
+from bluelight.analysis.oroboros import read_export
+from bluelight.analysis.replicates import average_replicates
 
 mpl.rcParams['font.family'] = 'arial'
 
-# Načtení CSV souborů
-df1 = pd.read_csv('/Users/jakubvavra/Library/Mobile Documents/com~apple~CloudDocs/LEK/SVK/BlueLight DATA/CSV/difC/BR490.csv', delimiter=',')
-df2 = pd.read_csv('/Users/jakubvavra/Library/Mobile Documents/com~apple~CloudDocs/LEK/SVK/BlueLight DATA/CSV/difC/BR245.csv', delimiter=',')
-df3 = pd.read_csv('/Users/jakubvavra/Library/Mobile Documents/com~apple~CloudDocs/LEK/SVK/BlueLight DATA/CSV/difC/BR123.csv', delimiter=',')
+# Načtení CSV souborů (jednou rozparsované se načítají z cache vedle CSV)
+CSV_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'CSV')
+df1 = read_export(os.path.join(CSV_DIR, 'difC', 'BR490.csv'))
+df2 = read_export(os.path.join(CSV_DIR, 'difC', 'BR245.csv'))
+df3 = read_export(os.path.join(CSV_DIR, 'difC', 'BR123.csv'))
 
 # Funkce pro zarovnání dat podle "light on" a korekci časů
 def align_data(df):
     light_on_index = df[df['Event Name'] == 'light on'].index[0]
     light_on_time = df.loc[light_on_index, 'Time [min]']
     df['Time [min]'] = df['Time [min]'] - light_on_time
-    # Zaokrouhlení časů na 2 desetinná místa
-    df['Time [min]'] = df['Time [min]'].round(2)
     return df
 
 # Zarovnání dat
@@ -24,14 +30,14 @@ df1 = align_data(df1)
 df2 = align_data(df2)
 df3 = align_data(df3)
 
-# Sloučení a zprůměrování dat
-df_bsa = pd.concat([df1[['Time [min]', '1A: O2 concentration [M]', '1A: O2 slope neg. [pmol/(s*mL)]']],
-                    df2[['Time [min]', '1A: O2 concentration [M]', '1A: O2 slope neg. [pmol/(s*mL)]']],
-                    df3[['Time [min]', '1A: O2 concentration [M]', '1A: O2 slope neg. [pmol/(s*mL)]']]])
-
-# Průměrování hodnot pro stejné časy
-df_bsa = df_bsa.groupby('Time [min]', as_index=False).filter(lambda x: len(x) > 2).groupby('Time [min]').mean().reset_index()
-#df_bsa = df_bsa.groupby('Time [min]', as_index=False).mean().reset_index()
+# Zprůměrování BSA (1A) ze všech tří měření na společné časové ose (interpolace, ne zaokrouhlené časy)
+frames = (df1, df2, df3)
+times = [df['Time [min]'] for df in frames]
+bsa_conc = average_replicates(times, [df['1A: O2 concentration [M]'] for df in frames], min_count=3)
+bsa_slope = average_replicates(times, [df['1A: O2 slope neg. [pmol/(s*mL)]'] for df in frames], grid=bsa_conc.time, min_count=3)
+df_bsa = pd.DataFrame({'Time [min]': bsa_conc.time,
+                       '1A: O2 concentration [M]': bsa_conc.mean,
+                       '1A: O2 slope neg. [pmol/(s*mL)]': bsa_slope.mean}).dropna(subset=['1A: O2 concentration [M]']).reset_index(drop=True)
 
 # Vytvoření grafu
 fig, ax1 = plt.subplots(figsize=(10, 6))
@@ -92,7 +98,8 @@ add_label(ax2, df3['Time [min]'], df3['1B: O2 slope neg. [pmol/(s*mL)]'], "spot
 
 # Vyznačení "light on" a "light off"
 light_on_times = pd.concat([df1[df1['Event Name'] == 'light on'], df2[df2['Event Name'] == 'light on'], df3[df3['Event Name'] == 'light on']])
-light_off_times = light_on_times['Time [min]'] + 60
+# Skutečné časy vypnutí podle událostí "light off" (dříve "light on" + 60)
+light_off_times = pd.Series(np.concatenate([light_periods(df['Time [min]'], df['Event Name'])[1] for df in (df1, df2, df3)])).dropna()
 
 # Přidání čar do grafu
 for t in light_on_times['Time [min]']:
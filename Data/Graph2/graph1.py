@@ -2,14 +2,21 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib as mpl
 import numpy as np
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Software'))
+from bluelight.analysis.align import light_periods
+from bluelight.analysis.oroboros import read_export
 
 plt.rcParams.update({'font.size': 18})
 mpl.rcParams['font.family'] = 'arial'
 
-# Načtení CSV souborů
-df1 = pd.read_csv('/Users/jakubvavra/Library/Mobile Documents/com~apple~CloudDocs/LEK/SVK/BlueLight DATA/CSV/difL/L1vsL128.csv', delimiter=',', encoding='latin1')
-df2 = pd.read_csv('/Users/jakubvavra/Library/Mobile Documents/com~apple~CloudDocs/LEK/SVK/BlueLight DATA/CSV/difL/L15.csv', delimiter=',', encoding='latin1')
-df3 = pd.read_csv('/Users/jakubvavra/Library/Mobile Documents/com~apple~CloudDocs/LEK/SVK/BlueLight DATA/CSV/difL/L40vsL80.csv', delimiter=',', encoding='latin1')
+# Načtení CSV souborů (jednou rozparsované se načítají z cache vedle CSV)
+CSV_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'CSV')
+df1 = read_export(os.path.join(CSV_DIR, 'difL', 'L1vsL128.csv'))
+df2 = read_export(os.path.join(CSV_DIR, 'difL', 'L15.csv'))
+df3 = read_export(os.path.join(CSV_DIR, 'difL', 'L40vsL80.csv'))
 
 # Funkce pro zarovnání dat podle "light on" a korekci časů
 def align_data(df):
@@ -48,7 +55,8 @@ ax2.plot(df1['Time [min]'], df1['1B: O2 slope neg. [pmol/(s*mL)]'], color=cmap_s
 
 # Vyznačení "light on" a "light off"
 light_on_times = pd.concat([df1[df1['Event Name'] == 'light on'], df2[df2['Event Name'] == 'light on'], df3[df3['Event Name'] == 'light on']])
-light_off_times = light_on_times['Time [min]'] + 60
+# Skutečné časy vypnutí podle událostí "light off" (dříve "light on" + 60)
+light_off_times = pd.Series(np.concatenate([light_periods(df['Time [min]'], df['Event Name'])[1] for df in (df1, df2, df3)])).dropna()
 
 # Přidání čar do grafu
 for t in light_on_times['Time [min]']:
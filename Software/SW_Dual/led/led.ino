@@ -10,15 +10,330 @@
 #define BUTTON2_PIN 9
 #define BUTTON3_PIN 10
 
+// Binary protocol (see Software/bluelight/protocol.py)
+#define SYNC_BYTE 0xA5
+#define FRAME_SIZE 5           // SYNC, kind << 4 | channel, value, seq, crc8
+#define SET_MANY_FRAME_SIZE 6  // SYNC, kind << 4 | channel mask, value1, value2, seq, crc8
+#define KIND_SET 0x1
+#define KIND_REPORT 0x2
+#define KIND_SET_MANY 0x3
+#define KIND_UPLOAD_BEGIN 0x4  // SYNC, kind << 4, length low, length high, seq, crc8
+#define KIND_UPLOAD_DATA 0x5   // SYNC, kind << 4 | count, offset low, offset high, 8 data bytes, seq, crc8
+#define KIND_SCHEDULE 0x6      // SYNC, kind << 4 | operation, 0, seq, crc8
+#define KIND_STATUS 0x7        // SYNC, kind << 4 | event, number low, number high, seq, crc8
+#define UPLOAD_CHUNK 8
+#define UPLOAD_FRAME_SIZE (6 + UPLOAD_CHUNK)
+#define STATUS_FRAME_SIZE 6
+#define LOCAL_SEQ 0            // Sequence number for changes made on the box itself
+#define LINE_BUFFER_SIZE 32
+
+// Uploaded schedule (see Software/bluelight/upload.py): entries of
+// varint delay in ms since the previous entry, channel mask, values
+#define MAX_TABLE_SIZE 512
+#define SCHEDULE_STOP 0
+#define SCHEDULE_START 1
+#define SCHEDULE_CHECK 2
+#define EVENT_CHECKSUM 0
+#define EVENT_STEP 1
+#define EVENT_FINISHED 2
+#define EVENT_STOPPED 3
+#define EVENT_ERROR 4
+#define EVENT_STARTED 5
+
 // Variables
 int brightness1 = 0;         // Brightness for LED 1 (0-255)
 int brightness2 = 0;         // Brightness for LED 2 (0-255)
 int encoderValue = 0;
 int lastStateCLK = LOW;
 int currentStateCLK = LOW;
-bool brightnessChanged = false;
+bool brightness1Changed = false;
+bool brightness2Changed = false;
 bool activeLED = 1;          // 1 for LED_1, 0 for LED_2
 
+bool binaryMode = false;     // Reports are sent as binary frames instead of text lines
+char lineBuffer[LINE_BUFFER_SIZE];
+byte lineLength = 0;
+byte frameBuffer[UPLOAD_FRAME_SIZE];
+byte frameLength = 0;        // Bytes of the binary frame received so far
+
+const char *const eventNames[] = {"CHECKSUM", "STEP", "FINISHED", "STOPPED", "ERROR", "STARTED"};
+byte scheduleTable[MAX_TABLE_SIZE];
+unsigned int scheduleLength = 0;
+unsigned int schedulePos = 0;      // Next byte of the table to read
+unsigned int scheduleIndex = 0;    // Entries applied so far
+unsigned long scheduleNextAt = 0;  // millis() at which the next entry is due
+bool scheduleRunning = false;
+
+// CRC-8, polynomial 0x07
+byte crc8(const byte *data, byte length) {
+  byte crc = 0;
+  for (byte i = 0; i < length; i++) {
+    crc ^= data[i];
+    for (byte bit = 0; bit < 8; bit++) {
+      crc = (crc & 0x80) ? (crc << 1) ^ 0x07 : crc << 1;
+    }
+  }
+  return crc;
+}
+
+// CRC-16/CCITT-FALSE of the schedule table
+unsigned int crc16(const byte *data, unsigned int length) {
+  unsigned int crc = 0xFFFF;
+  for (unsigned int i = 0; i < length; i++) {
+    crc ^= (unsigned int)data[i] << 8;
+    for (byte bit = 0; bit < 8; bit++) {
+      crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : crc << 1;
+    }
+  }
+  return crc & 0xFFFF;
+}
+
+void reportBrightness(byte channel, int value, byte seq) {
+  if (binaryMode) {
+    byte frame[FRAME_SIZE] = {SYNC_BYTE, (byte)((KIND_REPORT << 4) | channel), (byte)value, seq, 0};
+    frame[4] = crc8(frame + 1, 3);
+    Serial.write(frame, FRAME_SIZE);
+  } else {
+    Serial.print(channel == 1 ? "BRIGHTNESS1:" : "BRIGHTNESS2:");
+    Serial.println(value);
+  }
+}
+
+void reportStatus(byte event, unsigned int number, byte seq) {
+  if (binaryMode) {
+    byte frame[STATUS_FRAME_SIZE] = {SYNC_BYTE, (byte)((KIND_STATUS << 4) | event), (byte)(number & 0xFF), (byte)(number >> 8), seq, 0};
+    frame[5] = crc8(frame + 1, 4);
+    Serial.write(frame, STATUS_FRAME_SIZE);
+  } else {
+    Serial.print("SCHEDULE:");
+    Serial.print(eventNames[event]);
+    Serial.print(":");
+    Serial.println(number);
+  }
+}
+
+bool applyBrightness(byte channel, int value) {
+  value = constrain(value, 0, 255);
+  if (channel == 1) {
+    brightness1 = value;
+    analogWrite(LED_1_PIN, brightness1);
+  } else if (channel == 2) {
+    brightness2 = value;
+    analogWrite(LED_2_PIN, brightness2);
+  } else {
+    return false;
+  }
+  return true;
+}
+
+void setBrightness(byte channel, int value, byte seq) {
+  if (applyBrightness(channel, value)) {
+    reportBrightness(channel, channel == 1 ? brightness1 : brightness2, seq);
+  }
+}
+
+// Apply every channel in mask (bit 0 = LED 1) before reporting any of them,
+// so both LEDs switch in the same loop iteration.
+void setBrightnessMany(byte mask, int value1, int value2, byte seq) {
+  if (mask & 0x01) {
+    applyBrightness(1, value1);
+  }
+  if (mask & 0x02) {
+    applyBrightness(2, value2);
+  }
+  if (mask & 0x01) {
+    reportBrightness(1, brightness1, seq);
+  }
+  if (mask & 0x02) {
+    reportBrightness(2, brightness2, seq);
+  }
+}
+
+// SETM:v1,v2 where "-" leaves a channel unchanged
+void handleSetMany(char *field) {
+  int values[2] = {0, 0};
+  byte mask = 0;
+  for (byte i = 0; i < 2 && field != NULL; i++) {
+    if (*field != '-' && *field != ',' && *field != '\0') {
+      values[i] = atoi(field);
+      mask |= 1 << i;
+    }
+    field = strchr(field, ',');
+    if (field != NULL) {
+      field++;
+    }
+  }
+  setBrightnessMany(mask, values[0], values[1], LOCAL_SEQ);
+}
+
+void handleLine() {
+  if (strncmp(lineBuffer, "SET1:", 5) == 0) {
+    setBrightness(1, atoi(lineBuffer + 5), LOCAL_SEQ);
+  } else if (strncmp(lineBuffer, "SET2:", 5) == 0) {
+    setBrightness(2, atoi(lineBuffer + 5), LOCAL_SEQ);
+  } else if (strncmp(lineBuffer, "SETM:", 5) == 0) {
+    handleSetMany(lineBuffer + 5);
+  } else if (strcmp(lineBuffer, "GET") == 0) {
+    reportBrightness(1, brightness1, LOCAL_SEQ);
+    reportBrightness(2, brightness2, LOCAL_SEQ);
+  } else if (strcmp(lineBuffer, "BINARY") == 0) {
+    Serial.println("BINARY:OK");
+    binaryMode = true;
+  } else if (strcmp(lineBuffer, "TEXT") == 0) {
+    binaryMode = false;
+    Serial.println("TEXT:OK");
+  }
+}
+
+// --- Uploaded schedule ---
+
+// Read the varint delay at schedulePos, false if the table ends inside it
+bool readDelay(unsigned long *delayMs) {
+  *delayMs = 0;
+  for (byte shift = 0; schedulePos < scheduleLength && shift < 32; shift += 7) {
+    byte b = scheduleTable[schedulePos++];
+    *delayMs |= (unsigned long)(b & 0x7F) << shift;
+    if (!(b & 0x80)) {
+      return true;
+    }
+  }
+  return false;
+}
+
+void failSchedule() {
+  scheduleRunning = false;
+  reportStatus(EVENT_ERROR, scheduleIndex, LOCAL_SEQ);
+}
+
+void startSchedule(byte seq) {
+  unsigned long delayMs;
+  schedulePos = 0;
+  scheduleIndex = 0;
+  if (scheduleLength == 0 || !readDelay(&delayMs)) {
+    scheduleRunning = false;
+    reportStatus(EVENT_ERROR, 0, seq);
+    return;
+  }
+  scheduleNextAt = millis() + delayMs;
+  scheduleRunning = true;
+  reportStatus(EVENT_STARTED, scheduleLength, seq);
+}
+
+void stopSchedule(byte seq) {
+  scheduleRunning = false;
+  setBrightnessMany(0x03, 0, 0, LOCAL_SEQ);
+  reportStatus(EVENT_STOPPED, scheduleIndex, seq);
+}
+
+// Apply every entry that is due; delays add up to absolute times, so late loops do not shift the schedule
+void runSchedule() {
+  while (scheduleRunning && (long)(millis() - scheduleNextAt) >= 0) {
+    if (schedulePos >= scheduleLength) {
+      failSchedule();
+      return;
+    }
+    byte mask = scheduleTable[schedulePos++];
+    byte count = ((mask & 0x01) ? 1 : 0) + ((mask & 0x02) ? 1 : 0);
+    if (schedulePos + count > scheduleLength) {
+      failSchedule();
+      return;
+    }
+    int value1 = (mask & 0x01) ? scheduleTable[schedulePos++] : 0;
+    int value2 = (mask & 0x02) ? scheduleTable[schedulePos++] : 0;
+    setBrightnessMany(mask, value1, value2, LOCAL_SEQ);
+    reportStatus(EVENT_STEP, scheduleIndex++, LOCAL_SEQ);
+    unsigned long delayMs;
+    if (schedulePos >= scheduleLength) {
+      scheduleRunning = false;
+      reportStatus(EVENT_FINISHED, scheduleIndex, LOCAL_SEQ);
+    } else if (readDelay(&delayMs)) {
+      scheduleNextAt += delayMs;
+    } else {
+      failSchedule();
+    }
+  }
+}
+
+// --- Binary frames ---
+
+byte frameSize(byte header) {
+  switch (header >> 4) {
+    case KIND_SET_MANY:
+    case KIND_UPLOAD_BEGIN:
+      return SET_MANY_FRAME_SIZE;
+    case KIND_UPLOAD_DATA:
+      return UPLOAD_FRAME_SIZE;
+    default:
+      return FRAME_SIZE;
+  }
+}
+
+void handleFrame(byte size) {
+  byte kind = frameBuffer[1] >> 4;
+  if (kind == KIND_SET && size == FRAME_SIZE) {
+    setBrightness(frameBuffer[1] & 0x0F, frameBuffer[2], frameBuffer[3]);
+  } else if (kind == KIND_SET_MANY) {
+    setBrightnessMany(frameBuffer[1] & 0x0F, frameBuffer[2], frameBuffer[3], frameBuffer[4]);
+  } else if (kind == KIND_UPLOAD_BEGIN) {
+    unsigned int length = frameBuffer[2] | (frameBuffer[3] << 8);
+    scheduleRunning = false;
+    scheduleLength = 0;
+    if (length > MAX_TABLE_SIZE) {
+      reportStatus(EVENT_ERROR, length, frameBuffer[4]);
+    } else {
+      scheduleLength = length;
+    }
+  } else if (kind == KIND_UPLOAD_DATA) {
+    byte count = frameBuffer[1] & 0x0F;
+    unsigned int offset = frameBuffer[2] | (frameBuffer[3] << 8);
+    if (count <= UPLOAD_CHUNK && offset + count <= scheduleLength) {
+      memcpy(scheduleTable + offset, frameBuffer + 4, count);
+    }
+  } else if (kind == KIND_SCHEDULE) {
+    byte op = frameBuffer[1] & 0x0F;
+    byte seq = frameBuffer[3];
+    if (op == SCHEDULE_START) {
+      startSchedule(seq);
+    } else if (op == SCHEDULE_STOP) {
+      stopSchedule(seq);
+    } else if (op == SCHEDULE_CHECK) {
+      reportStatus(EVENT_CHECKSUM, crc16(scheduleTable, scheduleLength), seq);
+    }
+  }
+}
+
+void handleFrameByte(byte b) {
+  frameBuffer[frameLength++] = b;
+  while (frameLength >= 2 && frameLength >= frameSize(frameBuffer[1])) {
+    byte size = frameSize(frameBuffer[1]);
+    byte next = 1;  // Bad CRC: resync on the next SYNC byte inside the frame, if any
+    if (frameBuffer[size - 1] == crc8(frameBuffer + 1, size - 2)) {
+      handleFrame(size);
+      next = size;
+    }
+    while (next < frameLength && frameBuffer[next] != SYNC_BYTE) {
+      next++;
+    }
+    frameLength -= next;
+    memmove(frameBuffer, frameBuffer + next, frameLength);
+  }
+}
+
+void handleSerial() {
+  while (Serial.available()) {
+    byte b = Serial.read();
+    if (frameLength > 0 || b == SYNC_BYTE) {
+      handleFrameByte(b);
+    } else if (b == '\n') {
+      lineBuffer[lineLength] = '\0';
+      handleLine();
+      lineLength = 0;
+    } else if (b != '\r' && lineLength < LINE_BUFFER_SIZE - 1) {
+      lineBuffer[lineLength++] = b;
+    }
+  }
+}
+
 // Setup
 void setup() {
   Serial.begin(9600);
@@ -44,69 +359,54 @@ void loop() {
   // --- Encoder Rotation ---
   currentStateCLK = digitalRead(CLK);
   if (currentStateCLK != lastStateCLK) {
-    if (digitalRead(DT) != currentStateCLK) {
-      if (activeLED) {
-        brightness1 += 5;
-      } else {
-        brightness2 += 5;
-      }
+    int step = (digitalRead(DT) != currentStateCLK) ? 5 : -5;
+    if (activeLED) {
+      brightness1 = constrain(brightness1 + step, 0, 255);
+      brightness1Changed = true;
     } else {
-      if (activeLED) {
-        brightness1 -= 5;
-      } else {
-        brightness2 -= 5;
-      }
+      brightness2 = constrain(brightness2 + step, 0, 255);
+      brightness2Changed = true;
     }
-
-    brightness1 = constrain(brightness1, 0, 255);
-    brightness2 = constrain(brightness2, 0, 255);
-    brightnessChanged = true;
   }
   lastStateCLK = currentStateCLK;
 
   // --- Button Press ---
   if (digitalRead(BUTTON1_PIN) == HIGH) {
-    if (activeLED) {
+    if (activeLED && brightness1 != 0) {
       brightness1 = 0;
-    } else {
+      brightness1Changed = true;
+    } else if (!activeLED && brightness2 != 0) {
       brightness2 = 0;
+      brightness2Changed = true;
     }
-    brightnessChanged = true;
   }
   if (digitalRead(BUTTON2_PIN) == HIGH) {
     activeLED = !activeLED; // Toggle active LED
     delay(200);             // Debounce delay
   }
   if (digitalRead(BUTTON3_PIN) == HIGH) {
-    if (activeLED) {
+    if (activeLED && brightness1 != 255) {
       brightness1 = 255;
-    } else {
+      brightness1Changed = true;
+    } else if (!activeLED && brightness2 != 255) {
       brightness2 = 255;
+      brightness2Changed = true;
     }
-    brightnessChanged = true;
   }
 
-  // --- Update LED brightness ---
-  if (brightnessChanged) {
-    analogWrite(LED_1_PIN, brightness1);
-    analogWrite(LED_2_PIN, brightness2);
-    Serial.println(String("BRIGHTNESS1:") + brightness1);
-    Serial.println(String("BRIGHTNESS2:") + brightness2);
-    brightnessChanged = false;
+  // --- Update LED brightness, reporting only the channel that changed ---
+  if (brightness1Changed) {
+    setBrightness(1, brightness1, LOCAL_SEQ);
+    brightness1Changed = false;
   }
+  if (brightness2Changed) {
+    setBrightness(2, brightness2, LOCAL_SEQ);
+    brightness2Changed = false;
+  }
+
+  // --- Uploaded schedule ---
+  runSchedule();
 
   // --- Handle Serial Communication ---
-  if (Serial.available()) {
-    String input = Serial.readStringUntil('\n');
-    if (input.startsWith("SET1:")) {
-      brightness1 = constrain(input.substring(5).toInt(), 0, 255);
-      analogWrite(LED_1_PIN, brightness1);
-      Serial.println(String("BRIGHTNESS1:") + brightness1);
-    }
-    if (input.startsWith("SET2:")) {
-      brightness2 = constrain(input.substring(5).toInt(), 0, 255);
-      analogWrite(LED_2_PIN, brightness2);
-      Serial.println(String("BRIGHTNESS2:") + brightness2);
-    }
-  }
+  handleSerial();
 }
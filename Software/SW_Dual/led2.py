@@ -1,42 +1,50 @@
+import math
+import os
 import sys
+import time
 from PyQt5.QtWidgets import (
     QApplication, QVBoxLayout, QHBoxLayout, QSlider, QPushButton, QLineEdit, QLabel, QWidget,
-    QComboBox, QMessageBox, QGroupBox, QCheckBox
+    QComboBox, QMessageBox, QGroupBox, QCheckBox, QFileDialog, QPlainTextEdit, QProgressBar
 )
-from PyQt5.QtCore import Qt, QThread, pyqtSignal, QTimer
+from PyQt5.QtCore import Qt, pyqtSignal, QTimer
 import serial
 from serial.tools import list_ports
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from bluelight import EventLoopThread, LightController, protocol  # noqa: E402
+from bluelight.program import ProgramRunner, Step, compile_program, format_seconds, parse_program  # noqa: E402
+from bluelight.calibration import load_profile  # noqa: E402
+from bluelight.journal import Journal  # noqa: E402
+from bluelight.upload import compile_table, entry_count  # noqa: E402
+from o2plot import O2PlotWidget  # noqa: E402
 
-class SerialReaderThread(QThread):
-    brightness_received = pyqtSignal(str, int)  # Signal for LED ID and brightness value
+JOURNAL_DIRECTORY = os.path.join(os.path.expanduser("~"), "bluelight-journal")
+DISPLAY_INTERVAL = 0.25  # Seconds between progress refreshes while a program runs
+PROGRAM_PLACEHOLDER = """One step per line, minutes unless 30s / 2min / 1h:
+128 10
+ramp 0 255 30s
+repeat 5 ... end"""
 
-    def __init__(self, serial_port):
-        super().__init__()
-        self.serial_port = serial_port
-        self.running = True
-
-    def run(self):
-        while self.running:
-            if self.serial_port and self.serial_port.is_open:
-                try:
-                    line = self.serial_port.readline().decode().strip()
-                    if line.startswith("BRIGHTNESS1:") or line.startswith("BRIGHTNESS2:"):
-                        led_id, value = line.split(":")
-                        self.brightness_received.emit(led_id, int(value))
-                except (ValueError, IndexError, serial.SerialException):
-                    continue
 
-    def stop(self):
-        self.running = False
-        self.wait()
+def format_duration(seconds):
+    minutes, seconds = divmod(seconds, 60)
+    return f"{int(minutes):02}:{seconds:06.3f}"
 
 
 class LEDControlApp(QWidget):
+    brightness_received = pyqtSignal(int, int)  # Signal for LED ID and brightness value
+    schedule_event_received = pyqtSignal(int, int)  # Signal for schedule event and its number
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("LED Brightness Control")
 
+        # PWM <-> µW/cm² tables per LED from the calibration profile, replaced by the box's own on connect
+        self.calibration_profile = load_profile()
+        self.calibration = self.calibration_profile.tables_for()
+        self.port_serial_numbers = {}  # Port name -> USB serial number, identifies the box in the profile
+        self.irradiance_settings = {}  # LED ID -> irradiance.Setting of the last irradiance target
+
         # Main layout
         self.main_layout = QVBoxLayout()
 
@@ -53,13 +61,12 @@ class LEDControlApp(QWidget):
 
         # LED controls
         self.led_controls = {}
-        self.timers = {}  # Store separate timers for each LED
-        self.remaining_times = {}  # Dictionary to store remaining times for each LED
 
         led_layout = QHBoxLayout()  # Layout to place LED controls side by side
         for led_id in [1, 2]:  # Add controls for LED 1 and LED 2
             self.led_controls[led_id] = self.create_led_controls(led_id)
             led_layout.addWidget(self.led_controls[led_id]["group"])
+        self.apply_calibration(self.calibration)
 
         self.main_layout.addLayout(led_layout)
 
@@ -85,6 +92,12 @@ class LEDControlApp(QWidget):
         brightness_layout_2.addWidget(self.combined_brightness_input_2)
         self.combined_timer_layout.addLayout(brightness_layout_2)
 
+        # Stop after a fixed time, or once each chamber received a dose (needs a connected, calibrated box)
+        self.combined_stop_mode = QComboBox()
+        self.combined_stop_mode.addItems(["Stop after minutes", "Stop at dose (J/cm²)"])
+        self.combined_stop_mode.currentIndexChanged.connect(self.update_stop_mode)
+        self.combined_timer_layout.addWidget(self.combined_stop_mode)
+
         self.sync_time_checkbox = QCheckBox("Sync Timer Duration for Both LEDs")
         self.sync_time_checkbox.stateChanged.connect(self.toggle_sync_time)
         self.combined_timer_layout.addWidget(self.sync_time_checkbox)
@@ -122,17 +135,94 @@ class LEDControlApp(QWidget):
         self.combined_timer_group.setLayout(self.combined_timer_layout)
         self.main_layout.addWidget(self.combined_timer_group)
 
-        self.setLayout(self.main_layout)
-
-        # Serial connection
-        self.arduino = None
-        self.serial_thread = None
-
-        # Combined timer
-        self.combined_timer = None
-        self.combined_remaining_time = 0
+        # Section: Programs uploaded to the box, timed by the firmware instead of this app
+        self.box_schedule_group = QGroupBox("Run Programs on the Box")
+        box_schedule_layout = QVBoxLayout()
+        box_schedule_layout.addWidget(QLabel("Keeps running if this PC stalls, sleeps or disconnects."))
+        box_schedule_buttons_layout = QHBoxLayout()
+        box_schedule_start_button = QPushButton("Upload and Start Both Programs")
+        box_schedule_start_button.clicked.connect(self.start_box_schedule)
+        box_schedule_buttons_layout.addWidget(box_schedule_start_button)
+        box_schedule_stop_button = QPushButton("Stop")
+        box_schedule_stop_button.clicked.connect(self.stop_box_schedule)
+        box_schedule_buttons_layout.addWidget(box_schedule_stop_button)
+        box_schedule_layout.addLayout(box_schedule_buttons_layout)
+        self.box_schedule_status = QLabel("Not running")
+        box_schedule_layout.addWidget(self.box_schedule_status)
+        self.box_schedule_group.setLayout(box_schedule_layout)
+        self.main_layout.addWidget(self.box_schedule_group)
+        self.box_schedule_steps = 0
+
+        # Section: Round-trip latency of the commands, from the write to the box's confirmation
+        self.latency_group = QGroupBox("Command Latency")
+        latency_layout = QVBoxLayout()
+        self.latency_labels = {}
+        for led_id in self.led_controls:
+            self.latency_labels[led_id] = QLabel(f"LED {led_id}: no data")
+            latency_layout.addWidget(self.latency_labels[led_id])
+        latency_export_button = QPushButton("Export Latency CSV")
+        latency_export_button.clicked.connect(self.export_latency)
+        latency_layout.addWidget(latency_export_button)
+        self.journal_label = QLabel()
+        latency_layout.addWidget(self.journal_label)
+        self.latency_group.setLayout(latency_layout)
+        self.main_layout.addWidget(self.latency_group)
+
+        self.latency_timer = QTimer()
+        self.latency_timer.timeout.connect(self.update_latency_panel)
+        self.latency_timer.start(1000)
+
+        # Section: Live O2 from the DatLab export being written, next to the brightness set here
+        self.o2_group = QGroupBox("Live O2")
+        o2_layout = QVBoxLayout()
+        o2_buttons = QHBoxLayout()
+        follow_button = QPushButton("Follow Export…")
+        follow_button.clicked.connect(self.follow_export)
+        o2_buttons.addWidget(follow_button)
+        self.o2_label = QLabel("No export")
+        o2_buttons.addWidget(self.o2_label, stretch=1)
+        o2_layout.addLayout(o2_buttons)
+        self.o2_plot = O2PlotWidget(tuple(self.led_controls))
+        self.o2_plot.poll_status.connect(self.show_export_status)
+        o2_layout.addWidget(self.o2_plot)
+        self.o2_group.setLayout(o2_layout)
+
+        window_layout = QHBoxLayout()
+        window_layout.addLayout(self.main_layout)
+        window_layout.addWidget(self.o2_group, stretch=1)
+        self.setLayout(window_layout)
+
+        # Every brightness command and report of this session goes into a journal file
+        self.journal = None
+        try:
+            os.makedirs(JOURNAL_DIRECTORY, exist_ok=True)
+            self.journal = Journal(os.path.join(JOURNAL_DIRECTORY, time.strftime("%Y%m%d-%H%M%S.bljournal")))
+            self.journal_label.setText(f"Journal: {self.journal.path}")
+        except OSError as e:
+            self.journal_label.setText(f"Journal disabled: {e}")
+
+        # Connection to the box, its I/O runs on the background event loop
+        self.event_loop = EventLoopThread()
+        self.event_loop.start()
+        self.controller = None
+        self.brightness_received.connect(self.update_slider_from_signal)
+        self.schedule_event_received.connect(self.update_box_schedule)
+
+        # Programs run against absolute deadlines, one precise timer wakes up for the next change or display update
+        self.programs = ProgramRunner()
+        self.program_timer = QTimer()
+        self.program_timer.setSingleShot(True)
+        self.program_timer.setTimerType(Qt.PreciseTimer)
+        self.program_timer.timeout.connect(self.update_programs)
         self.combined_timer_paused = False  # Flag to track combined timer state
 
+        # Delivered dose, integrated by the controller; the timer wakes up when a dose target is reached
+        self.dose_timer = QTimer()
+        self.dose_timer.setSingleShot(True)
+        self.dose_timer.setTimerType(Qt.PreciseTimer)
+        self.dose_timer.timeout.connect(self.update_dose)
+        self.dose_paused = {}  # LED ID -> brightness to restore when a paused dose exposure resumes
+
     def create_led_controls(self, led_id):
         """Create controls for a single LED."""
         group = QGroupBox(f"LED {led_id} Controls")
@@ -166,40 +256,51 @@ class LEDControlApp(QWidget):
 
         layout.addLayout(brightness_buttons_layout)
 
-        # Timer group
-        timer_group = QGroupBox("Timer")
-        timer_layout = QVBoxLayout()
-        timer_countdown_label = QLabel("Time remaining: 00:00")
-        timer_layout.addWidget(timer_countdown_label)
-
-        timer_brightness_input = QLineEdit()
-        timer_brightness_input.setPlaceholderText("Brightness for timer (0-255):")
-        timer_layout.addWidget(timer_brightness_input)
-
-        timer_duration_input = QLineEdit()
-        timer_duration_input.setPlaceholderText("Timer duration (minutes):")
-        timer_layout.addWidget(timer_duration_input)
-
-        timer_buttons_layout = QHBoxLayout()
-        timer_start_button = QPushButton("Start")
-        timer_start_button.clicked.connect(
-            lambda: self.start_timer(
-                slider, timer_brightness_input, timer_duration_input, timer_countdown_label, led_id
-            )
-        )
-        timer_buttons_layout.addWidget(timer_start_button)
-
-        timer_pause_button = QPushButton("Pause")
-        timer_pause_button.clicked.connect(lambda: self.pause_timer(timer_pause_button, led_id))
-        timer_buttons_layout.addWidget(timer_pause_button)
-
-        timer_reset_button = QPushButton("Reset")
-        timer_reset_button.clicked.connect(lambda: self.reset_timer(led_id, slider, timer_countdown_label))
-        timer_buttons_layout.addWidget(timer_reset_button)
-
-        timer_layout.addLayout(timer_buttons_layout)
-        timer_group.setLayout(timer_layout)
-        layout.addWidget(timer_group)
+        # Irradiance target in physical units, mapped to PWM through the calibration table
+        irradiance_layout = QHBoxLayout()
+        irradiance_input = QLineEdit()
+        irradiance_input.setPlaceholderText("Target irradiance (µW/cm²):")
+        irradiance_layout.addWidget(irradiance_input)
+        irradiance_button = QPushButton("Set Irradiance")
+        irradiance_button.clicked.connect(lambda: self.set_irradiance_from_input(irradiance_input, led_id))
+        irradiance_layout.addWidget(irradiance_button)
+        layout.addLayout(irradiance_layout)
+        irradiance_label = QLabel()
+        layout.addWidget(irradiance_label)
+        dose_label = QLabel("Dose: not connected")
+        layout.addWidget(dose_label)
+
+        # Program group: steps, ramps and repeats, see bluelight/program.py for the syntax
+        program_group = QGroupBox("Program")
+        program_layout = QVBoxLayout()
+        program_input = QPlainTextEdit()
+        program_input.setPlaceholderText(PROGRAM_PLACEHOLDER)
+        program_input.setFixedHeight(90)
+        program_layout.addWidget(program_input)
+
+        program_progress = QProgressBar()
+        program_progress.setRange(0, 1000)
+        program_progress.setTextVisible(False)
+        program_layout.addWidget(program_progress)
+        program_status = QLabel("Not running")
+        program_layout.addWidget(program_status)
+
+        program_buttons_layout = QHBoxLayout()
+        program_start_button = QPushButton("Start")
+        program_start_button.clicked.connect(lambda: self.start_program(led_id))
+        program_buttons_layout.addWidget(program_start_button)
+
+        program_pause_button = QPushButton("Pause")
+        program_pause_button.clicked.connect(lambda: self.pause_program(led_id))
+        program_buttons_layout.addWidget(program_pause_button)
+
+        program_reset_button = QPushButton("Reset")
+        program_reset_button.clicked.connect(lambda: self.reset_program(led_id))
+        program_buttons_layout.addWidget(program_reset_button)
+
+        program_layout.addLayout(program_buttons_layout)
+        program_group.setLayout(program_layout)
+        layout.addWidget(program_group)
 
         group.setLayout(layout)
 
@@ -207,10 +308,14 @@ class LEDControlApp(QWidget):
             "group": group,
             "slider": slider,
             "input_field": input_field,
-            "timer_countdown_label": timer_countdown_label,
-            "timer_brightness_input": timer_brightness_input,
-            "timer_duration_input": timer_duration_input,
-            "timer_pause_button": timer_pause_button,
+            "irradiance_input": irradiance_input,
+            "irradiance_button": irradiance_button,
+            "irradiance_label": irradiance_label,
+            "dose_label": dose_label,
+            "program_input": program_input,
+            "program_progress": program_progress,
+            "program_status": program_status,
+            "program_pause_button": program_pause_button,
         }
 
     def refresh_ports(self):
@@ -219,34 +324,65 @@ class LEDControlApp(QWidget):
         self.port_selector.addItem("Select a port...")
         for port in ports:
             self.port_selector.addItem(port.device)
+            self.port_serial_numbers[port.device] = port.serial_number
 
     def connect_to_port(self, port_name):
         if port_name == "Select a port...":
             return
         try:
-            if self.arduino:
-                self.arduino.close()
-            self.arduino = serial.Serial(port=port_name, baudrate=9600, timeout=1)
-            QMessageBox.information(self, "Connection Successful", f"Connected to {port_name}")
-
-            if self.serial_thread:
-                self.serial_thread.stop()
-            self.serial_thread = SerialReaderThread(self.arduino)
-            self.serial_thread.brightness_received.connect(self.update_slider_from_signal)
-            self.serial_thread.start()
+            self.disconnect_port()
+            self.apply_calibration(self.calibration_profile.tables_for(self.port_serial_numbers.get(port_name)))
+            controller = LightController(port_name, calibration=self.calibration, journal=self.journal)
+            controller.add_listener(self.on_report)
+            controller.add_schedule_listener(self.on_schedule_event)
+            self.event_loop.submit(controller.open()).result()
+            self.controller = controller
+            self.update_dose()
+            QMessageBox.information(
+                self, "Connection Successful", f"Connected to {port_name} ({controller.mode} protocol)"
+            )
 
             # Set brightness to 0 for all LEDs
-            for led_id in self.led_controls:
-                self.update_slider_and_send(0, self.led_controls[led_id]["slider"], None, led_id)
-                self.led_controls[led_id]["input_field"].setText("0")
+            self.set_many({led_id: 0 for led_id in self.led_controls})
 
         except serial.SerialException as e:
             QMessageBox.critical(self, "Connection Failed", str(e))
-            self.arduino = None
+
+    def disconnect_port(self):
+        if self.controller:
+            self.event_loop.submit(self.controller.close()).result()
+            self.controller = None
+            self.dose_timer.stop()
+            self.dose_paused = {}
+            for controls in self.led_controls.values():
+                controls["dose_label"].setText("Dose: not connected")
+
+    def on_report(self, report):
+        # Called on the event loop thread, the signal hands the report to the GUI thread
+        self.brightness_received.emit(report.channel, report.value)
+
+    def on_schedule_event(self, event):
+        # Called on the event loop thread like on_report
+        self.schedule_event_received.emit(event.event, event.number)
 
     def send_brightness(self, value, led_id):
-        if self.arduino and self.arduino.is_open:
-            self.arduino.write(f"SET{led_id}:{value}\n".encode())
+        self.show_irradiance(led_id, value)
+        self.o2_plot.add_brightness(led_id, value)
+        if self.controller:
+            self.controller.set_nowait(led_id, value)
+
+    def set_many(self, values):
+        """Set several LEDs ({LED ID: value}) with a single command so they switch together."""
+        for led_id, value in values.items():
+            controls = self.led_controls[led_id]
+            controls["slider"].blockSignals(True)
+            controls["slider"].setValue(value)
+            controls["slider"].blockSignals(False)
+            controls["input_field"].setText(str(value))
+            self.show_irradiance(led_id, value)
+            self.o2_plot.add_brightness(led_id, value)
+        if self.controller:
+            self.controller.set_many_nowait(values)
 
     def update_slider_and_send(self, value, slider, input_field, led_id):
         slider.setValue(value)
@@ -255,7 +391,6 @@ class LEDControlApp(QWidget):
         self.send_brightness(value, led_id)
 
     def update_slider_from_signal(self, led_id, value):
-        led_id = int(led_id[-1])
         controls = self.led_controls.get(led_id)
         if controls:
             slider = controls["slider"]
@@ -264,6 +399,52 @@ class LEDControlApp(QWidget):
             slider.setValue(value)
             slider.blockSignals(False)
             input_field.setText(str(value))
+            self.show_irradiance(led_id, value, keep_target=True)
+            self.o2_plot.add_brightness(led_id, value)
+
+    def apply_calibration(self, tables):
+        """Use tables ({LED ID: IrradianceTable}); irradiance input is disabled for LEDs without one."""
+        self.calibration = tables
+        self.irradiance_settings = {}
+        for led_id, controls in self.led_controls.items():
+            calibrated = led_id in tables
+            controls["irradiance_input"].setEnabled(calibrated)
+            controls["irradiance_button"].setEnabled(calibrated)
+            if calibrated:
+                self.show_irradiance(led_id, controls["slider"].value())
+            else:
+                controls["irradiance_label"].setText("Irradiance: no calibration")
+
+    def set_irradiance_from_input(self, irradiance_input, led_id):
+        try:
+            target = float(irradiance_input.text().replace(",", "."))
+            if target < 0:
+                raise ValueError
+        except ValueError:
+            QMessageBox.warning(self, "Invalid Input", "Enter a non-negative irradiance in µW/cm².")
+            return
+        setting = self.calibration[led_id].setting(target)
+        self.irradiance_settings[led_id] = setting
+        controls = self.led_controls[led_id]
+        self.update_slider_and_send(setting.pwm, controls["slider"], controls["input_field"], led_id)
+
+    def show_irradiance(self, led_id, value, keep_target=False):
+        """Show the irradiance of PWM value and, after an irradiance target, its quantization error.
+
+        A different value forgets the target unless keep_target (echoes of older commands).
+        """
+        table = self.calibration.get(led_id)
+        if table is None:
+            return
+        text = f"Irradiance: {table.irradiance(value):.0f} µW/cm²"
+        setting = self.irradiance_settings.get(led_id)
+        if setting is not None and setting.pwm == value:
+            target = setting.irradiance - setting.error
+            relative = f", {100 * setting.error / target:+.2f} %" if target else ""
+            text += f" (target {target:.0f}, error {setting.error:+.0f}{relative})"
+        elif not keep_target:
+            self.irradiance_settings.pop(led_id, None)
+        self.led_controls[led_id]["irradiance_label"].setText(text)
 
     def set_brightness_from_input(self, input_field, slider, led_id):
         try:
@@ -299,130 +480,334 @@ class LEDControlApp(QWidget):
     def sync_duration_values(self):
         self.combined_duration_input_2.setText(self.combined_duration_input_1.text())
 
-    # Timer Functions
-
-    def start_timer(self, slider, brightness_input, duration_input, countdown_label, led_id):
+    # Program Functions
+
+    def parse_timer_inputs(self, brightness_input, duration_input):
+        """Return (brightness, duration in minutes) from the timer inputs, raising ValueError if invalid."""
+        # Validate and parse brightness
+        brightness_text = brightness_input.text().strip()
+        if not brightness_text.isdigit() or not (0 <= int(brightness_text) <= 255):
+            raise ValueError("Brightness must be a number between 0 and 255.")
+        brightness = int(brightness_text)
+
+        # Validate and parse duration
+        duration_text = duration_input.text().strip()
+        duration_minutes = float(duration_text)
+        if duration_minutes <= 0:
+            raise ValueError("Duration must be greater than 0.")
+        return brightness, duration_minutes
+
+    def start_program(self, led_id):
+        controls = self.led_controls[led_id]
         try:
-            # Validate and parse brightness
-            brightness_text = brightness_input.text().strip()
-            if not brightness_text.isdigit() or not (0 <= int(brightness_text) <= 255):
-                raise ValueError("Brightness must be a number between 0 and 255.")
-            brightness = int(brightness_text)
-
-            # Validate and parse duration
-            duration_text = duration_input.text().strip()
-            duration_minutes = float(duration_text)
-            if duration_minutes <= 0:
-                raise ValueError("Duration must be greater than 0.")
-
-            # Convert duration to milliseconds
-            self.remaining_times[led_id] = int(duration_minutes * 60 * 1000)
-
-            # Set brightness and initialize timer
-            self.update_slider_and_send(brightness, slider, brightness_input, led_id)
-
-            # Stop any existing timer for this LED
-            if led_id in self.timers and self.timers[led_id]:
-                self.timers[led_id].stop()
-
-            # Start new timer
-            self.timers[led_id] = QTimer()
-            self.timers[led_id].timeout.connect(
-                lambda: self.update_timer_countdown(led_id, slider, countdown_label)
-            )
-            self.timers[led_id].start(1000)  # Update countdown every second
-
-            # Update the countdown label
-            countdown_label.setText(f"Time remaining: {int(duration_minutes):02}:{int((duration_minutes * 60) % 60):02}")
+            segments = parse_program(controls["program_input"].toPlainText())
+            if not segments:
+                raise ValueError("The program is empty.")
+            timeline = compile_program({led_id: segments})
         except ValueError as e:
-            QMessageBox.warning(self, "Invalid Input", str(e))
-
-    def update_timer_countdown(self, led_id, slider, countdown_label):
-        self.remaining_times[led_id] -= 1000
-        if self.remaining_times[led_id] <= 0:
-            self.timers[led_id].stop()
-            self.update_slider_and_send(0, slider, None, led_id)
-            countdown_label.setText("Time remaining: 00:00")
-            QMessageBox.information(self, f"LED {led_id} Timer Finished", f"LED {led_id} Timer has finished. Brightness reset to 0.")
+            QMessageBox.warning(self, "Invalid Program", str(e))
+            return
+        self.run_programs({led_id: timeline})
+
+    def run_programs(self, timelines):
+        """Start a timeline for each LED ({LED ID: Timeline}) at the same instant."""
+        for led_id, timeline in timelines.items():
+            self.programs.start(led_id, timeline)
+            self.led_controls[led_id]["program_pause_button"].setText("Pause")
+        self.update_programs()
+
+    def update_programs(self):
+        """Send the changes that are due, refresh the progress views and re-arm the shared timer."""
+        values, finished = self.programs.due()
+        if values:
+            self.set_many(values)
+
+        for led_id, controls in self.led_controls.items():
+            self.show_program_progress(led_id, controls)
+
+        delay = self.programs.next_wakeup()
+        if delay is not None:
+            self.program_timer.start(math.ceil(min(delay, DISPLAY_INTERVAL) * 1000))
         else:
-            minutes, seconds = divmod(self.remaining_times[led_id] // 1000, 60)
-            countdown_label.setText(f"Time remaining: {minutes:02}:{seconds:02}")
+            self.program_timer.stop()
+
+        # Message boxes last, they run a nested event loop while the timer is already re-armed
+        for result in finished:
+            QMessageBox.information(
+                self, f"LED {result.channel} Program Finished",
+                f"LED {result.channel} program has finished. Brightness reset to 0.\n"
+                f"Requested on-time: {format_duration(result.requested)}\n"
+                f"Actual on-time: {format_duration(result.actual)}"
+            )
 
-    def pause_timer(self, pause_button, led_id):
-        if led_id in self.timers and self.timers[led_id].isActive():
-            self.timers[led_id].stop()
-            pause_button.setText("Resume")
-        elif led_id in self.timers:
-            self.timers[led_id].start(1000)
+    def show_program_progress(self, led_id, controls):
+        if not self.programs.is_running(led_id):
+            controls["program_progress"].setValue(0)
+            controls["program_status"].setText("Not running")
+            return
+        timeline = self.programs.runs[led_id][0]
+        elapsed = self.programs.elapsed(led_id)
+        controls["program_progress"].setValue(int(1000 * elapsed / timeline.duration))
+        index, segment = timeline.segment_at(led_id, elapsed)
+        state = "Paused, " if self.programs.is_paused(led_id) else ""
+        step = ""
+        if segment is not None:
+            step = f"Step {index + 1}/{len(timeline.segments[led_id])}: {segment.label}, "
+        controls["program_status"].setText(
+            f"{state}{step}{format_seconds(timeline.duration - elapsed)} remaining"
+        )
+
+    def pause_program(self, led_id):
+        if not self.programs.is_running(led_id):
+            return
+        pause_button = self.led_controls[led_id]["program_pause_button"]
+        # The LED goes dark while paused, so the reported on-time is the time it was really lit
+        if self.programs.is_paused(led_id):
+            values = self.programs.resume(led_id)
             pause_button.setText("Pause")
-        self.combined_timer_paused = False  # Allow individual timers to resume
+        else:
+            values = self.programs.pause(led_id)
+            pause_button.setText("Resume")
+        self.combined_timer_paused = False  # Allow individual programs to resume
+        if values:
+            self.set_many(values)
+        self.update_programs()
 
-    def reset_timer(self, led_id, slider, countdown_label):
-        if led_id in self.timers:
-            self.timers[led_id].stop()
-        self.update_slider_and_send(0, slider, None, led_id)
-        countdown_label.setText("Time remaining: 00:00")
+    def reset_program(self, led_id):
+        self.programs.cancel(led_id)
+        self.led_controls[led_id]["program_pause_button"].setText("Pause")
+        self.set_many({led_id: 0})
+        self.update_programs()
 
     # ------------------------------ #
 
     # Function for combined timer
 
+    def dose_mode(self):
+        return self.combined_stop_mode.currentIndex() == 1
+
+    def update_stop_mode(self):
+        unit = "dose in J/cm²" if self.dose_mode() else "duration in minutes"
+        for led_id, duration_input in ((1, self.combined_duration_input_1), (2, self.combined_duration_input_2)):
+            duration_input.setPlaceholderText(f"Timer {unit} for LED {led_id}:")
+
     def start_combined_timer(self):
         try:
-            brightness_1 = int(self.combined_brightness_input_1.text())
-            brightness_2 = int(self.combined_brightness_input_2.text())
-            duration_1 = float(self.combined_duration_input_1.text())
-            duration_2 = float(self.combined_duration_input_2.text())
-
-            if self.sync_brightness_checkbox.isChecked():
-                brightness_2 = brightness_1
-
-            if self.sync_time_checkbox.isChecked():
-                duration_2 = duration_1
-
-            self.start_timer(
-                self.led_controls[1]["slider"],
-                self.combined_brightness_input_1,
-                self.combined_duration_input_1,
-                self.led_controls[1]["timer_countdown_label"],
-                1
+            brightness_1, duration_1 = self.parse_timer_inputs(
+                self.combined_brightness_input_1, self.combined_duration_input_1
             )
-            self.start_timer(
-                self.led_controls[2]["slider"],
-                self.combined_brightness_input_2,
-                self.combined_duration_input_2,
-                self.led_controls[2]["timer_countdown_label"],
-                2
+            brightness_2, duration_2 = self.parse_timer_inputs(
+                self.combined_brightness_input_2, self.combined_duration_input_2
             )
         except ValueError:
             QMessageBox.warning(self, "Invalid Input", "Enter valid brightness and duration for both LEDs.")
+            return
+
+        if self.sync_brightness_checkbox.isChecked():
+            brightness_2 = brightness_1
+
+        if self.sync_time_checkbox.isChecked():
+            duration_2 = duration_1
+
+        if self.dose_mode():
+            self.start_dose_exposure({1: (brightness_1, duration_1), 2: (brightness_2, duration_2)})
+            return
+
+        # Both programs start at the same instant, so the first command switches both chambers on together
+        self.run_programs({
+            1: compile_program({1: [Step(brightness_1, duration_1 * 60)]}),
+            2: compile_program({2: [Step(brightness_2, duration_2 * 60)]}),
+        })
 
     def pause_combined_timer(self):
+        if self.controller and any(self.controller.dose.has_target(led_id) for led_id in self.led_controls):
+            self.pause_dose_exposure()
+            return
         self.combined_timer_paused = not self.combined_timer_paused
-        for led_id in self.timers:
+        values = {}
+        for led_id, controls in self.led_controls.items():
+            if not self.programs.is_running(led_id):
+                continue
             if self.combined_timer_paused:
-                if self.timers[led_id].isActive():
-                    self.timers[led_id].stop()
-                    self.led_controls[led_id]["timer_pause_button"].setText("Resume")
+                values.update(self.programs.pause(led_id))
+                controls["program_pause_button"].setText("Resume")
             else:
-                self.timers[led_id].start(1000)
-                self.led_controls[led_id]["timer_pause_button"].setText("Pause")
+                values.update(self.programs.resume(led_id))
+                controls["program_pause_button"].setText("Pause")
+        if values:
+            self.set_many(values)  # Both LEDs go dark and come back in one command
+        self.update_programs()
 
     def reset_combined_timer(self):
-        for led_id in self.timers:
-            self.reset_timer(
-                led_id,
-                self.led_controls[led_id]["slider"],
-                self.led_controls[led_id]["timer_countdown_label"]
+        running = [led_id for led_id in self.led_controls if self.programs.is_running(led_id)]
+        if self.controller:
+            for led_id in self.led_controls:
+                if self.controller.dose.has_target(led_id):
+                    self.controller.dose.cancel_target(led_id)
+                    running.append(led_id)
+        self.dose_paused = {}
+        for led_id in running:
+            self.programs.cancel(led_id)
+            self.led_controls[led_id]["program_pause_button"].setText("Pause")
+        if running:
+            self.set_many({led_id: 0 for led_id in running})
+        self.update_programs()
+
+    # ------------------------------ #
+
+    # Dose
+
+    def start_dose_exposure(self, settings):
+        """Switch LEDs on ({LED ID: (brightness, dose in J/cm²)}) until each has delivered its dose."""
+        if not self.controller:
+            QMessageBox.warning(self, "No Connection", "The dose is integrated from the box's reports, connect first.")
+            return
+        missing = [str(led_id) for led_id in settings if led_id not in self.calibration]
+        if missing:
+            QMessageBox.warning(self, "No Calibration", f"No irradiance calibration for LED {', '.join(missing)}.")
+            return
+        for led_id, (_, dose) in settings.items():
+            self.controller.dose.add_target(led_id, dose * 1e6)
+        self.dose_paused = {}
+        self.set_many({led_id: brightness for led_id, (brightness, _) in settings.items()})
+        self.update_dose()
+
+    def pause_dose_exposure(self):
+        """Switch the LEDs with a dose target off, or back on; the dose stops with the light."""
+        if self.dose_paused:
+            self.set_many(self.dose_paused)
+            self.dose_paused = {}
+        else:
+            self.dose_paused = {led_id: controls["slider"].value() for led_id, controls in self.led_controls.items()
+                                if self.controller.dose.has_target(led_id)}
+            self.set_many({led_id: 0 for led_id in self.dose_paused})
+        self.update_dose()
+
+    def update_dose(self):
+        """Switch off the LEDs that reached their dose, refresh the dose labels and re-arm the timer."""
+        if not self.controller:
+            return
+        dose = self.controller.dose
+        finished = dose.expire()
+        if finished:
+            self.set_many({result.channel: 0 for result in finished})
+            for result in finished:
+                self.dose_paused.pop(result.channel, None)
+
+        for led_id, controls in self.led_controls.items():
+            if led_id not in self.calibration:
+                controls["dose_label"].setText("Dose: no calibration")
+                continue
+            text = f"Dose: {dose.dose(led_id) / 1e6:.3f} J/cm²"
+            if dose.has_target(led_id):
+                state = "paused, " if led_id in self.dose_paused else ""
+                text += f" ({state}{dose.remaining(led_id) / 1e6:.3f} J/cm² to go)"
+            controls["dose_label"].setText(text)
+
+        deadline = dose.next_deadline()
+        delay = DISPLAY_INTERVAL if deadline is None else min(max(deadline - time.monotonic(), 0.0), DISPLAY_INTERVAL)
+        self.dose_timer.start(math.ceil(delay * 1000))
+
+        for result in finished:
+            QMessageBox.information(
+                self, f"LED {result.channel} Dose Reached",
+                f"LED {result.channel} has delivered its dose. Brightness reset to 0.\n"
+                f"Requested dose: {result.target / 1e6:.3f} J/cm²\n"
+                f"Delivered dose: {result.dose / 1e6:.3f} J/cm² in {format_duration(result.seconds)}"
+            )
+
+    # ------------------------------ #
+
+    # Programs run by the box
+
+    def start_box_schedule(self):
+        if not self.controller:
+            QMessageBox.warning(self, "No Connection", "Connect to a port first.")
+            return
+        try:
+            program = {}
+            for led_id, controls in self.led_controls.items():
+                segments = parse_program(controls["program_input"].toPlainText())
+                if segments:
+                    program[led_id] = segments
+            if not program:
+                raise ValueError("Both programs are empty.")
+            table = compile_table(compile_program(program))
+        except ValueError as e:
+            QMessageBox.warning(self, "Invalid Program", str(e))
+            return
+        try:
+            self.event_loop.submit(self.controller.upload_schedule(table)).result()
+            self.event_loop.submit(self.controller.start_schedule()).result()
+        except (RuntimeError, TimeoutError) as e:
+            QMessageBox.critical(self, "Upload Failed", str(e))
+            return
+        self.box_schedule_steps = entry_count(table)
+        self.box_schedule_status.setText(f"Uploaded {len(table)} bytes, {self.box_schedule_steps} steps")
+
+    def stop_box_schedule(self):
+        if self.controller:
+            try:
+                self.event_loop.submit(self.controller.stop_schedule()).result()
+            except (RuntimeError, TimeoutError) as e:
+                QMessageBox.critical(self, "Stop Failed", str(e))
+
+    def update_box_schedule(self, event, number):
+        if event == protocol.EVENT_STEP:
+            self.box_schedule_status.setText(f"Running on the box: step {number + 1}/{self.box_schedule_steps}")
+        elif event == protocol.EVENT_FINISHED:
+            self.box_schedule_status.setText("Finished")
+        elif event == protocol.EVENT_STOPPED:
+            self.box_schedule_status.setText("Stopped")
+        elif event == protocol.EVENT_ERROR:
+            self.box_schedule_status.setText("The box reported an invalid schedule")
+
+    # ------------------------------ #
+
+    # Latency panel
+
+    def update_latency_panel(self):
+        if not self.controller:
+            return
+        for led_id, row in self.controller.latency.summary().items():
+            if not row["count"]:
+                continue
+            self.latency_labels[led_id].setText(
+                f"LED {led_id}: p50 {row['p50']:.1f} ms, p99 {row['p99']:.1f} ms, max {row['max']:.1f} ms "
+                f"({row['count']} confirmed, {row['unanswered']} unanswered)"
             )
 
+    def export_latency(self):
+        if not self.controller:
+            QMessageBox.warning(self, "No Connection", "Connect to a port first.")
+            return
+        path, _ = QFileDialog.getSaveFileName(self, "Export Latency", "latency.csv", "CSV files (*.csv)")
+        if path:
+            self.controller.latency.write_csv(path)
+
+    # ------------------------------ #
+
+    # Live O2
+
+    def follow_export(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Follow DatLab Export", "", "CSV files (*.csv)")
+        if path:
+            self.o2_plot.follow(path)
+            self.o2_label.setText(os.path.basename(path))
+
+    def show_export_status(self, error):
+        if error:
+            self.o2_label.setText(f"Cannot read {os.path.basename(self.o2_plot.tail.path)}: {error}")
+        else:
+            self.o2_label.setText(os.path.basename(self.o2_plot.tail.path))
+
     # ------------------------------ #
 
     def closeEvent(self, event):
-        if self.serial_thread:
-            self.serial_thread.stop()
-        if self.arduino and self.arduino.is_open:
-            self.arduino.close()
+        self.disconnect_port()
+        self.event_loop.stop()
+        if self.journal:
+            self.journal.close()
         super().closeEvent(event)
 
 
@@ -0,0 +1,178 @@
+"""Live plot of O2 concentration, O2 slope and LED brightness for led2.py.
+
+The O2 data come from a DatLab export that is being written (followed with
+:class:`bluelight.analysis.tail.CsvTail`), the brightness from the app
+itself. Each series is reduced to the minimum and maximum of every pixel
+column before drawing, so a 10-hour run costs as much to draw as a short
+one, and repaints happen at most once per display frame however often new
+data arrive.
+"""
+
+import time
+
+import numpy as np
+from PyQt5.QtCore import QPointF, QRectF, Qt, QTimer, pyqtSignal
+from PyQt5.QtGui import QColor, QPainter, QPen, QPolygonF
+from PyQt5.QtWidgets import QApplication, QWidget
+
+from bluelight.analysis.tail import CsvTail, RingBuffer
+
+CHAMBERS = ("1A", "1B")
+CHAMBER_COLORS = {"1A": QColor(31, 119, 180), "1B": QColor(117, 107, 177)}
+LED_COLORS = {1: QColor(33, 113, 181), 2: QColor(230, 85, 13)}
+POLL_INTERVAL = 1000  # ms between reads of the export, DatLab writes a row every 2 s
+HISTORY = 86400  # Samples kept per series
+
+
+def decimate_minmax(x, y, x0, x1, width):
+    """Pixel columns and values (minimum, then maximum of each column) of a series sorted by x."""
+    keep = (x >= x0) & (x <= x1) & ~np.isnan(y)
+    x, y = x[keep], y[keep]
+    if not len(x) or x1 <= x0:
+        return np.zeros(0), np.zeros(0)
+    columns = ((x - x0) / (x1 - x0) * (width - 1)).astype(int)
+    starts = np.flatnonzero(np.concatenate([[True], columns[1:] != columns[:-1]]))
+    low = np.minimum.reduceat(y, starts)
+    high = np.maximum.reduceat(y, starts)
+    return np.repeat(columns[starts], 2).astype(float), np.column_stack([low, high]).ravel()
+
+
+class O2PlotWidget(QWidget):
+    """Three stacked panes on a common wall-clock axis: concentration, slope and brightness."""
+
+    PANES = ("O2 concentration [µM]", "O2 slope neg. [pmol/(s*mL)]", "LED brightness [PWM]")
+    poll_status = pyqtSignal(str)  # Why reading the export failed (polling goes on), "" once it works again
+
+    def __init__(self, led_ids=(1, 2), parent=None):
+        super().__init__(parent)
+        self.setMinimumSize(480, 360)
+        self.tail = None
+        self.generation = 0
+        self.start = None  # Wall time of minute 0 of the export
+        self.brightness = {led_id: (RingBuffer(HISTORY, np.float64), RingBuffer(HISTORY)) for led_id in led_ids}
+        self.dirty = False
+        self.failed = False
+
+        self.poll_timer = QTimer(self)
+        self.poll_timer.timeout.connect(self.poll)
+
+        # Repaint at most once per frame; bursts of slider changes are merged
+        screen = QApplication.primaryScreen()
+        refresh = screen.refreshRate() if screen else 60
+        self.frame_timer = QTimer(self)
+        self.frame_timer.timeout.connect(self.flush)
+        self.frame_timer.start(max(int(1000 / (refresh or 60)), 1))
+
+    def follow(self, path):
+        columns = [f"{chamber}: O2 {quantity}" for chamber in CHAMBERS
+                   for quantity in ("concentration [M]", "slope neg. [pmol/(s*mL)]")]
+        self.tail = CsvTail(path, columns=columns, capacity=HISTORY)
+        self.generation = 0
+        self.start = None
+        self.failed = False
+        self.poll()
+        self.poll_timer.start(POLL_INTERVAL)
+
+    def poll(self):
+        # An exception escaping a slot would abort the app together with a running exposure
+        try:
+            rows = self.tail.poll() if self.tail else 0
+        except (OSError, ValueError, KeyError) as e:
+            self.failed = True
+            self.poll_status.emit(f"{type(e).__name__}: {e}")
+            return
+        if self.failed:
+            self.failed = False
+            self.poll_status.emit("")
+        if not rows:
+            return
+        if self.tail.generation != self.generation:  # Re-exported, minute 0 may have moved
+            self.generation = self.tail.generation
+            self.start = None
+        # The newest row was written at the latest now, the earliest estimate is the closest
+        start = time.time() - self.tail.time.last() * 60
+        self.start = start if self.start is None else min(self.start, start)
+        self.dirty = True
+
+    def add_brightness(self, led_id, value):
+        times, values = self.brightness[led_id]
+        if len(values) and values.last() == value:
+            return
+        times.extend([time.time()])
+        values.extend([value])
+        self.dirty = True
+
+    def flush(self):
+        if self.dirty:
+            self.dirty = False
+            self.update()
+
+    def series(self, now):
+        """[(pane, color, x, y)] of everything there is to draw, x in wall-clock seconds."""
+        result = []
+        if self.tail and self.start is not None and len(self.tail.time):
+            x = self.start + self.tail.time.values() * 60
+            for chamber in CHAMBERS:
+                for pane, quantity in ((0, "concentration [M]"), (1, "slope neg. [pmol/(s*mL)]")):
+                    name = f"{chamber}: O2 {quantity}"
+                    if name in self.tail.buffers:
+                        result.append((pane, CHAMBER_COLORS[chamber], x, self.tail[name].values()))
+        for led_id, (times, values) in self.brightness.items():
+            if len(times):
+                t, v = times.values(), values.values().astype(float)
+                # Steps: hold each value until the next change, the last one until now
+                x = np.append(np.repeat(t, 2)[1:], now)
+                y = np.repeat(v, 2)
+                result.append((2, LED_COLORS[led_id], x, y))
+        return result
+
+    def paintEvent(self, event):
+        now = time.time()
+        series = self.series(now)
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), Qt.white)
+        painter.setRenderHint(QPainter.Antialiasing, False)  # Thousands of vertical segments, no need
+        if not series:
+            painter.drawText(self.rect(), Qt.AlignCenter, "Follow a DatLab export or set a brightness")
+            return
+        x0 = min(x[0] for _, _, x, _ in series)
+        x1 = max(now, max(x[-1] for _, _, x, _ in series))
+        margin_left, margin_right, margin_bottom = 60, 10, 20
+        pane_height = (self.height() - margin_bottom) / len(self.PANES)
+        width = max(self.width() - margin_left - margin_right, 2)
+
+        for pane, title in enumerate(self.PANES):
+            top = pane * pane_height
+            box = QRectF(margin_left, top + 16, width, pane_height - 22)
+            painter.setPen(QColor(200, 200, 200))
+            painter.drawRect(box)
+            painter.setPen(Qt.black)
+            painter.drawText(QRectF(margin_left, top, width, 16), Qt.AlignLeft | Qt.AlignVCenter, title)
+
+            lines = []
+            for series_pane, color, x, y in series:
+                if series_pane != pane:
+                    continue
+                px, py = decimate_minmax(x, y, x0, x1, int(width))
+                if len(px):
+                    lines.append((color, px, py))
+            if not lines:
+                continue
+            low = min(py.min() for _, _, py in lines)
+            high = max(py.max() for _, _, py in lines)
+            if pane == 2:
+                low, high = 0.0, 255.0
+            elif high == low:
+                low, high = low - 1, high + 1
+            painter.drawText(QRectF(0, box.top(), margin_left - 4, 14), Qt.AlignRight, f"{high:.4g}")
+            painter.drawText(QRectF(0, box.bottom() - 14, margin_left - 4, 14), Qt.AlignRight, f"{low:.4g}")
+            scale = box.height() / (high - low)
+            for color, px, py in lines:
+                painter.setPen(QPen(color, 1))
+                points = zip(box.left() + px, box.bottom() - (py - low) * scale)
+                painter.drawPolyline(QPolygonF([QPointF(a, b) for a, b in points]))
+
+        painter.setPen(Qt.black)
+        bottom = QRectF(margin_left, self.height() - margin_bottom, width, margin_bottom)
+        painter.drawText(bottom, Qt.AlignLeft | Qt.AlignVCenter, time.strftime("%H:%M:%S", time.localtime(x0)))
+        painter.drawText(bottom, Qt.AlignRight | Qt.AlignVCenter, time.strftime("%H:%M:%S", time.localtime(x1)))
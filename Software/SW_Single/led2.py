@@ -1,38 +1,21 @@
+import os
 import sys
 from PyQt5.QtWidgets import (
     QApplication, QVBoxLayout, QHBoxLayout, QSlider, QPushButton, QLineEdit, QLabel, QWidget,
     QComboBox, QMessageBox, QGroupBox
 )
-from PyQt5.QtCore import Qt, QThread, pyqtSignal, QTimer
+from PyQt5.QtCore import Qt, pyqtSignal, QTimer
 import serial
 from serial.tools import list_ports
 
-
-class SerialReaderThread(QThread):
-    brightness_received = pyqtSignal(int)
-
-    def __init__(self, serial_port):
-        super().__init__()
-        self.serial_port = serial_port
-        self.running = True
-
-    def run(self):
-        while self.running:
-            if self.serial_port and self.serial_port.is_open:
-                try:
-                    line = self.serial_port.readline().decode().strip()
-                    if line.startswith("BRIGHTNESS:"):
-                        value = int(line.split(":")[1])
-                        self.brightness_received.emit(value)
-                except (ValueError, IndexError, serial.SerialException):
-                    continue
-
-    def stop(self):
-        self.running = False
-        self.wait()
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from bluelight import protocol  # noqa: E402
+from bluelight.link import SerialReader  # noqa: E402
 
 
 class LEDControlApp(QWidget):
+    brightness_received = pyqtSignal(int)
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("LED Brightness Control")
@@ -126,6 +109,7 @@ class LEDControlApp(QWidget):
         # Serial connection
         self.arduino = None
         self.serial_thread = None
+        self.brightness_received.connect(self.update_slider_and_text_field)
 
         # Timer setup
         self.timer = QTimer(self)
@@ -153,19 +137,23 @@ class LEDControlApp(QWidget):
             # Start the serial reader thread
             if self.serial_thread:
                 self.serial_thread.stop()
-            self.serial_thread = SerialReaderThread(self.arduino)
-            self.serial_thread.brightness_received.connect(self.update_slider_and_text_field)
+            self.serial_thread = SerialReader(self.arduino, self.on_report)
             self.serial_thread.start()
         except serial.SerialException as e:
             QMessageBox.critical(self, "Connection Failed", str(e))
             self.arduino = None
 
+    def on_report(self, report):
+        # Called on the reader thread, the signal hands the value to the GUI thread
+        if isinstance(report, protocol.Report) and report.channel is None:
+            self.brightness_received.emit(report.value)
+
     def send_brightness(self, value=None):
         """Send brightness value to Arduino."""
         if self.arduino and self.arduino.is_open:
             if value is None:
                 value = self.slider.value()
-            self.arduino.write(f"SET:{value}\n".encode())
+            self.arduino.write(protocol.encode_set(None, value))
             print("Brightness: "+str(value))
 
     def set_brightness_from_input(self):
@@ -0,0 +1,15 @@
+"""Host-side library for the BlueLight LED box.
+
+Importing the package does not pull in Qt; the GUIs in ``SW_Dual`` and
+``SW_Single`` are clients of it.
+"""
+
+from .controller import EventLoopThread, LightController
+from .dose import DoseIntegrator, DoseResult
+from .exposure import ExposureResult, ExposureScheduler
+from .manager import DeviceManager, find_boxes
+
+__all__ = [
+    "DeviceManager", "DoseIntegrator", "DoseResult", "EventLoopThread", "ExposureResult", "ExposureScheduler",
+    "LightController", "find_boxes",
+]
@@ -0,0 +1,5 @@
+"""Analysis of Oroboros O2k exports together with what the LED box did.
+
+The modules only need NumPy and pandas; the scripts in ``Data`` use them
+after adding ``Software`` to ``sys.path``.
+"""
@@ -0,0 +1,174 @@
+"""Put the brightness history of the LEDs onto the ``Time [min]`` axis of an Oroboros export.
+
+The history is a step function, (times in s, PWM values), taken either from
+a :mod:`bluelight.journal` or, for runs recorded without one, from the
+manual ``light on``/``light off`` events and the PWM value used::
+
+    records, devices = read_journal("run.bljournal")
+    history = {"1A": journal_history(records, channel=1), "1B": journal_history(records, channel=2)}
+    aligned, offset = align(df, history, calibration=load_table())
+
+    history = {"1B": event_history(df["Time [min]"], df["Event Name"], 15)}
+
+:func:`align` adds ``<chamber>: LED brightness [PWM]`` and, with a
+calibration, ``<chamber>: Irradiance [uW/cm2]`` and ``<chamber>: Light dose
+[uJ/cm2]`` for every sample. Brightness and dose are exact for the step
+function, whatever the sampling interval; the dose is the integral up to
+the sample time, not a sum of samples.
+
+A journal runs on the PC clock, the export counts minutes from the start
+of the recording. :func:`estimate_offset` finds the start of the recording
+on the PC clock by matching the manual events to the switch-on and
+switch-off edges in the journal; pass ``offset=`` when the export has no
+events.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+from ..journal import SOURCE_ACK, SOURCE_COMMAND, SOURCE_LOCAL
+
+TIME_COLUMN = "Time [min]"
+EVENT_COLUMN = "Event Name"
+LIGHT_ON = "light on"
+LIGHT_OFF = "light off"
+
+Offset = namedtuple("Offset", ["seconds", "residuals"])
+Offset.__doc__ = """Recording start on the history clock (s) and, per matched event, event minus edge in s."""
+
+
+def journal_history(records, device=0, channel=1, clock="wall"):
+    """(times, values) of one LED from journal records.
+
+    What the box confirmed or changed itself is used; commands only for a
+    box that never acknowledged any (e.g. lost link). Repeated values are dropped.
+    """
+    records = records[(records["device"] == device) & (records["channel"] == channel)]
+    confirmed = records[np.isin(records["source"], (SOURCE_ACK, SOURCE_LOCAL))]
+    if len(confirmed) == 0:
+        confirmed = records[records["source"] == SOURCE_COMMAND]
+    order = np.argsort(confirmed[clock], kind="stable")
+    times = confirmed[clock][order].astype(float)
+    values = confirmed["value"][order].astype(float)
+    return _changes(times, values)
+
+
+def _changes(times, values):
+    keep = np.ones(len(values), dtype=bool)
+    keep[1:] = values[1:] != values[:-1]
+    return times[keep], values[keep]
+
+
+def light_periods(minutes, events):
+    """(on, off) arrays of minutes; each ``light on`` pairs with the next ``light off`` (NaN while still on)."""
+    minutes = np.asarray(minutes, dtype=float)
+    events = np.asarray(events, dtype=object)
+    on = minutes[events == LIGHT_ON]
+    off = minutes[events == LIGHT_OFF]
+    index = np.searchsorted(off, on, side="left")
+    paired = np.append(off, np.nan)[index]
+    if len(on) > 1:
+        paired[:-1] = np.where(paired[:-1] < on[1:], paired[:-1], np.nan)  # Next "light on" came first
+    return on, paired
+
+
+def event_history(minutes, events, value):
+    """(times, values) of an LED switched to value at every ``light on`` and off at ``light off``; times in s of the export."""
+    on, off = light_periods(minutes, events)
+    off = off[~np.isnan(off)]
+    times = np.concatenate([on, off]) * 60
+    values = np.concatenate([np.full(len(on), float(value)), np.zeros(len(off))])
+    order = np.argsort(times, kind="stable")
+    return _changes(times[order], values[order])
+
+
+def edges(times, values):
+    """(switch-on times, switch-off times) of a history."""
+    lit = np.asarray(values) > 0
+    before = np.concatenate([[False], lit[:-1]])
+    return np.asarray(times)[lit & ~before], np.asarray(times)[~lit & before]
+
+
+def estimate_offset(times, values, minutes, events):
+    """Offset of the recording start on the history clock from the manual events.
+
+    Every pairing of the first event with an edge of the same kind is tried;
+    the one that puts all events closest to edges wins and the offset is the
+    mean difference of those pairs, so reaction time at the keyboard averages out.
+    """
+    on_edges, off_edges = edges(times, values)
+    event_minutes = np.asarray(minutes, dtype=float)
+    events = np.asarray(events, dtype=object)
+    groups = [(event_minutes[events == LIGHT_ON] * 60, on_edges), (event_minutes[events == LIGHT_OFF] * 60, off_edges)]
+    groups = [(seconds, kind_edges) for seconds, kind_edges in groups if len(seconds) and len(kind_edges)]
+    if not groups:
+        raise ValueError("No light on/off events matching the history, pass offset=")
+    candidates = np.concatenate([kind_edges - seconds[0] for seconds, kind_edges in groups])
+
+    def nearest(seconds, kind_edges, offsets):
+        predicted = offsets[:, None] + seconds[None, :]
+        index = np.clip(np.searchsorted(kind_edges, predicted), 1, max(len(kind_edges) - 1, 1))
+        lower, upper = kind_edges[index - 1], kind_edges[np.minimum(index, len(kind_edges) - 1)]
+        return np.where(np.abs(predicted - lower) <= np.abs(upper - predicted), lower, upper)
+
+    cost = sum(np.abs(nearest(seconds, kind_edges, candidates) - candidates[:, None] - seconds).sum(axis=1)
+               for seconds, kind_edges in groups)
+    best = candidates[np.argmin(cost)]
+    differences = np.concatenate([nearest(seconds, kind_edges, np.array([best]))[0] - seconds
+                                  for seconds, kind_edges in groups])
+    seconds = float(np.mean(differences))
+    return Offset(seconds, seconds - differences)
+
+
+def brightness_at(times, values, sample_times):
+    """Brightness of the history at each sample time (0 before the first change)."""
+    index = np.searchsorted(times, sample_times, side="right") - 1
+    return np.where(index >= 0, np.asarray(values, dtype=float)[np.maximum(index, 0)], 0.0)
+
+
+def dose_at(times, irradiance, sample_times):
+    """Integral of a step function of irradiance (µW/cm²) from its first change to each sample time, in µJ/cm²."""
+    times = np.asarray(times, dtype=float)
+    irradiance = np.asarray(irradiance, dtype=float)
+    if len(times) == 0:
+        return np.zeros(np.shape(sample_times))
+    cumulative = np.concatenate([[0.0], np.cumsum(irradiance[:-1] * np.diff(times))])
+    index = np.searchsorted(times, sample_times, side="right") - 1
+    clipped = np.maximum(index, 0)
+    dose = cumulative[clipped] + irradiance[clipped] * (sample_times - times[clipped])
+    return np.where(index >= 0, dose, 0.0)
+
+
+def align(frame, histories, calibration=None, offset=None):
+    """Copy of an export with brightness (and irradiance and dose) columns per chamber.
+
+    histories maps a chamber prefix ("1A") to (times, values). Journal
+    histories need the recording start on their clock: offset, or None to
+    estimate it from the events of the export (the first history with
+    edges is used). Event histories are already on the export clock, pass offset=0.
+    calibration is an IrradianceTable or {chamber: IrradianceTable}.
+    Returns (frame, Offset).
+    """
+    minutes = frame[TIME_COLUMN].to_numpy(dtype=float)
+    if offset is None:
+        events = frame[EVENT_COLUMN].to_numpy(dtype=object)
+        for times, values in histories.values():
+            on_edges, off_edges = edges(times, values)
+            if len(on_edges) or len(off_edges):
+                offset = estimate_offset(times, values, minutes, events)
+                break
+        else:
+            raise ValueError("No light switched in the histories, pass offset=")
+    elif not isinstance(offset, Offset):
+        offset = Offset(float(offset), np.zeros(0))
+    sample_times = offset.seconds + minutes * 60
+    frame = frame.copy()
+    for chamber, (times, values) in histories.items():
+        frame[f"{chamber}: LED brightness [PWM]"] = brightness_at(times, values, sample_times).astype(np.float32)
+        table = calibration.get(chamber) if isinstance(calibration, dict) else calibration
+        if table is not None:
+            irradiance = table.irradiance(np.asarray(values, dtype=int))
+            frame[f"{chamber}: Irradiance [uW/cm2]"] = brightness_at(times, irradiance, sample_times).astype(np.float32)
+            frame[f"{chamber}: Light dose [uJ/cm2]"] = dose_at(times, irradiance, sample_times)
+    return frame, offset
@@ -0,0 +1,182 @@
+"""Dose-response of the HPLC bilirubin (BR) and lumirubin (LR) results.
+
+``Data/CSV/difL/HPLCdataBRLR.csv`` has one sample per PWM value
+(``intenzita``), each lit for an hour. :func:`outcome_table` adds the
+irradiance of that PWM value from the calibration and the dose it
+delivered. Both outcomes are fitted with log-linear curves of the dose
+``D`` in J/cm²:
+
+* BR loss, ``decay``: ``BR = y0 * exp(-rate*D)``, with ``D50 = ln 2 / rate``
+  the dose that halves BR,
+* LR formation, ``growth``: ``LR = y0 * exp(rate*D)``, with
+  ``D50 = ln 2 / rate`` the dose that doubles LR.
+
+The fit is the closed-form regression of ln(y) on D, written for arrays of
+any leading shape, so :func:`bootstrap` fits all resamples (an array of
+resamples × samples) in one NumPy expression. With a single sample per
+level the default resamples the residuals (fixed doses); ``method="cases"``
+resamples whole samples::
+
+    table = outcome_table()
+    fits = dose_response(table, resamples=10000)   # estimate and 95% interval of every parameter
+
+``python -m bluelight.analysis.doseresponse`` prints both tables and
+``--plot`` draws the curves with their confidence bands.
+"""
+
+import argparse
+import os
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from ..calibration import load_calibration
+
+HPLC_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "Data", "CSV", "difL",
+                         "HPLCdataBRLR.csv")
+PWM_COLUMN = "intenzita"
+IRRADIANCE_COLUMN = "Irradiance [uW/cm2]"
+DOSE_COLUMN = "Light dose [J/cm2]"
+EXPOSURE = 3600  # Seconds each sample was lit
+RESAMPLES = 10000
+LEVEL = 0.95
+
+# Outcome column -> (model, sign of the rate in the exponent)
+OUTCOMES = {"BR [umol/l]": ("decay", -1), "LR [umol/l]": ("growth", 1)}
+
+Bootstrap = namedtuple("Bootstrap", ["y0", "rate", "samples"])
+Bootstrap.__doc__ = """Fitted y0 and rate, and a (resamples, 2) array of them refitted to each resample."""
+
+
+def read_hplc(path=HPLC_PATH):
+    """The HPLC table (';'-separated, decimal commas) without its empty trailing columns."""
+    return pd.read_csv(path, sep=";", decimal=",").dropna(axis=1, how="all")
+
+
+def outcome_table(path=HPLC_PATH, calibration=None, exposure=EXPOSURE):
+    """HPLC results with the irradiance (µW/cm²) and dose (J/cm²) of each sample.
+
+    calibration is an :class:`~bluelight.irradiance.IrradianceTable`, by default
+    the best model of ``Data/CSV/PWMtoIntensity.csv``.
+    """
+    table = read_hplc(path)
+    calibration = calibration or load_calibration().table
+    table[IRRADIANCE_COLUMN] = calibration.irradiance(table[PWM_COLUMN].to_numpy(dtype=int))
+    table[DOSE_COLUMN] = table[IRRADIANCE_COLUMN] * exposure / 1e6
+    return table
+
+
+def fit_loglinear(dose, values):
+    """(y0, slope) of ln(values) = ln(y0) + slope*dose, along the last axis; leading axes are separate fits."""
+    x = np.asarray(dose, dtype=float)
+    y = np.log(np.asarray(values, dtype=float))
+    x_centered = x - x.mean(axis=-1, keepdims=True)
+    y_mean = y.mean(axis=-1)
+    with np.errstate(invalid="ignore", divide="ignore", over="ignore"):
+        slope = (x_centered * y).sum(axis=-1) / (x_centered ** 2).sum(axis=-1)  # NaN if all doses are equal
+        return np.exp(y_mean - slope * x.mean(axis=-1)), slope
+
+
+def bootstrap(dose, values, resamples=RESAMPLES, method="residuals", seed=None):
+    """Log-linear fit and its refits to resamples of the samples, all in one batch."""
+    x = np.asarray(dose, dtype=float)
+    y = np.asarray(values, dtype=float)
+    if np.any(y <= 0):
+        raise ValueError("Log-linear fits need positive values")
+    if len(np.unique(x)) < 3:
+        raise ValueError("Log-linear fits with error estimates need at least 3 distinct doses")
+    y0, slope = fit_loglinear(x, y)
+    rng = np.random.default_rng(seed)
+    n = len(x)
+    indices = rng.integers(0, n, size=(resamples, n))
+    if method == "cases":
+        y0_samples, slope_samples = fit_loglinear(x[indices], y[indices])
+    elif method == "residuals":
+        fitted = np.log(y0) + slope * x
+        # Residuals shrink by the fitted parameters, rescale them to the error variance
+        residuals = (np.log(y) - fitted) * np.sqrt(n / (n - 2))
+        y0_samples, slope_samples = fit_loglinear(x, np.exp(fitted + residuals[indices]))
+    else:
+        raise ValueError(f"Unknown bootstrap method {method!r}")
+    return Bootstrap(y0, slope, np.column_stack([y0_samples, slope_samples]))
+
+
+def _interval(samples, level):
+    tail = (1 - level) / 2 * 100
+    return np.nanpercentile(samples, [tail, 100 - tail], axis=0)
+
+
+def dose_response(table=None, resamples=RESAMPLES, method="residuals", level=LEVEL, seed=0):
+    """Tidy DataFrame: estimate and confidence interval of y0, rate and D50 of each outcome."""
+    table = outcome_table() if table is None else table
+    rows = []
+    for outcome, (model, sign) in OUTCOMES.items():
+        result = bootstrap(table[DOSE_COLUMN], table[outcome], resamples, method, seed)
+        rates = sign * result.samples[:, 1]
+        estimates = {
+            "y0": (result.y0, result.samples[:, 0], "umol/l"),
+            "rate": (sign * result.rate, rates, "cm2/J"),
+            "D50": (np.log(2) / (sign * result.rate), np.log(2) / np.where(rates > 0, rates, np.nan), "J/cm2"),
+        }
+        for parameter, (estimate, samples, unit) in estimates.items():
+            low, high = _interval(samples, level)
+            rows.append({"outcome": outcome, "model": model, "parameter": parameter, "estimate": float(estimate),
+                         "low": float(low), "high": float(high), "unit": unit, "level": level,
+                         "resamples": int(np.isfinite(samples).sum())})
+    return pd.DataFrame(rows)
+
+
+def curve_band(dose, result, level=LEVEL):
+    """Fitted curve at the doses and its pointwise confidence band, from a Bootstrap."""
+    dose = np.asarray(dose, dtype=float)
+    with np.errstate(invalid="ignore", over="ignore"):
+        curves = result.samples[:, :1] * np.exp(result.samples[:, 1:] * dose)  # (resamples, doses)
+    low, high = _interval(curves, level)
+    return result.y0 * np.exp(result.rate * dose), low, high
+
+
+def plot(table, path, resamples=RESAMPLES, method="residuals", level=LEVEL, seed=0):
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    grid = np.linspace(0, table[DOSE_COLUMN].max() * 1.05, 200)
+    fig, ax = plt.subplots(figsize=(10, 6))
+    for (outcome, _), color, label in zip(OUTCOMES.items(), ("royalblue", "salmon"), ("Bilirubin", "Lumirubin")):
+        result = bootstrap(table[DOSE_COLUMN], table[outcome], resamples, method, seed)
+        curve, low, high = curve_band(grid, result, level)
+        ax.scatter(table[DOSE_COLUMN], table[outcome], color=color, label=label)
+        ax.plot(grid, curve, color=color)
+        ax.fill_between(grid, low, high, color=color, alpha=0.2, linewidth=0)
+    ax.set_yscale("log")
+    ax.set_xlabel("Dávka světla [J/cm²]")
+    ax.set_ylabel("Koncentrace [µmol/l]")
+    ax.legend()
+    fig.tight_layout()
+    fig.savefig(path, dpi=300)
+    plt.close(fig)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dose-response fits of the HPLC BR/LR results.")
+    parser.add_argument("path", nargs="?", default=HPLC_PATH)
+    parser.add_argument("--exposure", type=float, default=EXPOSURE / 60, help="minutes each sample was lit")
+    parser.add_argument("--resamples", type=int, default=RESAMPLES)
+    parser.add_argument("--method", choices=["residuals", "cases"], default="residuals")
+    parser.add_argument("--level", type=float, default=LEVEL)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--plot", help="save the curves with their confidence bands to this image")
+    args = parser.parse_args()
+
+    table = outcome_table(args.path, exposure=args.exposure * 60)
+    print(table.to_string())
+    print()
+    print(dose_response(table, args.resamples, args.method, args.level, args.seed).to_string())
+    if args.plot:
+        plot(table, args.plot, args.resamples, args.method, args.level, args.seed)
+
+
+if __name__ == "__main__":
+    main()
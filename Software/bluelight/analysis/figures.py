@@ -0,0 +1,261 @@
+"""Figures of Oroboros exports described in YAML and rendered without a display.
+
+``Data/figures.yaml`` lists the figures; each one names its input exports,
+the series to draw and the axes::
+
+    defaults:
+      size: [10, 6]
+      dpi: 300
+    figures:
+      - output: Figures/graf_brxbsa.png
+        inputs: {BR490: CSV/difC/BR490.csv, BR245: CSV/difC/BR245.csv, BR123: CSV/difC/BR123.csv}
+        align: shift                  # time 0 at "light on"; crop = drop what is before it
+        series:
+          - {input: BR490, column: "1B: O2 concentration [M]", color: [Purples, 0.8], label: "c. O$_2$ BR 490"}
+          - {average: [BR490, BR245, BR123], column: "1A: O2 slope neg. [pmol/(s*mL)]", axis: right,
+             min_count: 3, color: [Reds, 0.8], label: "prům. spotřeba O$_2$ BSA", annotate: true}
+        events: {light on: {color: green, label: ZAPNUTÍ}, light off: {color: red, label: VYPNUTÍ}}
+        xlim: [-5, 70]
+        ylim: {right: [1, 20]}
+
+Paths are relative to the YAML file; a color is a name or ``[colormap,
+level]``. ``python -m bluelight.analysis.figures`` renders every figure on
+the Agg backend, in parallel processes, and skips a figure when its spec
+and input files are the same as at its last build (kept in
+``<yaml>.state.json``). Exports are read with
+:func:`~bluelight.analysis.oroboros.read_export`, so its cache applies.
+"""
+
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import logging
+import os
+import time
+
+RENDERER_VERSION = 1  # Bump when the drawing changes so every figure is rebuilt
+DEFAULT_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "Data", "figures.yaml")
+STATE_SUFFIX = ".state.json"
+
+
+def load_config(path):
+    """List of figure specs with the defaults merged in and paths made absolute."""
+    import yaml
+
+    with open(path, encoding="utf-8") as file:
+        config = yaml.safe_load(file) or {}
+    base = os.path.dirname(os.path.abspath(path))
+    figures = []
+    for figure in config.get("figures", []):
+        spec = dict(config.get("defaults", {}), **figure)
+        spec["output"] = os.path.join(base, spec["output"])
+        spec["inputs"] = {name: os.path.join(base, csv_path) for name, csv_path in spec.get("inputs", {}).items()}
+        figures.append(spec)
+    return figures
+
+
+def fingerprint(spec, base):
+    """Hash of the spec (paths relative to base) and the content of its inputs; a checkout or touch does not rebuild."""
+    relative = dict(spec, output=os.path.relpath(spec["output"], base),
+                    inputs={name: os.path.relpath(path, base) for name, path in spec["inputs"].items()})
+    digest = hashlib.sha256(json.dumps([RENDERER_VERSION, relative], sort_keys=True, default=str).encode())
+    for csv_path in sorted(spec["inputs"].values()):
+        with open(csv_path, "rb") as file:
+            digest.update(hashlib.sha256(file.read()).digest())
+    return digest.hexdigest()
+
+
+def _color(value, plt):
+    if isinstance(value, (list, tuple)):
+        return plt.get_cmap(value[0])(value[1])
+    return value
+
+
+def _align(frame, mode):
+    from .align import LIGHT_ON, TIME_COLUMN
+
+    if mode not in ("shift", "crop"):
+        return frame
+    on = frame.index[frame["Event Name"] == LIGHT_ON]
+    if not len(on):
+        return frame
+    frame = frame.copy()
+    if mode == "shift":
+        frame[TIME_COLUMN] = frame[TIME_COLUMN] - frame.loc[on[0], TIME_COLUMN]
+        return frame
+    return frame.loc[on[0]:].reset_index(drop=True)
+
+
+def _annotate(ax, x, y, label, color, offset=0.3):
+    """Label in the middle of a curve, kept inside the y range (as graph4.py places them)."""
+    middle = len(x) // 2
+    y_min, y_max = ax.get_ylim()
+    position = (x[middle], min(max(y[middle] + offset, y_min + 0.1), y_max - 0.1))
+    ax.annotate(label, xy=position, xytext=position, color=color, fontsize=10, ha="center", va="bottom",
+                bbox=dict(facecolor="white", alpha=0.7, edgecolor="none"))
+
+
+def _per_axis(spec, key, axes):
+    """(axis, value) of a {left/right: value} setting; the right side is skipped when no series uses it."""
+    pairs = []
+    for side, value in (spec.get(key) or {}).items():
+        if side not in ("left", "right"):
+            raise ValueError(f"{spec['output']}: {key} has side {side!r}, expected left or right")
+        if side in axes:
+            pairs.append((axes[side], value))
+    return pairs
+
+
+def render(spec):
+    """Draw one figure spec into its output file."""
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import numpy as np
+
+    from .align import TIME_COLUMN, light_periods
+    from .oroboros import read_export
+    from .replicates import average_replicates
+
+    logging.getLogger("matplotlib.font_manager").setLevel(logging.ERROR)  # Arial is missing on most servers
+    if "font" in spec:
+        matplotlib.rcParams["font.family"] = spec["font"]
+    if "font_size" in spec:
+        matplotlib.rcParams["font.size"] = spec["font_size"]
+
+    frames = {name: _align(read_export(csv_path), spec.get("align")) for name, csv_path in spec["inputs"].items()}
+    fig, left = plt.subplots(figsize=spec.get("size", (10, 6)))
+    axes = {"left": left}
+    if any(series.get("axis") == "right" for series in spec.get("series", [])):
+        axes["right"] = left.twinx()
+
+    annotations = []
+    for series in spec.get("series", []):
+        ax = axes[series.get("axis", "left")]
+        if "average" in series:
+            chosen = [frames[name] for name in series["average"]]
+            average = average_replicates([frame[TIME_COLUMN] for frame in chosen],
+                                         [frame[series["column"]] for frame in chosen],
+                                         min_count=series.get("min_count", 1))
+            x, y = average.time, average.mean
+            if series.get("sd"):
+                ax.fill_between(x, y - average.sd, y + average.sd, color=_color(series.get("color"), plt), alpha=0.2,
+                                linewidth=0)
+        else:
+            frame = frames[series["input"]]
+            x, y = frame[TIME_COLUMN].to_numpy(), frame[series["column"]].to_numpy()
+        color = _color(series.get("color"), plt)
+        ax.plot(x, y, color=color, label=series.get("label"))
+        if series.get("annotate"):
+            keep = ~np.isnan(y)
+            annotations.append((ax, x[keep], y[keep], series.get("label"), color))
+
+    for ax, limits in _per_axis(spec, "ylim", axes):
+        ax.set_ylim(*limits)
+    for ax, x, y, label, color in annotations:
+        _annotate(ax, x, y, label, color)
+
+    event_handles = []
+    for event, style in (spec.get("events") or {}).items():
+        style = style if isinstance(style, dict) else {"color": style}
+        times = set()
+        for frame in frames.values():
+            on, off = light_periods(frame[TIME_COLUMN], frame["Event Name"])
+            times.update(float(t) for t in (on if event == "light on" else off) if not np.isnan(t))
+        for t in sorted(times):
+            left.axvline(x=t, color=style["color"], linestyle="--")
+        if style.get("label"):
+            event_handles.append((plt.Line2D([0], [0], color=style["color"], linestyle="--"), style["label"]))
+
+    left.set_xlabel(spec.get("xlabel", TIME_COLUMN))
+    colors = dict(_per_axis(spec, "ycolor", axes))
+    for ax, label in _per_axis(spec, "ylabel", axes):
+        ax.set_ylabel(label, color=colors.get(ax))
+    for ax, color in colors.items():
+        ax.tick_params(axis="y", labelcolor=color)
+    if spec.get("title"):
+        left.set_title(spec["title"])
+    if spec.get("xlim"):
+        left.set_xlim(*spec["xlim"])
+
+    legend = spec.get("legend", {"loc": "best"})
+    if legend:
+        handles, labels = [], []
+        for ax in axes.values():
+            for handle, label in zip(*ax.get_legend_handles_labels()):
+                if label not in labels:
+                    handles.append(handle)
+                    labels.append(label)
+        for handle, label in event_handles:
+            handles.append(handle)
+            labels.append(label)
+        if legend.get("below"):
+            left.legend(handles, labels, loc="upper center", bbox_to_anchor=(0.5, -0.15), ncol=legend["below"])
+        else:
+            left.legend(handles, labels, loc=legend.get("loc", "best"))
+
+    fig.tight_layout()
+    os.makedirs(os.path.dirname(spec["output"]), exist_ok=True)
+    fig.savefig(spec["output"], dpi=spec.get("dpi", 100))
+    plt.close(fig)
+    return spec["output"]
+
+
+def _render_timed(spec):
+    start = time.perf_counter()
+    render(spec)
+    return time.perf_counter() - start
+
+
+def build(config=DEFAULT_CONFIG, force=False, jobs=None):
+    """Render the figures whose spec or inputs changed; return {output: seconds, or None when skipped}."""
+    figures = load_config(config)
+    state_path = config + STATE_SUFFIX
+    try:
+        with open(state_path, encoding="utf-8") as file:
+            state = json.load(file)
+    except (OSError, ValueError):
+        state = {}
+    base = os.path.dirname(os.path.abspath(config))
+    results = {}
+    pending = {}
+    for spec in figures:
+        key = fingerprint(spec, base)
+        if not force and state.get(os.path.relpath(spec["output"], base)) == key and os.path.exists(spec["output"]):
+            results[spec["output"]] = None
+        else:
+            pending[spec["output"]] = (spec, key)
+    try:
+        if len(pending) == 1 or jobs == 1:
+            for output, (spec, key) in pending.items():
+                results[output] = _render_timed(spec)
+                state[os.path.relpath(output, base)] = key
+        elif pending:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+                futures = {pool.submit(_render_timed, spec): (output, key) for output, (spec, key) in pending.items()}
+                for future in concurrent.futures.as_completed(futures):
+                    output, key = futures[future]
+                    results[output] = future.result()
+                    state[os.path.relpath(output, base)] = key
+    finally:
+        with open(state_path, "w", encoding="utf-8") as file:
+            json.dump(state, file, indent=1)  # Figures finished before an error stay up to date
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render the figures described in a YAML file.")
+    parser.add_argument("config", nargs="?", default=DEFAULT_CONFIG)
+    parser.add_argument("--force", action="store_true", help="render also unchanged figures")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: one per CPU)")
+    args = parser.parse_args()
+
+    for output, seconds in sorted(build(args.config, args.force, args.jobs).items()):
+        status = "unchanged" if seconds is None else f"{seconds:.1f} s"
+        print(f"{os.path.relpath(output)}: {status}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""Kinetics of the O2 consumption after "light on", fitted for every chamber of every run.
+
+Two models, time t in minutes from the first "light on":
+
+* ``first_order``: concentration falling first-order towards a baseline,
+  ``c(t) = c_inf + (c0 - c_inf) * exp(-k*t)``, fitted up to "light off"
+  with ``c_inf >= 0`` (an almost straight fall ends up at 0, i.e. a rate
+  proportional to the concentration);
+  ``rate0 = k*(c0 - c_inf)`` is the consumption right after light on in
+  pmol/(s*mL),
+* ``onset``: the negative O2 slope rising from its dark value,
+  ``J(t) = J0 + dJ * (1 - exp(-k*t))``, fitted over the first
+  ``ONSET_WINDOW`` minutes (later the slope falls again as O2 runs out);
+  ``half_time = ln 2 / k`` is how quickly consumption reaches half its rise.
+
+Residuals and Jacobians are whole-array expressions, the Jacobians analytic,
+so :func:`scipy.optimize.least_squares` needs no finite differences.
+Standard errors come from the covariance ``s² (JᵀJ)⁻¹`` at the optimum,
+for the derived parameters by the delta method. A parameter that ends on
+its bound (typically ``c_inf = 0``) is not estimated and gets a NaN
+standard error; the other errors, derived ones included, are those of the
+remaining parameters with it fixed there::
+
+    table = fit_store(Store())       # one row per run, chamber, model and parameter
+    table[(table.model == "onset") & (table.parameter == "half_time")]
+
+Runs are read from the memory-mapped :class:`~bluelight.analysis.store.Store`
+and spread over worker processes; only run names travel to the workers.
+``python -m bluelight.analysis.kinetics`` updates the store from
+``Data/CSV``, fits every run and writes the table as CSV.
+"""
+
+import argparse
+import concurrent.futures
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from .align import LIGHT_OFF, LIGHT_ON
+from .oroboros import TIME_COLUMN
+from .slope import concentration_column, slope_column
+from .store import DEFAULT_ROOT, DEFAULT_SOURCE, Store
+
+ONSET_WINDOW = 15.0  # Minutes after light on for the onset model
+MIN_POINTS = 10
+RUNS_PER_TASK = 8  # Runs sent to a worker at once
+PER_MINUTE = 1000 / 60  # µM/min -> pmol/(s*mL)
+
+
+def _first_order(params, t):
+    c0, c_inf, k = params
+    decay = np.exp(-k * t)
+    value = c_inf + (c0 - c_inf) * decay
+    jacobian = np.column_stack([decay, 1 - decay, -t * (c0 - c_inf) * decay])
+    return value, jacobian
+
+
+def _first_order_guess(t, y):
+    drop = max(y[0] - y[-1], 1e-3)
+    return [y[0], y[-1] - drop, 1 / max(t[-1], 1e-3)]
+
+
+def _first_order_derived(params):
+    c0, c_inf, k = params
+    # rate0 and its gradient with respect to (c0, c_inf, k)
+    return {"rate0": (k * (c0 - c_inf) * PER_MINUTE, np.array([k, -k, c0 - c_inf]) * PER_MINUTE)}
+
+
+def _onset(params, t):
+    j0, rise, k = params
+    decay = np.exp(-k * t)
+    value = j0 + rise * (1 - decay)
+    jacobian = np.column_stack([np.ones_like(t), 1 - decay, rise * t * decay])
+    return value, jacobian
+
+
+def _onset_guess(t, y):
+    j0 = float(np.median(y[:5]))
+    return [j0, float(np.max(y)) - j0, 0.5]
+
+
+def _onset_derived(params):
+    _, _, k = params
+    return {"half_time": (np.log(2) / k, np.array([0.0, 0.0, -np.log(2) / k ** 2]))}
+
+
+# Name -> (column of a chamber, function(params, t) -> (values, Jacobian), initial guess, derived parameters,
+#          parameter names, units, lower bounds, window in minutes after light on or None for up to light off)
+MODELS = {
+    "first_order": (concentration_column, _first_order, _first_order_guess, _first_order_derived,
+                    ("c0", "c_inf", "k"), {"c0": "uM", "c_inf": "uM", "k": "1/min", "rate0": "pmol/(s*mL)"},
+                    (-np.inf, 0.0, 0.0), None),
+    "onset": (slope_column, _onset, _onset_guess, _onset_derived,
+              ("J0", "dJ", "k"), {"J0": "pmol/(s*mL)", "dJ": "pmol/(s*mL)", "k": "1/min", "half_time": "min"},
+              (-np.inf, -np.inf, 0.0), ONSET_WINDOW),
+}
+
+
+def light_window(events):
+    """(first light on, the light off after it or None) in minutes from a run's events, None without light on."""
+    on = next((minutes for minutes, name, _, _ in events if name == LIGHT_ON), None)
+    if on is None:
+        return None
+    off = next((minutes for minutes, name, _, _ in events if name == LIGHT_OFF and minutes > on), None)
+    return on, off
+
+
+def fit_curve(model, t, y):
+    """Least-squares fit of a model to (t, y); returns (params, covariance, rmse, status)."""
+    from scipy.optimize import least_squares
+
+    _, function, guess, _, names, _, lower, _ = MODELS[model]
+
+    last = {}
+
+    def evaluate(params):
+        # least_squares asks for the residuals and then the Jacobian at the same point, compute both once
+        key = params.tobytes()
+        if key not in last:
+            last.clear()
+            last[key] = function(params, t)
+        return last[key]
+
+    def residuals(params):
+        return evaluate(params)[0] - y
+
+    def jacobian(params):
+        return evaluate(params)[1]
+
+    start = np.clip(guess(t, y), np.add(lower, 1e-9), None)
+    result = least_squares(residuals, start, jac=jacobian, bounds=(lower, np.inf), x_scale="jac", method="trf")
+    dof = len(t) - len(names)
+    rmse = float(np.sqrt(np.mean(result.fun ** 2)))
+    # A parameter held at its bound is not estimated, its row and column stay NaN
+    free = result.active_mask == 0
+    covariance = np.full((len(names), len(names)), np.nan)
+    try:
+        free_jac = result.jac[:, free]
+        covariance[np.ix_(free, free)] = np.linalg.inv(free_jac.T @ free_jac) * (result.fun @ result.fun) / dof
+    except np.linalg.LinAlgError:
+        pass
+    return result.x, covariance, rmse, result.status
+
+
+def fit_run(run, name, models=tuple(MODELS)):
+    """Rows of the parameter table for every chamber of a stored run."""
+    window = light_window(run.meta["events"])
+    if window is None:
+        return []
+    on, off = window
+    minutes = np.asarray(run[TIME_COLUMN], dtype=float)
+    rows = []
+    for chamber in run.meta["chambers"]:
+        for model in models:
+            column, _, _, derived, names, units, _, length = MODELS[model]
+            if column(chamber) not in run:
+                continue
+            end = on + length if length is not None else (off if off is not None else minutes[-1])
+            start, stop = np.searchsorted(minutes, [on, end], side="right")
+            t = minutes[start:stop] - on
+            y = np.asarray(run[column(chamber)][start:stop], dtype=float)
+            keep = ~np.isnan(y)
+            t, y = t[keep], y[keep]
+            if len(t) < MIN_POINTS:
+                continue
+            params, covariance, rmse, status = fit_curve(model, t, y)
+            common = {"run": name, "chamber": chamber, "model": model, "light_on": on, "n": len(t),
+                      "rmse": rmse, "status": status}
+            estimates = [(parameter, value, np.sqrt(covariance[i, i])) for i, (parameter, value) in
+                         enumerate(zip(names, params))]
+            free = ~np.isnan(np.diag(covariance))
+            for parameter, (value, gradient) in derived(params).items():
+                # Parameters at a bound count as fixed
+                se = np.sqrt(gradient[free] @ covariance[np.ix_(free, free)] @ gradient[free]) if free.any() else np.nan
+                estimates.append((parameter, value, se))
+            for parameter, value, se in estimates:
+                rows.append(dict(common, parameter=parameter, estimate=float(value), se=float(se),
+                                 unit=units[parameter]))
+    return rows
+
+
+def _fit_names(root, names, models):
+    store = Store(root)
+    rows = []
+    for name in names:
+        rows.extend(fit_run(store.open(name), name, models))
+    return rows
+
+
+def fit_store(store=None, names=None, models=tuple(MODELS), jobs=None):
+    """Tidy DataFrame of the fitted parameters of the named runs (all by default), fitted in parallel."""
+    store = store or Store()
+    names = store.names() if names is None else list(names)
+    chunks = [names[i:i + RUNS_PER_TASK] for i in range(0, len(names), RUNS_PER_TASK)]
+    rows = []
+    if len(chunks) <= 1 or jobs == 1:
+        for chunk in chunks:
+            rows.extend(_fit_names(store.root, chunk, models))
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+            for chunk_rows in pool.map(_fit_names, [store.root] * len(chunks), chunks, [models] * len(chunks)):
+                rows.extend(chunk_rows)
+    columns = ["run", "chamber", "model", "parameter", "estimate", "se", "unit", "light_on", "n", "rmse", "status"]
+    return pd.DataFrame(rows, columns=columns)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit O2 kinetics after light on for every stored run.")
+    parser.add_argument("names", nargs="*", help="runs to fit (default: all)")
+    parser.add_argument("--source", default=DEFAULT_SOURCE, help="folder with the CSV exports")
+    parser.add_argument("--root", default=DEFAULT_ROOT, help="store folder")
+    parser.add_argument("--model", action="append", choices=list(MODELS), help="model to fit (default: all)")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument("--output", "-o", help="CSV file for the table (default: print it)")
+    args = parser.parse_args()
+
+    store = Store(args.root)
+    store.sync(args.source)
+    start = time.perf_counter()
+    table = fit_store(store, args.names or None, tuple(args.model or MODELS), args.jobs)
+    elapsed = time.perf_counter() - start
+    if args.output:
+        table.to_csv(args.output, index=False)
+        print(f"{len(table)} rows from {table['run'].nunique()} runs in {elapsed:.1f} s -> {os.path.abspath(args.output)}")
+    else:
+        with pd.option_context("display.max_rows", None, "display.width", 200):
+            print(table)
+
+
+if __name__ == "__main__":
+    main()
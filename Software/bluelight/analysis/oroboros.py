@@ -0,0 +1,141 @@
+"""Reading CSV exports of the Oroboros O2k (DatLab).
+
+Exports come in two flavours: the ``difL`` files are Latin-1 with the
+degree sign of ``1: Block temp. [°C]``, the ``difC`` files have lost it and
+are plain ASCII. :func:`read_export` detects the encoding, names the column
+``1: Block temp. [°C]`` in both, and returns
+
+* ``Time [min]`` as float64 (the alignment axis),
+* ``Event Name``, ``Chamber`` and ``Event Text`` as categoricals,
+* every measurement as float32.
+
+The parsed columns are cached next to the CSV in ``<csv>.columns.npz``. The
+cache is used while the CSV keeps its modification time and size, or, when
+those changed, its SHA-256 (a copied file), so re-rendering figures does not
+parse any CSV again::
+
+    df = read_export("Data/CSV/difC/BR490.csv")
+    df[df["Event Name"] == "light on"]
+"""
+
+import csv
+import hashlib
+import io
+import json
+import os
+import re
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+TIME_COLUMN = "Time [min]"
+CATEGORY_COLUMNS = ("Event Name", "Chamber", "Event Text")
+CACHE_SUFFIX = ".columns.npz"
+CACHE_VERSION = 1  # Bump when the parsing changes so old caches are ignored
+
+_TEMPERATURE = re.compile(r"\[[^\w\]]?C\]")  # "[C]", "[°C]" or the "[�C]" of a wrongly decoded file
+
+
+def detect_encoding(data):
+    """UTF-8 if the bytes decode as such, otherwise Latin-1 (what DatLab writes)."""
+    try:
+        data.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "latin1"
+
+
+def normalize_column(name):
+    return _TEMPERATURE.sub("[°C]", name.strip())
+
+
+def parse_export(data):
+    """DataFrame of the bytes of an export, with normalized names and compact dtypes."""
+    text = data.decode(detect_encoding(data)).lstrip("\ufeff")
+    header = next(csv.reader(io.StringIO(text[:text.find("\n")])))
+    names = [normalize_column(name) for name in header]
+    dtypes = {}
+    for name in names:
+        if name in CATEGORY_COLUMNS:
+            dtypes[name] = "category"
+        else:
+            dtypes[name] = np.float64 if name == TIME_COLUMN else np.float32
+    frame = pd.read_csv(io.StringIO(text), delimiter=",", header=0, names=names, dtype=dtypes)
+    for name in frame.columns.intersection(CATEGORY_COLUMNS):
+        frame[name] = _categorical(frame[name].cat.codes.to_numpy(), frame[name].cat.categories)
+    return frame
+
+
+def _categorical(codes, categories):
+    """Same categories dtype whether parsed or read back from the cache (also for empty columns)."""
+    return pd.Categorical.from_codes(codes, pd.Index(np.asarray(categories, dtype=str), dtype=str))
+
+
+def _stamp(path):
+    stat = os.stat(path)
+    return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+
+def _write_cache(cache_path, frame, meta):
+    arrays = {}
+    meta = dict(meta, version=CACHE_VERSION, columns=list(frame.columns), categorical=[])
+    for index, name in enumerate(frame.columns):
+        column = frame[name]
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            meta["categorical"].append(name)
+            arrays[f"c{index}"] = column.cat.codes.to_numpy()
+            arrays[f"k{index}"] = np.asarray(column.cat.categories, dtype=str)
+        else:
+            arrays[f"c{index}"] = column.to_numpy()
+    arrays["meta"] = np.array(json.dumps(meta))
+    # A temporary file of its own: figure workers may write the cache of the same CSV at once
+    handle, temporary = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(cache_path) or ".")
+    try:
+        with os.fdopen(handle, "wb") as file:
+            np.savez(file, **arrays)
+        os.replace(temporary, cache_path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def _read_cache(cache_path):
+    with np.load(cache_path, allow_pickle=False) as data:
+        meta = json.loads(str(data["meta"]))
+        if meta.get("version") != CACHE_VERSION:
+            return None, meta
+        columns = {}
+        for index, name in enumerate(meta["columns"]):
+            if name in meta["categorical"]:
+                columns[name] = _categorical(data[f"c{index}"], data[f"k{index}"])
+            else:
+                columns[name] = data[f"c{index}"]
+    return pd.DataFrame(columns), meta
+
+
+def read_export(path, cache=True):
+    """Parsed export, from the cache file next to it when the CSV has not changed."""
+    cache_path = path + CACHE_SUFFIX
+    stamp = _stamp(path)
+    cached, meta = None, {}
+    if cache and os.path.exists(cache_path):
+        try:
+            cached, meta = _read_cache(cache_path)
+        except Exception:
+            cached, meta = None, {}  # Truncated or foreign file (BadZipFile, EOFError, ...): parse the CSV
+        if cached is not None and all(meta.get(key) == value for key, value in stamp.items()):
+            return cached
+    with open(path, "rb") as file:
+        data = file.read()
+    source_hash = hashlib.sha256(data).hexdigest()
+    if cached is not None and meta.get("sha256") == source_hash:
+        frame = cached  # Same content, only touched or copied
+    else:
+        frame = parse_export(data)
+    if cache:
+        try:
+            _write_cache(cache_path, frame, dict(stamp, sha256=source_hash))
+        except OSError:
+            pass  # Read-only data directory, parse again next time
+    return frame
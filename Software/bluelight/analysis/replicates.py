@@ -0,0 +1,79 @@
+"""Averaging of replicate measurements on a common time grid.
+
+Replicates are sampled at slightly different times, so instead of grouping
+equal (rounded) times every replicate is linearly interpolated onto one
+grid and the statistics are taken per grid point::
+
+    times = [df["Time [min]"] for df in (df1, df2, df3)]
+    bsa = average_replicates(times, [df["1A: O2 concentration [M]"] for df in (df1, df2, df3)], min_count=3)
+    ax.plot(bsa.time, bsa.mean)
+    ax.fill_between(bsa.time, bsa.mean - bsa.sd, bsa.mean + bsa.sd, alpha=0.2)
+
+All replicates are interpolated by a single ``np.interp`` call: each one is
+shifted along the time axis by a multiple of the total span, so they sit
+one after another and the grids never reach into a neighbour. A replicate
+only counts at grid points within its own first and last valid sample;
+NaN samples (the empty slope at the start of an export) are skipped.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+Average = namedtuple("Average", ["time", "mean", "sd", "n"])
+Average.__doc__ = """Grid, mean, sample standard deviation and number of replicates per grid point (NaN where n < min_count)."""
+
+
+def common_grid(times, step=None):
+    """Grid from the earliest to the latest sample, through 0, with the typical sampling interval.
+
+    The interval is the mean step of each replicate (exports round the times,
+    so single steps alternate), the median over the replicates.
+    """
+    times = [np.asarray(t, dtype=float) for t in times if len(t)]
+    if step is None:
+        step = float(np.median([(t[-1] - t[0]) / (len(t) - 1) for t in times if len(t) > 1]))
+    start = min(t[0] for t in times)
+    stop = max(t[-1] for t in times)
+    return np.arange(np.ceil(start / step - 1e-9), np.floor(stop / step + 1e-9) + 1) * step
+
+
+def resample(times, values, grid):
+    """(replicates, grid points) array of every replicate on the grid, NaN outside its range."""
+    grid = np.asarray(grid, dtype=float)
+    cleaned = []
+    for t, v in zip(times, values):
+        t, v = np.asarray(t, dtype=float), np.asarray(v, dtype=float)
+        valid = ~(np.isnan(t) | np.isnan(v))
+        cleaned.append((t[valid], v[valid]))
+    nonempty = [t for t, _ in cleaned if len(t)]
+    if not nonempty:
+        return np.full((len(cleaned), len(grid)), np.nan)
+    low = min([grid[0]] + [t[0] for t in nonempty])
+    high = max([grid[-1]] + [t[-1] for t in nonempty])
+    span = high - low + 1.0
+    offsets = np.arange(len(cleaned)) * span
+    result = np.interp(grid[None, :] + offsets[:, None],
+                       np.concatenate([t + offset for (t, _), offset in zip(cleaned, offsets)]),
+                       np.concatenate([v for _, v in cleaned]))
+    first = np.array([t[0] if len(t) else np.inf for t, _ in cleaned])
+    last = np.array([t[-1] if len(t) else -np.inf for t, _ in cleaned])
+    result[(grid[None, :] < first[:, None]) | (grid[None, :] > last[:, None])] = np.nan
+    return result
+
+
+def average_replicates(times, values, grid=None, step=None, min_count=1):
+    """Mean, SD and n of the replicates (lists of time and value arrays) on grid (common_grid by default)."""
+    if grid is None:
+        grid = common_grid(times, step)
+    resampled = resample(times, values, grid)
+    present = ~np.isnan(resampled)
+    n = present.sum(axis=0)
+    filled = np.where(present, resampled, 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = filled.sum(axis=0) / n
+        squares = np.where(present, (resampled - mean) ** 2, 0.0).sum(axis=0)
+        sd = np.sqrt(squares / (n - 1))
+    mean[n < max(min_count, 1)] = np.nan
+    sd[n < max(min_count, 2)] = np.nan
+    return Average(np.asarray(grid, dtype=float), mean, sd, n)
@@ -0,0 +1,154 @@
+"""Negative O2 slope recomputed from ``O2 concentration [M]``.
+
+DatLab's ``O2 slope neg.`` is the slope of a linear regression over the
+last 40 samples (shorter at the start of a recording), in pmol/(s*mL); the
+concentration column is in µM (nmol/mL). :func:`regression_slope`
+reproduces it from the concentration and lets the window be changed (to
+within 0.1 pmol/(s*mL) of the exports here once the chamber has settled;
+during the first minutes DatLab evidently works from unrounded data);
+:func:`savgol_slope` uses the derivative of a Savitzky–Golay fit instead
+(needs SciPy)::
+
+    df["1B: O2 slope neg. [pmol/(s*mL)]"] = recompute_slope(df, "1B", window=20)
+
+Both work on whole arrays. :class:`StreamingSlope` computes the regression
+slope for samples as they arrive, with running sums (summed afresh every
+``BLOCK`` samples), so a sample costs the same on average whatever the
+window::
+
+    slope = StreamingSlope(window=40)
+    for minutes, concentration in new_rows:
+        value = slope.update(minutes * 60, concentration)
+"""
+
+import collections
+
+import numpy as np
+
+from .oroboros import TIME_COLUMN
+
+DATLAB_WINDOW = 40  # Samples in DatLab's default slope regression
+MIN_POINTS = 5  # DatLab leaves the slope empty for fewer samples
+SLOPE_FACTOR = -1000.0  # µM/s -> negative slope in pmol/(s*mL)
+BLOCK = 1024  # Samples per block of running sums in regression_slope
+
+
+def concentration_column(chamber):
+    return f"{chamber}: O2 concentration [M]"
+
+
+def slope_column(chamber):
+    return f"{chamber}: O2 slope neg. [pmol/(s*mL)]"
+
+
+def regression_slope(seconds, concentration, window=DATLAB_WINDOW, min_points=MIN_POINTS):
+    """Negative slope of the least-squares line through each sample and up to window-1 before it.
+
+    Running sums (cumsum differences) make it O(n) for any window. They are
+    taken over blocks of BLOCK samples (plus the window before each block),
+    with times and concentrations relative to the block, so hours of
+    samples do not cost the sums their precision.
+    """
+    t = np.asarray(seconds, dtype=float)
+    y = np.asarray(concentration, dtype=float)
+    slope = np.empty(len(y))
+    block = max(BLOCK, window)
+    for start in range(0, len(y), block):
+        first = max(start - window + 1, 0)
+        part = _window_slope(t[first:start + block], y[first:start + block], window, min_points)
+        slope[start:start + block] = part[start - first:]
+    return slope * SLOPE_FACTOR
+
+
+def _window_slope(t, y, window, min_points):
+    """Slope of each window of a block; the first samples of the block only count if it starts the recording."""
+    t = t - t.mean() if len(t) else t
+    y = y - y.mean() if len(y) else y
+
+    def window_sum(values):
+        total = np.concatenate([[0.0], np.cumsum(values)])
+        end = np.arange(1, len(values) + 1)
+        return total[end] - total[np.maximum(end - window, 0)]
+
+    count = np.minimum(np.arange(1, len(y) + 1), window).astype(float)
+    sum_t, sum_y = window_sum(t), window_sum(y)
+    sum_tt, sum_ty = window_sum(t * t), window_sum(t * y)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        slope = (count * sum_ty - sum_t * sum_y) / (count * sum_tt - sum_t ** 2)
+    slope[count < max(min_points, 2)] = np.nan
+    return slope
+
+
+def savgol_slope(seconds, concentration, window=DATLAB_WINDOW + 1, order=2):
+    """Negative slope from a centred Savitzky–Golay derivative (odd window, uniform sampling assumed)."""
+    from scipy.signal import savgol_filter
+
+    t = np.asarray(seconds, dtype=float)
+    y = np.asarray(concentration, dtype=float)
+    if len(y) < window:
+        return np.full(len(y), np.nan)
+    delta = (t[-1] - t[0]) / (len(t) - 1)
+    return savgol_filter(y, window, order, deriv=1, delta=delta, mode="interp") * SLOPE_FACTOR
+
+
+def recompute_slope(frame, chamber, method="regression", **options):
+    """Slope of a chamber ("1A") of an export as float32, like the exported column."""
+    seconds = frame[TIME_COLUMN].to_numpy(dtype=float) * 60
+    concentration = frame[concentration_column(chamber)].to_numpy(dtype=float)
+    compute = {"regression": regression_slope, "savgol": savgol_slope}[method]
+    return compute(seconds, concentration, **options).astype(np.float32)
+
+
+class StreamingSlope:
+    """Regression slope of the last window samples, updated in constant time per sample."""
+
+    def __init__(self, window=DATLAB_WINDOW, min_points=MIN_POINTS):
+        self.window = window
+        self.min_points = max(min_points, 2)
+        self.samples = collections.deque()
+        self.origin = None
+        self.sum_t = self.sum_y = self.sum_tt = self.sum_ty = 0.0
+        self.since_rebase = 0
+
+    def reset(self):
+        self.__init__(self.window, self.min_points)
+
+    def update(self, seconds, concentration):
+        """Add a sample and return the current negative slope (NaN until min_points samples)."""
+        if self.origin is None:
+            self.origin = seconds  # Small times keep the running sums precise
+        t = seconds - self.origin
+        y = float(concentration)
+        self.samples.append((t, y))
+        self.sum_t += t
+        self.sum_y += y
+        self.sum_tt += t * t
+        self.sum_ty += t * y
+        if len(self.samples) > self.window:
+            old_t, old_y = self.samples.popleft()
+            self.sum_t -= old_t
+            self.sum_y -= old_y
+            self.sum_tt -= old_t * old_t
+            self.sum_ty -= old_t * old_y
+        self.since_rebase += 1
+        if self.since_rebase >= max(BLOCK, self.window):
+            self._rebase()
+        return self.slope()
+
+    def _rebase(self):
+        """Move the origin to the newest sample and sum the window afresh, dropping accumulated rounding."""
+        shift = self.samples[-1][0]
+        self.origin += shift
+        self.samples = collections.deque((t - shift, y) for t, y in self.samples)
+        t = np.array([t for t, _ in self.samples])
+        y = np.array([y for _, y in self.samples])
+        self.sum_t, self.sum_y = float(t.sum()), float(y.sum())
+        self.sum_tt, self.sum_ty = float(t @ t), float(t @ y)
+        self.since_rebase = 0
+
+    def slope(self):
+        count = len(self.samples)
+        denominator = count * self.sum_tt - self.sum_t ** 2
+        if count < self.min_points or denominator <= 0:
+            return float("nan")
+        return (count * self.sum_ty - self.sum_t * self.sum_y) / denominator * SLOPE_FACTOR
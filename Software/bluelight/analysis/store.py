@@ -0,0 +1,184 @@
+"""Store of Oroboros runs as memory-mapped columns.
+
+Every export becomes a directory with one ``.npy`` file per column and a
+``meta.json`` with what is needed without touching the data: column
+names, row count, sampling interval, chamber labels and the events::
+
+    store = Store()                               # Data/Store
+    store.sync()                                  # converts new or changed CSVs in Data/CSV
+    run = store.open("difC/BR490")                # reads meta.json only
+    slope = run["1B: O2 slope neg. [pmol/(s*mL)]"]  # maps this one column
+    run.meta["events"]                            # [[minutes, name, chamber, text], ...]
+
+Columns are mapped read-only on first access, so opening a run costs one
+small JSON file and a column costs only the pages that are read. Event
+columns are stored as int codes with their categories in the metadata;
+:meth:`Run.frame` rebuilds a DataFrame like :func:`~bluelight.analysis.oroboros.read_export`.
+``python -m bluelight.analysis.store`` converts the whole ``Data/CSV``.
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from .oroboros import CATEGORY_COLUMNS, TIME_COLUMN, read_export
+
+DATA_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "Data")
+DEFAULT_ROOT = os.path.join(DATA_DIRECTORY, "Store")
+DEFAULT_SOURCE = os.path.join(DATA_DIRECTORY, "CSV")
+META_FILE = "meta.json"
+STORE_VERSION = 1
+
+_CHAMBER = re.compile(r"^(\d[A-Z]):")
+
+
+class Run:
+    """One stored export; columns are loaded (memory-mapped) on first access."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_FILE), encoding="utf-8") as file:
+            self.meta = json.load(file)
+        self._files = {name: entry["file"] for name, entry in self.meta["columns"].items()}
+        self._loaded = {}
+
+    @property
+    def columns(self):
+        return list(self._files)
+
+    def __len__(self):
+        return self.meta["rows"]
+
+    def __contains__(self, name):
+        return name in self._files
+
+    def __getitem__(self, name):
+        """Read-only array of a column; event columns give their int codes (-1 for no event)."""
+        if name not in self._loaded:
+            self._loaded[name] = np.load(os.path.join(self.path, self._files[name]), mmap_mode="r")
+        return self._loaded[name]
+
+    def categories(self, name):
+        return self.meta["columns"][name].get("categories")
+
+    def frame(self, columns=None):
+        """DataFrame of the given columns (all by default), copied out of the maps."""
+        data = {}
+        for name in columns or self.columns:
+            categories = self.categories(name)
+            if categories is None:
+                data[name] = np.array(self[name])
+            else:
+                data[name] = pd.Categorical.from_codes(np.array(self[name]), pd.Index(categories, dtype=str))
+        return pd.DataFrame(data)
+
+
+class Store:
+    """Directory of runs, one subdirectory per export named after its path below the CSV folder."""
+
+    def __init__(self, root=DEFAULT_ROOT):
+        self.root = root
+
+    def names(self):
+        metas = glob.glob(os.path.join(self.root, "**", META_FILE), recursive=True)
+        return sorted(os.path.relpath(os.path.dirname(path), self.root).replace(os.sep, "/") for path in metas)
+
+    def open(self, name):
+        return Run(os.path.join(self.root, *name.split("/")))
+
+    def is_current(self, name, csv_path):
+        try:
+            with open(os.path.join(self.root, *name.split("/"), META_FILE), encoding="utf-8") as file:
+                source = json.load(file)
+        except (OSError, ValueError):
+            return False
+        stat = os.stat(csv_path)
+        return (source.get("version") == STORE_VERSION
+                and source["source"]["mtime_ns"] == stat.st_mtime_ns and source["source"]["size"] == stat.st_size)
+
+    def add(self, csv_path, name):
+        """Convert an export (replacing a stored run of the same name) and return the Run."""
+        frame = read_export(csv_path)
+        stat = os.stat(csv_path)
+        target = os.path.join(self.root, *name.split("/"))
+        temporary = target + ".tmp"
+        shutil.rmtree(temporary, ignore_errors=True)
+        os.makedirs(temporary)
+        columns = {}
+        for index, column in enumerate(frame.columns):
+            entry = {"file": f"{index:02d}.npy"}
+            values = frame[column]
+            if column in CATEGORY_COLUMNS:
+                entry["categories"] = [str(category) for category in values.cat.categories]
+                values = values.cat.codes
+            np.save(os.path.join(temporary, entry["file"]), np.ascontiguousarray(values.to_numpy()))
+            columns[column] = entry
+        with open(os.path.join(temporary, META_FILE), "w", encoding="utf-8") as file:
+            json.dump({
+                "version": STORE_VERSION,
+                "source": {"path": os.path.abspath(csv_path), "mtime_ns": stat.st_mtime_ns, "size": stat.st_size},
+                "rows": len(frame),
+                "interval": _interval(frame),
+                "chambers": sorted({match.group(1) for match in map(_CHAMBER.match, frame.columns) if match}),
+                "events": _events(frame),
+                "columns": columns,
+            }, file, ensure_ascii=False, indent=1)
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(temporary, target)
+        return Run(target)
+
+    def sync(self, source=DEFAULT_SOURCE):
+        """Convert every export below source that is new or changed; return the names converted."""
+        converted = []
+        for csv_path in sorted(glob.glob(os.path.join(source, "**", "*.csv"), recursive=True)):
+            if not _is_export(csv_path):
+                continue
+            name = os.path.splitext(os.path.relpath(csv_path, source))[0].replace(os.sep, "/")
+            if not self.is_current(name, csv_path):
+                self.add(csv_path, name)
+                converted.append(name)
+        return converted
+
+
+def _is_export(csv_path):
+    with open(csv_path, "rb") as file:
+        return file.readline().startswith(b'"' + TIME_COLUMN.encode())
+
+
+def _interval(frame):
+    """Sampling interval in seconds (median step of the time axis)."""
+    if len(frame) < 2:
+        return None
+    return round(float(np.median(np.diff(frame[TIME_COLUMN].to_numpy()))) * 60, 6)
+
+
+def _events(frame):
+    if "Event Name" not in frame:
+        return []
+    rows = frame[frame["Event Name"].notna()]
+    fields = [rows[name] if name in rows else pd.Series(None, index=rows.index, dtype=object)
+              for name in ("Event Name", "Chamber", "Event Text")]
+    return [[float(minutes)] + [None if pd.isna(value) else str(value) for value in values]
+            for minutes, *values in zip(rows[TIME_COLUMN], *fields)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert Oroboros CSV exports into the memory-mapped store.")
+    parser.add_argument("source", nargs="?", default=DEFAULT_SOURCE, help="folder searched for CSV exports")
+    parser.add_argument("--root", default=DEFAULT_ROOT, help="store folder")
+    args = parser.parse_args()
+
+    store = Store(args.root)
+    for name in store.sync(args.source):
+        print(f"Converted {name}")
+    print(f"{len(store.names())} runs in {os.path.abspath(args.root)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""Following a DatLab CSV export while it is being written.
+
+:class:`CsvTail` remembers how far it has read and on each :meth:`~CsvTail.poll`
+parses only the bytes appended since, into preallocated
+:class:`RingBuffer` columns, so a poll costs the same at the start of a run
+and ten hours into it::
+
+    tail = CsvTail("live.csv", columns=["1B: O2 concentration [M]", "1B: O2 slope neg. [pmol/(s*mL)]"])
+    while running:
+        if tail.poll():
+            minutes = tail.time.values()
+            slope = tail["1B: O2 slope neg. [pmol/(s*mL)]"].values()
+
+A line without its newline yet is kept until the rest arrives. When the file
+is replaced (new inode, shorter than what was read, or a different header,
+as after a re-export), the buffers are cleared and it is read again from the
+start; :attr:`CsvTail.generation` counts these restarts.
+"""
+
+import csv
+import io
+import os
+
+import numpy as np
+import pandas as pd
+
+from .oroboros import CATEGORY_COLUMNS, TIME_COLUMN, detect_encoding, normalize_column
+
+DEFAULT_CAPACITY = 86400  # Samples kept per column, 48 h at 2 s
+
+
+class RingBuffer:
+    """Fixed-size array that keeps the newest values; extend() copies whole blocks."""
+
+    def __init__(self, capacity, dtype=np.float32):
+        self.data = np.full(capacity, np.nan, dtype=dtype)
+        self.capacity = capacity
+        self.end = 0  # Total values ever added; the newest is at (end - 1) % capacity
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.end = self.count = 0
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=self.data.dtype)[-self.capacity:]
+        start = self.end % self.capacity
+        first = min(len(values), self.capacity - start)
+        self.data[start:start + first] = values[:first]
+        self.data[:len(values) - first] = values[first:]
+        self.end += len(values)
+        self.count = min(self.count + len(values), self.capacity)
+
+    def values(self):
+        """The kept values, oldest first (a view when they do not wrap around)."""
+        start = (self.end - self.count) % self.capacity
+        if start + self.count <= self.capacity:
+            return self.data[start:start + self.count]
+        return np.concatenate([self.data[start:], self.data[:(start + self.count) % self.capacity]])
+
+    def last(self, default=np.nan):
+        return self.data[(self.end - 1) % self.capacity] if self.count else default
+
+
+class CsvTail:
+    """Incremental reader of a growing export; measurement columns go into ring buffers."""
+
+    def __init__(self, path, columns=None, capacity=DEFAULT_CAPACITY):
+        self.path = path
+        self.wanted = columns
+        self.capacity = capacity
+        self.generation = 0
+        self.time = RingBuffer(capacity, np.float64)
+        self.buffers = {}
+        self.events = []  # (minutes, name, chamber, text) of every event row
+        self._reset()
+
+    def __getitem__(self, name):
+        return self.buffers[name]
+
+    def _reset(self):
+        self.offset = 0
+        self.pending = b""
+        self.inode = None
+        self.header = None
+        self.encoding = None
+        self.names = None
+        self.time.clear()
+        for buffer in self.buffers.values():
+            buffer.clear()
+        self.events = []
+
+    def _replaced(self, stat):
+        if self.inode is None:
+            return False
+        if stat.st_ino != self.inode or stat.st_size < self.offset:
+            return True
+        with open(self.path, "rb") as file:
+            return file.read(len(self.header)) != self.header
+
+    def poll(self):
+        """Read what was appended since the last poll; return the number of new rows.
+
+        A file that cannot be read or parsed yet (locked by DatLab, half
+        written) counts as no new data; the same bytes are tried again next time.
+        """
+        try:
+            stat = os.stat(self.path)
+            if self._replaced(stat):
+                self._reset()
+                self.generation += 1
+            if stat.st_size == self.offset:
+                return 0
+            with open(self.path, "rb") as file:
+                file.seek(self.offset)
+                data = self.pending + file.read(stat.st_size - self.offset)
+        except OSError:
+            return 0
+        end = data.rfind(b"\n") + 1
+        if self.header is None:
+            line_end = data.find(b"\n") + 1
+            if not line_end:
+                return 0
+            try:
+                self._read_header(data[:line_end])
+            except (ValueError, StopIteration):
+                self.header = None
+                return 0
+            body = data[line_end:end]
+        else:
+            body = data[:end]
+        try:
+            rows = self._parse(body) if body else 0
+        except (ValueError, KeyError, pd.errors.ParserError):
+            if self.offset == 0:
+                self.header = None  # The header is read again with the rows
+            return 0
+        self.offset = stat.st_size
+        self.inode = stat.st_ino
+        self.pending = data[end:]
+        return rows
+
+    def _read_header(self, line):
+        self.header = line
+        self.encoding = detect_encoding(line)
+        text = line.decode(self.encoding).lstrip("\ufeff").strip()
+        self.names = [normalize_column(name) for name in next(csv.reader([text]))]
+        # A re-export may drop or rename columns, keep only (and reuse) the buffers of this header
+        old = self.buffers
+        self.buffers = {}
+        for name in self.names:
+            if name in CATEGORY_COLUMNS or name == TIME_COLUMN:
+                continue
+            if self.wanted is None or name in self.wanted:
+                self.buffers[name] = old[name] if name in old else RingBuffer(self.capacity)
+
+    def _parse(self, data):
+        dtypes = {name: str if name in CATEGORY_COLUMNS else np.float64 for name in self.names}
+        rows = pd.read_csv(io.BytesIO(data), header=None, names=self.names, dtype=dtypes, encoding=self.encoding)
+        minutes = rows[TIME_COLUMN].to_numpy()
+        self.time.extend(minutes)
+        for name, buffer in self.buffers.items():
+            buffer.extend(rows[name].to_numpy())
+        if "Event Name" in rows:
+            marked = rows["Event Name"].notna().to_numpy()
+            for index in np.flatnonzero(marked):
+                self.events.append((float(minutes[index]),) + tuple(
+                    None if name not in rows or pd.isna(rows[name].iat[index]) else rows[name].iat[index]
+                    for name in CATEGORY_COLUMNS))
+        return len(rows)
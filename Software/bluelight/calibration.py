@@ -0,0 +1,230 @@
+"""Calibration of PWM value -> irradiance, with model selection and a fit cache.
+
+Three models are fitted to a calibration CSV, all in ln(PWM):
+
+* ``log``: ``a*ln(x) + b``, the fit ``Data/Graph4/graph1.py`` plots,
+* ``monotone``: piecewise linear through the isotonic (non-decreasing) fit
+  of the points,
+* ``spline``: cubic smoothing spline (needs SciPy, skipped without it).
+
+The model with the lowest leave-one-out RMSE wins, since the piecewise
+linear model passes through every point and its plain residuals would
+always be zero. Beyond the measured range every model continues linearly
+in ln(PWM).
+
+:func:`load_calibration` stores the result in ``<csv>.calibration.json``
+together with the SHA-256 of the CSV, so later runs load it without
+refitting until the CSV changes. A profile (``Software/calibration.json``)
+assigns calibration CSVs to the channels of each box by USB serial number;
+paths are relative to the profile::
+
+    {
+        "default": "../Data/CSV/PWMtoIntensity.csv",
+        "boxes": {"85735313932351F0B1E1": {"1": "box1_led1.csv", "2": "box1_led2.csv"}}
+    }
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from .irradiance import DEFAULT_CALIBRATION, PWM_LEVELS, IrradianceTable, fit_log, read_calibration_csv
+
+DEFAULT_PROFILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "calibration.json")
+CACHE_SUFFIX = ".calibration.json"
+CACHE_VERSION = 1  # Bump when the models change so old cache files are refitted
+
+
+def _extend_linearly(u, u_known, y_known, slope_low, slope_high, inside):
+    """Evaluate inside(u) within [u_known[0], u_known[-1]] and straight lines with the given slopes outside."""
+    u = np.asarray(u, dtype=float)
+    low, high = u_known[0], u_known[-1]
+    result = inside(np.clip(u, low, high))
+    result = np.where(u < low, y_known[0] + slope_low * (u - low), result)
+    return np.where(u > high, y_known[-1] + slope_high * (u - high), result)
+
+
+def fit_log_model(u, y):
+    a, b = fit_log(np.exp(u), y)  # The fit load_table() uses
+    return {"a": float(a), "b": float(b)}
+
+
+def eval_log(params, u):
+    return params["a"] * np.asarray(u, dtype=float) + params["b"]
+
+
+def _isotonic(y):
+    """Pool-adjacent-violators: the closest non-decreasing sequence to y (least squares)."""
+    blocks = []  # [mean, count]
+    for value in y:
+        blocks.append([float(value), 1])
+        while len(blocks) > 1 and blocks[-2][0] > blocks[-1][0]:
+            mean, count = blocks.pop()
+            blocks[-1][0] = (blocks[-1][0] * blocks[-1][1] + mean * count) / (blocks[-1][1] + count)
+            blocks[-1][1] += count
+    return np.repeat([mean for mean, _ in blocks], [count for _, count in blocks])
+
+
+def fit_monotone(u, y):
+    fitted = _isotonic(y)
+    return {"u": [float(v) for v in u], "y": [float(v) for v in fitted]}
+
+
+def eval_monotone(params, u):
+    u_known, y_known = np.array(params["u"]), np.array(params["y"])
+    if len(u_known) < 2:
+        return np.full(np.shape(u), y_known[0])
+    slopes = np.diff(y_known) / np.diff(u_known)
+    return _extend_linearly(u, u_known, y_known, slopes[0], slopes[-1], lambda v: np.interp(v, u_known, y_known))
+
+
+def fit_spline(u, y):
+    from scipy.interpolate import UnivariateSpline
+
+    degree = min(3, len(u) - 1)
+    noise = np.sqrt(np.mean((eval_log(fit_log_model(u, y), u) - y) ** 2))  # The log fit bounds the noise level
+    spline = UnivariateSpline(u, y, k=degree, s=len(u) * noise ** 2)
+    # get_knots() leaves out the repeated end knots of the full B-spline knot vector
+    inner = spline.get_knots()
+    knots = np.concatenate([[inner[0]] * degree, inner, [inner[-1]] * degree])
+    return {"u": [float(u[0]), float(u[-1])], "knots": knots.tolist(), "coefficients": spline.get_coeffs().tolist(),
+            "degree": int(degree)}
+
+
+def eval_spline(params, u):
+    from scipy.interpolate import BSpline
+
+    spline = BSpline(np.array(params["knots"]), np.array(params["coefficients"]), params["degree"])
+    u_known = np.array(params["u"])
+    y_known = spline(u_known)
+    derivative = spline.derivative()
+    return _extend_linearly(u, u_known, y_known, derivative(u_known[0]), derivative(u_known[-1]), spline)
+
+
+MODELS = {
+    "log": (fit_log_model, eval_log),
+    "monotone": (fit_monotone, eval_monotone),
+    "spline": (fit_spline, eval_spline),
+}
+
+
+def _leave_one_out_rmse(fit, evaluate, u, y):
+    errors = []
+    for index in range(len(u)):
+        keep = np.arange(len(u)) != index
+        errors.append(evaluate(fit(u[keep], y[keep]), u[index]) - y[index])
+    return float(np.sqrt(np.mean(np.square(errors))))
+
+
+class Calibration:
+    """Fitted model of one calibration CSV and its 256-entry IrradianceTable."""
+
+    def __init__(self, model, params, scores, source_hash=None):
+        self.model = model
+        self.params = params
+        self.scores = scores  # Model -> {"rmse", "cv_rmse"} in µW/cm², for every model that was fitted
+        self.source_hash = source_hash
+        values = np.zeros(PWM_LEVELS)
+        values[1:] = MODELS[model][1](params, np.log(np.arange(1, PWM_LEVELS)))
+        self.table = IrradianceTable(values)
+
+    def to_dict(self):
+        return {"version": CACHE_VERSION, "sha256": self.source_hash, "model": self.model,
+                "params": self.params, "scores": self.scores}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["model"], data["params"], data["scores"], data["sha256"])
+
+
+def calibrate(pwm, irradiance, models=tuple(MODELS), source_hash=None):
+    """Fit every model to the points and return the Calibration of the best one."""
+    order = np.argsort(pwm)
+    u, y = np.log(np.asarray(pwm, dtype=float)[order]), np.asarray(irradiance, dtype=float)[order]
+    scores = {}
+    fitted = {}
+    for name in models:
+        fit, evaluate = MODELS[name]
+        try:
+            params = fit(u, y)
+            cv_rmse = _leave_one_out_rmse(fit, evaluate, u, y)
+        except ImportError:
+            continue  # SciPy is optional
+        rmse = float(np.sqrt(np.mean((evaluate(params, u) - y) ** 2)))
+        scores[name] = {"rmse": rmse, "cv_rmse": cv_rmse}
+        fitted[name] = params
+    best = min(scores, key=lambda name: scores[name]["cv_rmse"])
+    return Calibration(best, fitted[best], scores, source_hash)
+
+
+def file_hash(path):
+    with open(path, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+
+def load_calibration(path=DEFAULT_CALIBRATION):
+    """Calibration of a CSV, from the cache file next to it if the CSV has not changed since."""
+    source_hash = file_hash(path)
+    cache_path = path + CACHE_SUFFIX
+    try:
+        with open(cache_path, encoding="utf-8") as file:
+            data = json.load(file)
+        if data.get("version") == CACHE_VERSION and data.get("sha256") == source_hash:
+            return Calibration.from_dict(data)
+    except (OSError, ValueError, KeyError):
+        pass
+    calibration = calibrate(*read_calibration_csv(path), source_hash=source_hash)
+    try:
+        with open(cache_path, "w", encoding="utf-8") as file:
+            json.dump(calibration.to_dict(), file, indent=2)
+    except OSError:
+        pass  # Read-only data directory, fit again next time
+    return calibration
+
+
+class Profile:
+    """Calibration CSVs per box (USB serial number) and channel, with a default for unknown boxes."""
+
+    def __init__(self, default=DEFAULT_CALIBRATION, boxes=None, channels=(1, 2)):
+        self.default = default
+        self.boxes = boxes or {}
+        self.channels = channels
+
+    def paths_for(self, box_id=None):
+        entry = self.boxes.get(box_id, self.default) if box_id else self.default
+        if isinstance(entry, str):
+            return {channel: entry for channel in self.channels}
+        return {int(channel): path for channel, path in entry.items()}
+
+    def calibrations_for(self, box_id=None):
+        """{channel: Calibration} for the box; channels whose CSV is missing are left out."""
+        result = {}
+        for channel, path in self.paths_for(box_id).items():
+            try:
+                result[channel] = load_calibration(path)
+            except (OSError, ValueError):
+                continue
+        return result
+
+    def tables_for(self, box_id=None):
+        """{channel: IrradianceTable}, ready for LightController(calibration=...)."""
+        return {channel: calibration.table for channel, calibration in self.calibrations_for(box_id).items()}
+
+
+def load_profile(path=DEFAULT_PROFILE):
+    """Read a profile file; without one every channel of every box uses DEFAULT_CALIBRATION."""
+    if not os.path.exists(path):
+        return Profile()
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, encoding="utf-8") as file:
+        data = json.load(file)
+
+    def resolve(entry):
+        if isinstance(entry, str):
+            return os.path.join(base, entry)
+        return {channel: os.path.join(base, csv_path) for channel, csv_path in entry.items()}
+
+    boxes = {box_id: resolve(entry) for box_id, entry in data.get("boxes", {}).items()}
+    return Profile(resolve(data.get("default", DEFAULT_CALIBRATION)), boxes)
@@ -0,0 +1,364 @@
+"""asyncio front end for one BlueLight box.
+
+The serial I/O runs on the threads in :mod:`bluelight.link`; this module
+moves reports onto the event loop and keeps track of the brightness the box
+has confirmed. Nothing here imports Qt, so it works in scripts and on
+headless lab PCs::
+
+    import asyncio
+    from bluelight import LightController
+
+    async def main():
+        async with LightController("/dev/ttyACM0") as box:
+            await box.set(1, 128)
+            await box.run_schedule([({1: 255, 2: 255}, 60 * 60)])
+
+    asyncio.run(main())
+"""
+
+import asyncio
+import threading
+import time
+
+import serial
+
+from . import protocol
+from .dose import DoseIntegrator
+from .journal import SOURCE_ACK, SOURCE_COMMAND, SOURCE_LOCAL
+from .latency import LatencyTracker
+from .link import MAX_COMMAND_RATE, CoalescingWriter, SerialReader
+from .upload import compile_table
+
+BAUDRATE = 9600
+ACK_TIMEOUT = 2.0  # Seconds set() waits for the box to confirm a value
+UPLOAD_TIMEOUT = 5.0  # Seconds for a full schedule table to reach the box at 9600 baud, with margin
+
+
+class LightController:
+    """Owns the serial connection to one box.
+
+    port is a port name such as ``"COM3"`` or ``"/dev/ttyACM0"``, or an
+    already open serial-like object (e.g. :class:`bluelight.sim.SimulatedDevice`).
+    calibration is a :class:`bluelight.irradiance.IrradianceTable` for all
+    channels or a {channel: table} dict; it enables the *_irradiance methods
+    and the dose integration in :attr:`dose` (a :class:`bluelight.dose.DoseIntegrator`).
+    Every command and report is recorded in journal (a
+    :class:`bluelight.journal.Journal`) under name, the port name by default.
+    """
+
+    def __init__(self, port, channels=(1, 2), max_rate=MAX_COMMAND_RATE, calibration=None, journal=None,
+                 name=None):
+        self.port = port
+        self.channels = tuple(channels)
+        self.max_rate = max_rate
+        self.calibration = calibration
+        self.journal = journal
+        self.name = name or (port if isinstance(port, str) else type(port).__name__)
+        self.device_id = journal.device_id(self.name) if journal else None
+        self.serial_port = None
+        self.mode = protocol.TEXT
+        self.brightness = {channel: None for channel in self.channels}  # Last value the box reported
+        self.listeners = []
+        self.schedule_listeners = []
+        self.latency = LatencyTracker(self.channels)  # Round trip of every SET, see bluelight.latency
+        self.dose = DoseIntegrator(self.channels)  # µJ/cm² from the reported brightness, see bluelight.dose
+        self.loop = None
+        self.reader = None
+        self.writer = None
+        self._waiters = {channel: [] for channel in self.channels}  # Channel -> [(value, future)]
+        self._event_waiters = []  # [(schedule events that resolve the future, future)]
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    @property
+    def is_open(self):
+        return self.writer is not None
+
+    async def open(self):
+        """Open the port, negotiate the protocol and start the I/O threads."""
+        self.loop = asyncio.get_running_loop()
+        await self.loop.run_in_executor(None, self._open_blocking)
+
+    def _open_blocking(self):
+        if isinstance(self.port, str):
+            self.serial_port = serial.Serial(port=self.port, baudrate=BAUDRATE, timeout=1)
+        else:
+            self.serial_port = self.port
+        try:
+            self.mode = protocol.negotiate(self.serial_port)
+        except serial.SerialException:
+            self.serial_port.close()
+            raise
+        self.latency = LatencyTracker(self.channels)
+        self.reader = SerialReader(self.serial_port, self._report_from_thread)
+        self.writer = CoalescingWriter(self.serial_port, self.mode, self.max_rate, on_sent=self._sent_from_thread,
+                                       on_sending=self.latency.sent, on_unsent=self.latency.withdraw)
+        self.reader.start()
+        self.writer.start()
+
+    async def close(self):
+        """Flush pending commands, stop the I/O threads and close the port."""
+        if self.writer is None:
+            return
+        await self.loop.run_in_executor(None, self._close_blocking)
+        for channel in self.channels:
+            self.dose.set(channel, None)  # Whatever the box does now is not reported
+        for waiters in [*self._waiters.values(), self._event_waiters]:
+            for _, future in waiters:
+                future.cancel()
+            waiters.clear()
+
+    def _close_blocking(self):
+        writer, self.writer = self.writer, None
+        writer.stop()
+        self.reader.stop()
+        if self.serial_port.is_open:
+            try:
+                if self.mode == protocol.BINARY:
+                    self.serial_port.write(protocol.TEXT_REQUEST)  # Leave the box usable for text clients
+            except serial.SerialException:
+                pass
+            self.serial_port.close()
+
+    def add_listener(self, callback):
+        """Call callback(report) on the event loop for every report from the box."""
+        self.listeners.append(callback)
+
+    def add_schedule_listener(self, callback):
+        """Call callback(event) on the event loop for every protocol.ScheduleEvent from the box."""
+        self.schedule_listeners.append(callback)
+
+    def stats(self):
+        """Commands written versus coalesced away by the rate limiter."""
+        return self.writer.stats() if self.writer else {"sent": 0, "coalesced": 0}
+
+    # Commands. The *_nowait variants are thread-safe and return immediately.
+
+    def set_nowait(self, channel, value):
+        self._check(channel, value)
+        self.writer.submit(channel, value)
+
+    def set_many_nowait(self, values):
+        for channel, value in values.items():
+            self._check(channel, value)
+        self.writer.submit_many(dict(values))
+
+    async def set(self, channel, value, timeout=ACK_TIMEOUT):
+        """Set channel to value and return once the box confirms it."""
+        future = self._add_waiter(channel, value)
+        self.set_nowait(channel, value)
+        return await self._wait(future, timeout)
+
+    async def set_many(self, values, timeout=ACK_TIMEOUT):
+        """Set several channels ({channel: value}) in one command and wait for every confirmation."""
+        futures = [self._add_waiter(channel, value) for channel, value in values.items()]
+        self.set_many_nowait(values)
+        return [await self._wait(future, timeout) for future in futures]
+
+    async def get(self, channel, timeout=ACK_TIMEOUT):
+        """Return the brightness last reported for channel, asking the box if it has not reported yet."""
+        if self.brightness[channel] is None:
+            future = self._add_waiter(channel, None)
+            self.writer.submit_raw(protocol.GET_REQUEST)
+            await self._wait(future, timeout)
+        return self.brightness[channel]
+
+    # Irradiance in µW/cm², mapped to PWM through the calibration table
+
+    def calibration_for(self, channel):
+        calibration = self.calibration
+        if isinstance(calibration, dict):
+            calibration = calibration.get(channel)
+        if calibration is None:
+            raise RuntimeError(f"No irradiance calibration for channel {channel}")
+        return calibration
+
+    def set_irradiance_nowait(self, channel, target):
+        """Set channel to the PWM value closest to target µW/cm²; returns the irradiance.Setting."""
+        setting = self.calibration_for(channel).setting(target)
+        self.set_nowait(channel, setting.pwm)
+        return setting
+
+    async def set_irradiance(self, channel, target, timeout=ACK_TIMEOUT):
+        """Like set_irradiance_nowait(), returning the Setting once the box confirms it."""
+        setting = self.calibration_for(channel).setting(target)
+        await self.set(channel, setting.pwm, timeout)
+        return setting
+
+    def _reported_irradiance(self, channel, value):
+        calibration = self.calibration.get(channel) if isinstance(self.calibration, dict) else self.calibration
+        return None if calibration is None else calibration.irradiance(value)
+
+    def irradiance(self, channel):
+        """Irradiance of the brightness last reported for channel in µW/cm², None before the first report."""
+        if self.brightness[channel] is None:
+            return None
+        return self.calibration_for(channel).irradiance(self.brightness[channel])
+
+    # Schedules run by the firmware itself, see bluelight.upload
+
+    async def upload_schedule(self, schedule, timeout=UPLOAD_TIMEOUT):
+        """Upload a schedule table (or a Timeline, compiled first) and verify its checksum; returns the table.
+
+        Raises RuntimeError if the box has no schedule support, rejects the
+        table or received it corrupted. Uploading stops a running schedule.
+        """
+        table = schedule if isinstance(schedule, bytes) else compile_table(schedule)
+        self._check_open()
+        if self.mode != protocol.BINARY:
+            raise RuntimeError("Schedules need firmware with the binary protocol")
+        future = self._add_event_waiter(protocol.EVENT_CHECKSUM)
+        self.writer.submit_raw(protocol.encode_upload(table) + protocol.encode_schedule(protocol.SCHEDULE_CHECK))
+        event = await self._wait(future, timeout)
+        if event.event == protocol.EVENT_ERROR:
+            raise RuntimeError("The box rejected the schedule table")
+        if event.number != protocol.crc16(table):
+            raise RuntimeError("The schedule table arrived corrupted (checksum mismatch)")
+        return table
+
+    async def start_schedule(self, timeout=ACK_TIMEOUT):
+        """Start the uploaded schedule and return once the box confirms it."""
+        await self._schedule_command(protocol.SCHEDULE_START, protocol.EVENT_STARTED, timeout)
+
+    async def stop_schedule(self, timeout=ACK_TIMEOUT):
+        """Stop the running schedule; the box switches both LEDs off."""
+        await self._schedule_command(protocol.SCHEDULE_STOP, protocol.EVENT_STOPPED, timeout)
+
+    async def _schedule_command(self, op, confirmation, timeout):
+        self._check_open()
+        future = self._add_event_waiter(confirmation)
+        self.writer.submit_raw(protocol.encode_schedule(op))
+        event = await self._wait(future, timeout)
+        if event.event == protocol.EVENT_ERROR:
+            raise RuntimeError("The box has no valid schedule table, upload one first")
+
+    async def run_schedule(self, steps, switch_off=True):
+        """Apply each (values, seconds) step in turn, e.g. [({1: 255}, 600), ({1: 0}, 300)].
+
+        Step start times are absolute deadlines from the start of the schedule,
+        so sleeping late once does not shift the rest. The channels used are
+        switched off at the end, also when the task is cancelled. Returns the
+        actual start offsets of the steps in seconds.
+        """
+        start = self.loop.time()
+        offset = 0.0
+        started = []
+        used = set()
+        try:
+            for values, seconds in steps:
+                await asyncio.sleep(max(0.0, start + offset - self.loop.time()))
+                started.append(self.loop.time() - start)
+                self.set_many_nowait(values)
+                used.update(values)
+                offset += seconds
+            await asyncio.sleep(max(0.0, start + offset - self.loop.time()))
+        finally:
+            if switch_off and used and self.is_open:
+                self.set_many_nowait({channel: 0 for channel in used})
+        return started
+
+    def _check(self, channel, value):
+        if channel not in self.channels:
+            raise ValueError(f"Unknown channel {channel}, the box has {self.channels}")
+        if not 0 <= value <= 255:
+            raise ValueError("Brightness must be between 0 and 255.")
+        self._check_open()
+
+    def _check_open(self):
+        if self.writer is None:
+            raise RuntimeError("LightController is not open")
+
+    def _add_waiter(self, channel, value):
+        waiters = self._waiters[channel]
+        waiters[:] = [waiter for waiter in waiters if not waiter[1].done()]  # Drop timed out waiters
+        future = self.loop.create_future()
+        waiters.append((value, future))
+        return future
+
+    def _add_event_waiter(self, event):
+        """Future resolved by the next ScheduleEvent of kind event, or by EVENT_ERROR."""
+        self._event_waiters[:] = [waiter for waiter in self._event_waiters if not waiter[1].done()]
+        future = self.loop.create_future()
+        self._event_waiters.append(({event, protocol.EVENT_ERROR}, future))
+        return future
+
+    async def _wait(self, future, timeout):
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError("The box did not answer in time") from None
+
+    def _sent_from_thread(self, values, seq, sent_at):
+        if self.journal:
+            for channel, value in values.items():
+                self.journal.append(self.device_id, channel, value, SOURCE_COMMAND, sent_at)
+
+    def _report_from_thread(self, report):
+        if isinstance(report, protocol.Report):
+            received_at = time.monotonic()  # On the reader thread, before the hop to the loop
+            latency = self.latency.received(report, received_at)
+            if report.channel in self.brightness:
+                self.dose.set(report.channel, self._reported_irradiance(report.channel, report.value), received_at)
+            if self.journal and report.channel in self.brightness:
+                source = SOURCE_ACK if latency is not None else SOURCE_LOCAL
+                self.journal.append(self.device_id, report.channel, report.value, source, received_at)
+        self.loop.call_soon_threadsafe(self._handle_report, report)
+
+    def _handle_schedule_event(self, event):
+        remaining = []
+        for events, future in self._event_waiters:
+            if event.event in events:
+                if not future.done():
+                    future.set_result(event)
+            else:
+                remaining.append((events, future))
+        self._event_waiters[:] = remaining
+        for callback in self.schedule_listeners:
+            callback(event)
+
+    def _handle_report(self, report):
+        if isinstance(report, protocol.ScheduleEvent):
+            self._handle_schedule_event(report)
+            return
+        if report.channel not in self.brightness:
+            return
+        self.brightness[report.channel] = report.value
+        # A report confirms its own value and every older request it superseded
+        waiters = self._waiters[report.channel]
+        matched = max((index + 1 for index, (value, _) in enumerate(waiters) if value == report.value), default=0)
+        remaining = []
+        for index, (value, future) in enumerate(waiters):
+            if index < matched or value is None:
+                if not future.done():
+                    future.set_result(report.value)
+            else:
+                remaining.append((value, future))
+        waiters[:] = remaining
+        for callback in self.listeners:
+            callback(report)
+
+
+class EventLoopThread(threading.Thread):
+    """Run an asyncio event loop in the background for synchronous callers such as the GUI."""
+
+    def __init__(self):
+        super().__init__(name="bluelight-loop", daemon=True)
+        self.loop = asyncio.new_event_loop()
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coroutine):
+        """Schedule coroutine on the loop and return a concurrent.futures.Future for its result."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.join()
+        self.loop.close()
@@ -0,0 +1,125 @@
+"""Light dose delivered per channel, integrated as the brightness changes.
+
+The irradiance is constant between two brightness changes, so the dose is
+advanced by irradiance × elapsed time at each change and nothing is ever
+rescanned. :class:`LightController` feeds it the brightness the box reports,
+converted through its calibration, so changes made on the box count too::
+
+    box = LightController("/dev/ttyACM0", calibration=load_table())
+    ...
+    box.dose.dose(1)                      # µJ/cm² on channel 1 so far
+    box.dose.add_target(1, 1.8e9)         # Another 1800 J/cm² from now
+    for result in box.dose.expire():      # At box.dose.next_deadline()
+        box.set_many_nowait({result.channel: 0})
+
+Targets work like :class:`~bluelight.ExposureScheduler` deadlines, but the
+deadline moves with every brightness change: it is the moment the target is
+reached at the current irradiance. An irradiance of None (brightness
+unknown, e.g. after the controller closed) adds nothing until the next value.
+"""
+
+import threading
+import time
+from collections import namedtuple
+
+DoseResult = namedtuple("DoseResult", ["channel", "target", "dose", "seconds"])
+DoseResult.__doc__ = """A reached dose target: target and delivered dose in µJ/cm², and the seconds it took."""
+
+
+class _Channel:
+    def __init__(self, now):
+        self.irradiance = None  # µW/cm² since `since`, None while unknown
+        self.since = now
+        self.dose = 0.0  # µJ/cm² up to `since`
+        self.target = None  # (dose to reach, dose at the start, start time)
+
+
+class DoseIntegrator:
+    """Cumulative dose of each channel in µJ/cm² from piecewise constant irradiance in µW/cm².
+
+    Thread-safe: the controller updates it on the serial reader thread while
+    the GUI reads it.
+    """
+
+    def __init__(self, channels=(1, 2), clock=time.monotonic):
+        self.clock = clock
+        self.lock = threading.Lock()
+        now = clock()
+        self.channels = {channel: _Channel(now) for channel in channels}
+
+    def _advance(self, state, now):
+        if state.irradiance is not None and now > state.since:
+            state.dose += state.irradiance * (now - state.since)
+        state.since = max(state.since, now)
+
+    def set(self, channel, irradiance, at=None):
+        """The irradiance of channel changed at monotonic time at (now by default)."""
+        with self.lock:
+            state = self.channels[channel]
+            self._advance(state, self.clock() if at is None else at)
+            state.irradiance = irradiance
+
+    def dose(self, channel, at=None):
+        """Dose delivered on channel up to at (now by default), in µJ/cm²."""
+        with self.lock:
+            state = self.channels[channel]
+            now = self.clock() if at is None else at
+            if state.irradiance is None or now <= state.since:
+                return state.dose
+            return state.dose + state.irradiance * (now - state.since)
+
+    def reset(self, channel):
+        """Start counting channel from zero; a target is cancelled."""
+        with self.lock:
+            state = self.channels[channel]
+            self._advance(state, self.clock())
+            state.dose = 0.0
+            state.target = None
+
+    def add_target(self, channel, dose):
+        """Stop channel (see expire()) once another dose µJ/cm² has been delivered from now."""
+        with self.lock:
+            state = self.channels[channel]
+            now = self.clock()
+            self._advance(state, now)
+            state.target = (state.dose + dose, state.dose, now)
+
+    def cancel_target(self, channel):
+        with self.lock:
+            self.channels[channel].target = None
+
+    def has_target(self, channel):
+        return self.channels[channel].target is not None
+
+    def remaining(self, channel):
+        """Dose still missing to the target of channel in µJ/cm², 0.0 without a target."""
+        state = self.channels[channel]
+        if state.target is None:
+            return 0.0
+        return max(0.0, state.target[0] - self.dose(channel))
+
+    def next_deadline(self):
+        """Monotonic time at which the first target is reached at the current irradiances, or None."""
+        deadlines = []
+        with self.lock:
+            for state in self.channels.values():
+                if state.target is None or not state.irradiance:
+                    continue
+                deadlines.append(state.since + max(0.0, state.target[0] - state.dose) / state.irradiance)
+        return min(deadlines, default=None)
+
+    def expire(self):
+        """Remove every target that has been reached and return their DoseResults."""
+        finished = []
+        with self.lock:
+            now = self.clock()
+            for channel, state in self.channels.items():
+                if state.target is None:
+                    continue
+                self._advance(state, now)
+                target, start_dose, started_at = state.target
+                if state.dose >= target:
+                    state.target = None
+                    finished.append(DoseResult(channel, target - start_dose, state.dose - start_dose,
+                                               now - started_at))
+        return finished
@@ -0,0 +1,91 @@
+"""Exposure timers with absolute deadlines.
+
+Each running exposure stores the monotonic time at which its LED must be
+switched off instead of a counter decremented on every tick, so late timer
+callbacks never add up and pausing is exact. The scheduler has no timer of
+its own; the owner calls :meth:`ExposureScheduler.expire` at
+:meth:`~ExposureScheduler.next_deadline` (the GUI uses one precise QTimer
+for all channels)::
+
+    exposures = ExposureScheduler()
+    exposures.start(1, 60 * 60)
+    ...
+    for result in exposures.expire():
+        box.set_many_nowait({result.channel: 0})
+"""
+
+import time
+from collections import namedtuple
+
+ExposureResult = namedtuple("ExposureResult", ["channel", "requested", "actual", "late"])
+ExposureResult.__doc__ = """A finished exposure: requested and actual on-time, and how late it was stopped, in seconds."""
+
+
+class _Exposure:
+    def __init__(self, seconds, now):
+        self.requested = seconds
+        self.started_at = now
+        self.deadline = now + seconds
+        self.paused_at = None
+        self.paused_total = 0.0
+
+
+class ExposureScheduler:
+    """Track one exposure per channel by its absolute deadline."""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.exposures = {}  # Channel -> _Exposure
+
+    def start(self, channel, seconds):
+        """Start (or restart) an exposure of seconds on channel."""
+        self.exposures[channel] = _Exposure(seconds, self.clock())
+
+    def cancel(self, channel):
+        self.exposures.pop(channel, None)
+
+    def pause(self, channel):
+        """Stop the clock of channel; the owner switches its LED off, the actual on-time leaves the pause out."""
+        exposure = self.exposures.get(channel)
+        if exposure and exposure.paused_at is None:
+            exposure.paused_at = self.clock()
+
+    def resume(self, channel):
+        """Continue a paused exposure; the deadline moves by exactly the paused time."""
+        exposure = self.exposures.get(channel)
+        if exposure and exposure.paused_at is not None:
+            paused = self.clock() - exposure.paused_at
+            exposure.deadline += paused
+            exposure.paused_total += paused
+            exposure.paused_at = None
+
+    def is_running(self, channel):
+        return channel in self.exposures
+
+    def is_paused(self, channel):
+        exposure = self.exposures.get(channel)
+        return bool(exposure and exposure.paused_at is not None)
+
+    def remaining(self, channel):
+        """Seconds left on channel (frozen while paused), or 0.0 if nothing is running."""
+        exposure = self.exposures.get(channel)
+        if exposure is None:
+            return 0.0
+        now = exposure.paused_at if exposure.paused_at is not None else self.clock()
+        return max(0.0, exposure.deadline - now)
+
+    def next_deadline(self):
+        """Earliest deadline of the running (not paused) exposures, or None."""
+        deadlines = [e.deadline for e in self.exposures.values() if e.paused_at is None]
+        return min(deadlines, default=None)
+
+    def expire(self):
+        """Remove every exposure whose deadline has passed and return their ExposureResults."""
+        now = self.clock()
+        finished = []
+        for channel, exposure in list(self.exposures.items()):
+            if exposure.paused_at is None and exposure.deadline <= now:
+                del self.exposures[channel]
+                actual = now - exposure.started_at - exposure.paused_total
+                finished.append(ExposureResult(channel, exposure.requested, actual, now - exposure.deadline))
+        return finished
@@ -0,0 +1,102 @@
+"""Irradiance calibration: PWM value <-> irradiance in µW/cm².
+
+The fit ``a*ln(x) + b`` of ``Data/CSV/PWMtoIntensity.csv`` (the same one
+``Data/Graph4/graph1.py`` plots) is evaluated once for all 256 PWM values.
+Both directions are then table lookups that accept scalars or NumPy arrays::
+
+    table = load_table()
+    table.irradiance(128)              # µW/cm² at PWM 128
+    table.setting(250000)              # Setting(pwm, irradiance, error) for a target
+    LightController(port, calibration=table).set_irradiance_nowait(1, 250000)
+
+:func:`load_table` caches the table for each calibration file until the
+file changes. PWM 0 switches the LED off and maps to 0 µW/cm².
+:mod:`bluelight.calibration` picks the best of several models instead and
+assigns calibrations to the LEDs of each box.
+"""
+
+import functools
+import os
+from collections import namedtuple
+
+import numpy as np
+
+DEFAULT_CALIBRATION = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "Data", "CSV", "PWMtoIntensity.csv"
+)
+PWM_COLUMN = "Intenzita program PWM 8bit"
+IRRADIANCE_COLUMN = "Intesity uW/cm2"
+PWM_LEVELS = 256
+
+Setting = namedtuple("Setting", ["pwm", "irradiance", "error"])
+Setting.__doc__ = """PWM value chosen for a target, the irradiance it gives and achieved minus target, in µW/cm²."""
+
+
+def read_calibration_csv(path):
+    """Return (pwm, irradiance) arrays from a ';'-separated calibration CSV with decimal commas."""
+    with open(path, encoding="utf-8-sig") as file:
+        header = file.readline().strip().split(";")
+        pwm_index, irradiance_index = header.index(PWM_COLUMN), header.index(IRRADIANCE_COLUMN)
+        rows = [line.strip().split(";") for line in file if line.strip()]
+    pwm = np.array([float(row[pwm_index].replace(",", ".")) for row in rows])
+    irradiance = np.array([float(row[irradiance_index].replace(",", ".")) for row in rows])
+    return pwm, irradiance
+
+
+def fit_log(pwm, irradiance):
+    """Least-squares a, b of irradiance = a*ln(pwm) + b."""
+    a, b = np.polyfit(np.log(pwm), irradiance, 1)
+    return a, b
+
+
+class IrradianceTable:
+    """Irradiance of each of the 256 PWM values, non-decreasing so the inverse is well defined."""
+
+    def __init__(self, values):
+        values = np.clip(np.asarray(values, dtype=float), 0.0, None)
+        values[0] = 0.0
+        self.values = np.maximum.accumulate(values)
+        self.values.flags.writeable = False
+
+    @classmethod
+    def from_log_fit(cls, a, b):
+        values = np.zeros(PWM_LEVELS)
+        values[1:] = a * np.log(np.arange(1, PWM_LEVELS)) + b
+        return cls(values)
+
+    @property
+    def max_irradiance(self):
+        return float(self.values[-1])
+
+    def irradiance(self, pwm):
+        """Irradiance at pwm (int or integer array)."""
+        result = self.values[np.asarray(pwm, dtype=int)]
+        return float(result) if result.ndim == 0 else result
+
+    def pwm(self, target):
+        """PWM value whose irradiance is closest to target (number or array); targets beyond the range clamp."""
+        target = np.asarray(target, dtype=float)
+        upper = np.clip(np.searchsorted(self.values, target), 1, PWM_LEVELS - 1)
+        lower = upper - 1
+        closer_lower = np.abs(target - self.values[lower]) <= np.abs(self.values[upper] - target)
+        result = np.where(closer_lower, lower, upper)
+        return int(result) if result.ndim == 0 else result
+
+    def setting(self, target):
+        """Setting for target: the PWM value, the irradiance it gives and the quantization error."""
+        pwm = self.pwm(target)
+        achieved = self.irradiance(pwm)
+        error = np.subtract(achieved, target)
+        return Setting(pwm, achieved, float(error) if error.ndim == 0 else error)
+
+
+@functools.lru_cache(maxsize=8)
+def _load_table(path, mtime, size):
+    return IrradianceTable.from_log_fit(*fit_log(*read_calibration_csv(path)))
+
+
+def load_table(path=DEFAULT_CALIBRATION):
+    """IrradianceTable of the log fit of a calibration CSV, rebuilt only when the file changes."""
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    return _load_table(path, stat.st_mtime_ns, stat.st_size)
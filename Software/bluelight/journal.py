@@ -0,0 +1,146 @@
+"""Append-only journal of every brightness change, in a memory-mapped file.
+
+Each change is one fixed 24-byte record (:func:`record_dtype`): monotonic time,
+wall time, device, channel, value and source (a command sent by the host,
+the box acknowledging one, or a change made on the box itself). The file is
+preallocated and mapped into memory, so appending a record is a memory
+write without a system call; it only grows (by doubling) when full::
+
+    journal = Journal("exposure.bljournal")
+    box = LightController("/dev/ttyACM0", journal=journal)
+
+    records, devices = read_journal("exposure.bljournal")
+    on = records[(records["source"] == SOURCE_ACK) & (records["value"] > 0)]
+
+:func:`read_journal` maps the file read-only and returns the records as a
+NumPy structured array view, without copying them.
+"""
+
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+
+MAGIC = b"BLJOURN1"
+HEADER_SIZE = 4096
+INITIAL_CAPACITY = 65536  # Records preallocated in a new file (1.5 MB)
+
+SOURCE_COMMAND = 0  # The host wrote a SET
+SOURCE_ACK = 1  # The box confirmed a host command
+SOURCE_LOCAL = 2  # Encoder, buttons or an uploaded schedule changed the brightness
+SOURCE_NAMES = {SOURCE_COMMAND: "command", SOURCE_ACK: "ack", SOURCE_LOCAL: "local"}
+
+# magic, header size, record size, capacity, count; device names follow as JSON
+_HEADER = struct.Struct("<8sIIQQ")
+_COUNT_OFFSET = 24
+_DEVICES_OFFSET = 64
+_RECORD = struct.Struct("<ddHBBB3x")
+
+
+def record_dtype():
+    import numpy as np
+
+    return np.dtype({
+        "names": ["mono", "wall", "device", "channel", "value", "source"],
+        "formats": ["<f8", "<f8", "<u2", "u1", "u1", "u1"],
+        "offsets": [0, 8, 16, 18, 19, 20],
+        "itemsize": _RECORD.size,
+    })
+
+
+class Journal:
+    """Writer side of a journal file, safe to share between threads and controllers."""
+
+    def __init__(self, path, capacity=INITIAL_CAPACITY):
+        self.path = path
+        self.lock = threading.Lock()
+        exists = os.path.exists(path) and os.path.getsize(path) >= HEADER_SIZE
+        self.file = open(path, "r+b" if exists else "w+b")
+        if exists:
+            self.map = mmap.mmap(self.file.fileno(), 0)
+            magic, _, record_size, self.capacity, self.count = _HEADER.unpack_from(self.map)
+            if magic != MAGIC or record_size != _RECORD.size:
+                self.map.close()
+                self.file.close()
+                raise ValueError(f"{path} is not a BlueLight journal")
+            self.devices = _read_devices(self.map)
+        else:
+            self.capacity = capacity
+            self.count = 0
+            self.devices = []
+            self.file.truncate(HEADER_SIZE + capacity * _RECORD.size)
+            self.map = mmap.mmap(self.file.fileno(), 0)
+            _HEADER.pack_into(self.map, 0, MAGIC, HEADER_SIZE, _RECORD.size, capacity, 0)
+            self._write_devices()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def device_id(self, name):
+        """Number of the device called name, registering it on first use."""
+        with self.lock:
+            if name not in self.devices:
+                self.devices.append(name)
+                self._write_devices()
+            return self.devices.index(name)
+
+    def append(self, device, channel, value, source, mono=None, wall=None):
+        """Add one record; device is the number from device_id()."""
+        mono = time.monotonic() if mono is None else mono
+        wall = time.time() if wall is None else wall
+        with self.lock:
+            if self.count == self.capacity:
+                self._grow()
+            _RECORD.pack_into(self.map, HEADER_SIZE + self.count * _RECORD.size,
+                              mono, wall, device, channel, value, source)
+            self.count += 1
+            struct.pack_into("<Q", self.map, _COUNT_OFFSET, self.count)  # After the record, readers never see half of one
+
+    def flush(self):
+        with self.lock:
+            self.map.flush()
+
+    def close(self):
+        with self.lock:
+            if self.map.closed:
+                return
+            self.map.flush()
+            self.map.close()
+            self.file.close()
+
+    def _grow(self):
+        self.map.flush()
+        self.map.close()
+        self.capacity *= 2
+        self.file.truncate(HEADER_SIZE + self.capacity * _RECORD.size)
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        struct.pack_into("<Q", self.map, 16, self.capacity)
+
+    def _write_devices(self):
+        data = json.dumps(self.devices).encode()
+        if len(data) >= HEADER_SIZE - _DEVICES_OFFSET:
+            raise ValueError("Too many devices for the journal header")
+        self.map[_DEVICES_OFFSET:_DEVICES_OFFSET + len(data) + 1] = data + b"\0"
+
+
+def _read_devices(buffer):
+    end = buffer.find(b"\0", _DEVICES_OFFSET, HEADER_SIZE)
+    return json.loads(bytes(buffer[_DEVICES_OFFSET:end]))
+
+
+def read_journal(path):
+    """Return (records, device names) of a journal; records is a structured NumPy view of the mapped file."""
+    import numpy as np
+
+    with open(path, "rb") as file:
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, header_size, record_size, _, count = _HEADER.unpack_from(buffer)
+    if magic != MAGIC or record_size != _RECORD.size:
+        raise ValueError(f"{path} is not a BlueLight journal")
+    records = np.frombuffer(buffer, dtype=record_dtype(), count=count, offset=header_size)
+    return records, _read_devices(buffer)
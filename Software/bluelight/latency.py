@@ -0,0 +1,146 @@
+"""Round-trip latency of SET commands, from the write to the box's echo.
+
+:class:`LatencyTracker` is fed by the writer thread (:meth:`~LatencyTracker.sent`)
+and the reader thread (:meth:`~LatencyTracker.received`) of a
+:class:`bluelight.LightController`, available as ``controller.latency``.
+Samples go into a fixed log-bucket :class:`Histogram` per channel, so
+recording costs the same after a week as after a minute.
+
+Binary echoes carry the sequence number of the command they answer. Text
+echoes do not, so they are matched to the oldest outstanding command with
+the same value. The firmware echoes every SET, also one that leaves the
+brightness as it was, and answers in the order the commands arrive; a
+command overtaken by the echo of a later one has lost its echo and is
+counted as unanswered. Commands are registered before they are written,
+so even an echo that is read before the write returns finds its command.
+"""
+
+import csv
+import math
+import threading
+import time
+from collections import deque
+
+from . import protocol
+
+MIN_LATENCY = 0.0001  # Lower edge of the first bucket in seconds
+MAX_LATENCY = 60.0  # Everything slower lands in the last bucket
+BUCKET_GROWTH = 1.05  # Each bucket is 5 % wider than the previous one
+MAX_PENDING = 256  # Outstanding commands remembered per channel
+
+
+class Histogram:
+    """Counts of latencies in logarithmic buckets; quantiles are accurate to one bucket (5 %)."""
+
+    def __init__(self):
+        self.log_growth = math.log(BUCKET_GROWTH)
+        self.size = int(math.log(MAX_LATENCY / MIN_LATENCY) / self.log_growth) + 2
+        self.counts = [0] * self.size
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def edges(self, index):
+        """Lower and upper limit of bucket index in seconds (bucket 0 holds everything below MIN_LATENCY)."""
+        if index == 0:
+            return 0.0, MIN_LATENCY
+        return MIN_LATENCY * BUCKET_GROWTH ** (index - 1), MIN_LATENCY * BUCKET_GROWTH ** index
+
+    def record(self, seconds):
+        if seconds < MIN_LATENCY:
+            index = 0
+        else:
+            index = min(self.size - 1, int(math.log(seconds / MIN_LATENCY) / self.log_growth) + 1)
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """Upper edge of the bucket holding the q-quantile (0 < q <= 1), capped at the maximum seen."""
+        if not self.count:
+            return None
+        rank = math.ceil(q * self.count)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self.edges(index)[1], self.max)
+        return self.max
+
+
+class LatencyTracker:
+    """Match written commands with their echoes and keep a Histogram per channel (thread-safe)."""
+
+    def __init__(self, channels=(1, 2), clock=time.monotonic):
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.histograms = {channel: Histogram() for channel in channels}
+        self.pending = {channel: deque(maxlen=MAX_PENDING) for channel in channels}  # (seq, value, sent at)
+        self.unanswered = {channel: 0 for channel in channels}
+
+    def sent(self, values, seq, sent_at=None):
+        """Record that a command setting values ({channel: value}) was written with sequence number seq."""
+        sent_at = self.clock() if sent_at is None else sent_at
+        with self.lock:
+            for channel, value in values.items():
+                if channel in self.pending:
+                    self.pending[channel].append((seq, value, sent_at))
+
+    def withdraw(self, values, seq):
+        """Forget a command registered with sent() whose write failed."""
+        with self.lock:
+            for channel in values:
+                if channel in self.pending:
+                    pending = self.pending[channel]
+                    kept = [entry for entry in pending if entry[0] != seq]
+                    pending.clear()
+                    pending.extend(kept)
+
+    def received(self, report, received_at=None):
+        """Match report with the command it answers; returns the latency in seconds or None."""
+        received_at = self.clock() if received_at is None else received_at
+        with self.lock:
+            pending = self.pending.get(report.channel)
+            if not pending or report.seq == protocol.LOCAL_SEQ:
+                return None  # Encoder, buttons, or an echo of a command from before the tracker started
+            if report.seq is None:
+                matched = next((index for index, (_, value, _) in enumerate(pending) if value == report.value), None)
+            else:
+                matched = next((index for index, (seq, _, _) in enumerate(pending) if seq == report.seq), None)
+            if matched is None:
+                return None
+            for _ in range(matched):
+                pending.popleft()
+            self.unanswered[report.channel] += matched
+            _, _, sent_at = pending.popleft()
+            latency = received_at - sent_at
+            self.histograms[report.channel].record(latency)
+            return latency
+
+    def summary(self):
+        """{channel: {"count", "unanswered", "p50", "p99", "max"}}, latencies in milliseconds."""
+        with self.lock:
+            result = {}
+            for channel, histogram in self.histograms.items():
+                row = {"count": histogram.count, "unanswered": self.unanswered[channel]}
+                for key, q in (("p50", 0.5), ("p99", 0.99)):
+                    value = histogram.quantile(q)
+                    row[key] = None if value is None else value * 1000
+                row["max"] = histogram.max * 1000 if histogram.count else None
+                result[channel] = row
+            return result
+
+    def write_csv(self, path):
+        """Write the non-empty buckets of every channel as channel, low_ms, high_ms, count rows."""
+        with self.lock:
+            rows = []
+            for channel, histogram in self.histograms.items():
+                for index, count in enumerate(histogram.counts):
+                    if count:
+                        low, high = histogram.edges(index)
+                        rows.append((channel, f"{low * 1000:.4f}", f"{high * 1000:.4f}", count))
+        with open(path, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(["channel", "low_ms", "high_ms", "count"])
+            writer.writerows(rows)
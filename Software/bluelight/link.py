@@ -0,0 +1,198 @@
+"""Background I/O threads for one serial connection.
+
+Neither thread touches Qt or asyncio; they hand data over through plain
+callbacks, so they can sit behind :class:`bluelight.LightController` or be
+used directly.
+"""
+
+import select
+import threading
+import time
+
+import serial
+
+from . import protocol
+
+MAX_COMMAND_RATE = 20  # Maximum SET commands per second for each LED
+READ_POLL_INTERVAL = 0.01  # Seconds the reader waits for input before checking for stop()
+
+
+class SerialReader(threading.Thread):
+    """Decode reports from the port and pass each one to on_report (called on this thread)."""
+
+    def __init__(self, serial_port, on_report):
+        super().__init__(name="bluelight-reader", daemon=True)
+        self.serial_port = serial_port
+        self.on_report = on_report
+        self.decoder = protocol.Decoder()
+        self.stop_event = threading.Event()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            if not (self.serial_port and self.serial_port.is_open):
+                self.stop_event.wait(READ_POLL_INTERVAL)
+                continue
+            try:
+                data = self.read_available()
+            except (OSError, ValueError, serial.SerialException):
+                self.stop_event.wait(READ_POLL_INTERVAL)
+                continue
+            for report in self.decoder.feed(data):
+                self.on_report(report)
+
+    def read_available(self):
+        """Wait up to READ_POLL_INTERVAL for input and return every byte that is ready."""
+        try:
+            fd = self.serial_port.fileno()
+        except (AttributeError, OSError, ValueError):
+            fd = None  # No selectable descriptor (e.g. Windows), fall back to polling
+        if fd is not None:
+            ready, _, _ = select.select([fd], [], [], READ_POLL_INTERVAL)
+            if not ready:
+                return b""
+        waiting = self.serial_port.in_waiting
+        if not waiting:
+            if fd is None:
+                self.stop_event.wait(READ_POLL_INTERVAL)
+            return b""
+        return self.serial_port.read(waiting)
+
+    def stop(self):
+        self.stop_event.set()
+        if self.is_alive():
+            self.join()
+
+
+class CoalescingWriter(threading.Thread):
+    """Write SET commands off the caller's thread, keeping only the latest value per LED.
+
+    on_sending(values, seq, time) is called on this thread just before each SET
+    command is written, so the box cannot answer a command that is not
+    registered yet, and on_unsent(values, seq) if the write then fails.
+    on_sent(values, seq, time) is called once it is written.
+    """
+
+    def __init__(self, serial_port, mode=protocol.TEXT, max_rate=MAX_COMMAND_RATE, on_sent=None, on_sending=None,
+                 on_unsent=None):
+        super().__init__(name="bluelight-writer", daemon=True)
+        self.serial_port = serial_port
+        self.mode = mode
+        self.on_sent = on_sent
+        self.on_sending = on_sending
+        self.on_unsent = on_unsent
+        self.seq = protocol.LOCAL_SEQ
+        self.min_interval = 1.0 / max_rate
+        self.pending = {}  # LED ID -> latest value not yet written
+        self.pending_many = {}  # LED ID -> value, written together as one command
+        self.pending_raw = []  # Other commands, already encoded
+        self.last_sent = {}  # LED ID -> monotonic time of the last write
+        self.sent_count = 0
+        self.coalesced_count = 0
+        self.condition = threading.Condition()
+        self.running = True
+
+    def submit(self, led_id, value):
+        with self.condition:
+            if led_id in self.pending:
+                self.coalesced_count += 1
+            self.pending[led_id] = value
+            self.condition.notify()
+
+    def submit_many(self, values):
+        """Queue values ({LED ID: value}) to be applied together in one command."""
+        with self.condition:
+            for led_id in values:
+                if self.pending.pop(led_id, None) is not None or led_id in self.pending_many:
+                    self.coalesced_count += 1
+            self.pending_many.update(values)
+            self.condition.notify()
+
+    def submit_raw(self, data):
+        """Queue an already encoded command such as protocol.GET_REQUEST."""
+        with self.condition:
+            self.pending_raw.append(data)
+            self.condition.notify()
+
+    def stats(self):
+        with self.condition:
+            return {"sent": self.sent_count, "coalesced": self.coalesced_count}
+
+    def run(self):
+        while True:
+            with self.condition:
+                due, wait_time = self._take_due()
+                while self.running and not due:
+                    self.condition.wait(wait_time)
+                    due, wait_time = self._take_due()
+                if not self.running:
+                    # Flush whatever is left so the last requested value is not lost
+                    due.extend({led_id: value} for led_id, value in self.pending.items())
+                    self.pending = {}
+            self._write(due)
+            if not self.running:
+                break
+
+    def _take_due(self):
+        """Pop the commands that may be sent now; return them with the time until the next one may.
+
+        Each command is a {LED ID: value} dict or encoded bytes. Only single-LED
+        commands are rate limited.
+        """
+        now = time.monotonic()
+        due = self.pending_raw
+        self.pending_raw = []
+        wait_time = None
+        if self.pending_many:
+            due.append(self.pending_many)
+            for led_id in self.pending_many:
+                self.last_sent[led_id] = now
+            self.pending_many = {}
+        for led_id in list(self.pending):
+            ready_at = self.last_sent.get(led_id, 0.0) + self.min_interval
+            if ready_at <= now:
+                due.append({led_id: self.pending.pop(led_id)})
+                self.last_sent[led_id] = now
+            elif wait_time is None or ready_at - now < wait_time:
+                wait_time = ready_at - now
+        return due, wait_time
+
+    def _write(self, commands):
+        if not commands or not (self.serial_port and self.serial_port.is_open):
+            return
+        data = bytearray()
+        sent = []
+        for values in commands:
+            if isinstance(values, bytes):
+                data += values
+                continue
+            self.seq = protocol.next_seq(self.seq)
+            sent.append((values, self.seq))
+            if len(values) > 1 and self.mode == protocol.BINARY:
+                data += protocol.encode_set_many(values, self.mode, self.seq)
+            else:
+                # Text mode may be old firmware without SETM, send the SETs back to back
+                for led_id, value in values.items():
+                    data += protocol.encode_set(led_id, value, self.mode, self.seq)
+        sent_at = time.monotonic()
+        if self.on_sending:
+            for values, seq in sent:
+                self.on_sending(values, seq, sent_at)
+        try:
+            self.serial_port.write(data)
+        except serial.SerialException:
+            if self.on_unsent:
+                for values, seq in sent:
+                    self.on_unsent(values, seq)
+            return
+        with self.condition:
+            self.sent_count += len(sent)
+        if self.on_sent:
+            for values, seq in sent:
+                self.on_sent(values, seq, sent_at)
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.is_alive():
+            self.join()
@@ -0,0 +1,104 @@
+"""Discovery and concurrent control of several boxes.
+
+Each box keeps its own :class:`~bluelight.LightController` with its own
+reader and writer threads, so a command for one box never waits for
+another; the manager only fans calls out on one event loop::
+
+    async with DeviceManager() as boxes:
+        await boxes.set_many_all({1: 255, 2: 255})
+        await boxes.run_schedules({port: steps for port in boxes})
+        await boxes.start_schedules({port: timeline for port in boxes})  # Run by the firmware
+"""
+
+import asyncio
+
+from serial.tools import list_ports
+
+from .controller import ACK_TIMEOUT, LightController
+
+# USB vendor/product IDs of the Arduino Leonardo inside the box
+BOX_USB_IDS = frozenset({
+    (0x2341, 0x8036),  # Arduino LLC
+    (0x2A03, 0x8036),  # Arduino SRL
+})
+
+
+def find_boxes(usb_ids=BOX_USB_IDS):
+    """Return the list_ports entries of every connected box, sorted by port name."""
+    ports = [port for port in list_ports.comports() if (port.vid, port.pid) in usb_ids]
+    return sorted(ports, key=lambda port: port.device)
+
+
+class DeviceManager:
+    """Open every box (or the given port names) and drive them from one event loop.
+
+    Boxes are keyed by port name; iterate the manager or use ``manager[port]``
+    to reach a single :class:`~bluelight.LightController`.
+    """
+
+    def __init__(self, ports=None, usb_ids=BOX_USB_IDS, **controller_options):
+        self.ports = ports
+        self.usb_ids = usb_ids
+        self.controller_options = controller_options
+        self.controllers = {}
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def __getitem__(self, port):
+        return self.controllers[port]
+
+    def __iter__(self):
+        return iter(self.controllers)
+
+    def __len__(self):
+        return len(self.controllers)
+
+    async def open(self):
+        """Open all boxes in parallel; boxes that fail to open are closed again and the error is raised."""
+        ports = self.ports
+        if ports is None:
+            ports = [port.device for port in find_boxes(self.usb_ids)]
+        controllers = {port: LightController(port, **self.controller_options) for port in ports}
+        results = await asyncio.gather(*(c.open() for c in controllers.values()), return_exceptions=True)
+        errors = [result for result in results if isinstance(result, BaseException)]
+        self.controllers = {port: c for port, c in controllers.items() if c.is_open}
+        if errors:
+            await self.close()
+            raise errors[0]
+
+    async def close(self):
+        await asyncio.gather(*(c.close() for c in self.controllers.values()))
+        self.controllers = {}
+
+    async def set_many(self, values_by_port, timeout=ACK_TIMEOUT):
+        """Apply {port: {channel: value}} to each box at once and wait for the confirmations."""
+        coroutines = [self.controllers[port].set_many(values, timeout) for port, values in values_by_port.items()]
+        results = await asyncio.gather(*coroutines)
+        return dict(zip(values_by_port, results))
+
+    async def set_many_all(self, values, timeout=ACK_TIMEOUT):
+        """Apply the same {channel: value} to every box."""
+        return await self.set_many({port: values for port in self.controllers}, timeout)
+
+    async def start_schedules(self, schedules_by_port):
+        """Upload {port: table or Timeline} to every box, verify all of them, then start them together.
+
+        Nothing starts unless every upload succeeded.
+        """
+        uploads = [self.controllers[port].upload_schedule(schedule) for port, schedule in schedules_by_port.items()]
+        await asyncio.gather(*uploads)
+        await asyncio.gather(*(self.controllers[port].start_schedule() for port in schedules_by_port))
+
+    async def stop_schedules(self):
+        await asyncio.gather(*(c.stop_schedule() for c in self.controllers.values()))
+
+    async def run_schedules(self, steps_by_port, switch_off=True):
+        """Run a schedule on each box concurrently; returns {port: actual step start offsets}."""
+        coroutines = [self.controllers[port].run_schedule(steps, switch_off) for port, steps in steps_by_port.items()]
+        results = await asyncio.gather(*coroutines)
+        return dict(zip(steps_by_port, results))
@@ -0,0 +1,255 @@
+"""Illumination programs: steps, ramps and repeats compiled into a timeline.
+
+A program is a list of segments per channel::
+
+    program = {
+        1: [Step(128, 60), Ramp(128, 255, 30), Repeat(10, [Step(255, 1), Step(0, 1)])],
+        2: parse_program("40 1h"),
+    }
+    timeline = compile_program(program)
+
+Durations are in seconds. :func:`compile_program` expands ramps and repeats
+up front and keeps only the moments where a value changes, merging channels
+that change at the same time into one command. The timeline runs either
+headless (``await box.run_schedule(timeline.steps())``) or with a
+:class:`ProgramRunner` driven by the caller's timer, as the GUI does.
+
+:func:`parse_program` reads the text form used in the GUI, one segment per
+line, durations in minutes unless suffixed with ``s``, ``min`` or ``h``::
+
+    # L1, L15, L40 series with dark pauses
+    1 60
+    0 5
+    15 60
+    ramp 15 40 30s
+    repeat 3
+        255 10s
+        0 50s
+    end
+"""
+
+import re
+import time
+from collections import namedtuple
+
+from .exposure import ExposureScheduler
+
+RAMP_INTERVAL = 0.05  # Shortest time between two ramp values, matches the writer's 20 commands/s
+
+Step = namedtuple("Step", ["value", "seconds"])
+Ramp = namedtuple("Ramp", ["start", "end", "seconds"])
+Repeat = namedtuple("Repeat", ["times", "segments"])
+
+Segment = namedtuple("Segment", ["start", "end", "label"])
+Segment.__doc__ = """One expanded step or ramp of the timeline, for progress display (times in seconds)."""
+
+_DURATION = re.compile(r"^(\d+(?:\.\d+)?)(s|min|h)?$")
+_UNITS = {"s": 1, "min": 60, "h": 3600, None: 60}
+
+
+def _check_value(value):
+    if not 0 <= value <= 255:
+        raise ValueError(f"Brightness must be between 0 and 255, got {value}")
+
+
+def _expand(segments, offset, points, labels):
+    """Append (time, value) points and Segment labels for segments starting at offset; return the end time."""
+    for segment in segments:
+        if isinstance(segment, Repeat):
+            for _ in range(segment.times):
+                offset = _expand(segment.segments, offset, points, labels)
+            continue
+        if segment.seconds <= 0:
+            raise ValueError(f"Segment duration must be positive: {segment}")
+        if isinstance(segment, Step):
+            _check_value(segment.value)
+            points.append((offset, segment.value))
+            label = f"{segment.value} for {format_seconds(segment.seconds)}"
+        else:
+            _check_value(segment.start)
+            _check_value(segment.end)
+            count = max(1, min(abs(segment.end - segment.start) + 1, int(segment.seconds / RAMP_INTERVAL)))
+            for index in range(count):
+                fraction = index / (count - 1) if count > 1 else 1.0
+                value = round(segment.start + (segment.end - segment.start) * fraction)
+                points.append((offset + segment.seconds * index / count, value))
+            label = f"ramp {segment.start}\N{RIGHTWARDS ARROW}{segment.end} over {format_seconds(segment.seconds)}"
+        labels.append(Segment(offset, offset + segment.seconds, label))
+        offset += segment.seconds
+    return offset
+
+
+class Timeline:
+    """Compiled program: events [(offset seconds, {channel: value})] that each change something.
+
+    Every channel in the program is switched off at duration.
+    """
+
+    def __init__(self, events, duration, segments):
+        self.events = events
+        self.duration = duration
+        self.segments = segments  # Channel -> [Segment]
+
+    @property
+    def channels(self):
+        return sorted(self.segments)
+
+    def command_count(self):
+        return len(self.events) + 1  # The final switch off
+
+    def steps(self):
+        """The timeline as (values, seconds) steps for LightController.run_schedule()."""
+        offsets = [offset for offset, _ in self.events] + [self.duration]
+        return [(values, offsets[index + 1] - offset) for index, (offset, values) in enumerate(self.events)]
+
+    def segment_at(self, channel, elapsed):
+        """Return (index, Segment) of the segment of channel running at elapsed seconds, or (None, None)."""
+        for index, segment in enumerate(self.segments.get(channel, [])):
+            if segment.start <= elapsed < segment.end:
+                return index, segment
+        return None, None
+
+
+def compile_program(program):
+    """Compile {channel: [Step | Ramp | Repeat]} into a Timeline."""
+    changes = {}  # Offset -> {channel: value}
+    segments = {}
+    expanded = {}
+    for channel, channel_segments in program.items():
+        points = []
+        segments[channel] = []
+        expanded[channel] = (_expand(channel_segments, 0.0, points, segments[channel]), points)
+    duration = max((end for end, _ in expanded.values()), default=0.0)
+    for channel, (end, points) in expanded.items():
+        if end < duration:
+            points.append((end, 0))  # Channels with a shorter program go dark while the others finish
+        last = None
+        for offset, value in points:
+            if value != last:
+                changes.setdefault(round(offset, 6), {})[channel] = value
+                last = value
+    events = sorted(changes.items())
+    return Timeline(events, duration, segments)
+
+
+def parse_duration(text):
+    """Parse "90", "30s", "2.5min" or "1h" into seconds; a bare number is in minutes."""
+    match = _DURATION.match(text.strip())
+    if not match:
+        raise ValueError(f"Invalid duration {text!r}, use e.g. 10, 30s, 2.5min or 1h")
+    return float(match.group(1)) * _UNITS[match.group(2)]
+
+
+def parse_program(text):
+    """Parse the text form of a single-channel program into a list of segments (see module docstring)."""
+    stack = [[]]
+    repeats = []
+    for number, line in enumerate(text.splitlines(), 1):
+        words = line.split("#", 1)[0].split()
+        if not words:
+            continue
+        try:
+            if words[0] == "repeat" and len(words) == 2:
+                repeats.append(int(words[1]))
+                stack.append([])
+            elif words[0] == "end" and len(words) == 1:
+                if not repeats:
+                    raise ValueError("'end' without 'repeat'")
+                segments = stack.pop()
+                stack[-1].append(Repeat(repeats.pop(), segments))
+            elif words[0] == "ramp" and len(words) == 4:
+                stack[-1].append(Ramp(int(words[1]), int(words[2]), parse_duration(words[3])))
+            elif len(words) == 2:
+                stack[-1].append(Step(int(words[0]), parse_duration(words[1])))
+            else:
+                raise ValueError(f"Cannot parse {line.strip()!r}")
+        except ValueError as e:
+            raise ValueError(f"Line {number}: {e}") from None
+    if repeats:
+        raise ValueError("'repeat' without 'end'")
+    return stack[0]
+
+
+def format_seconds(seconds):
+    minutes, seconds = divmod(round(seconds), 60)
+    return f"{minutes:02}:{seconds:02}"
+
+
+class ProgramRunner:
+    """Run timelines against their own deadlines; the caller polls :meth:`due` from its timer.
+
+    Several timelines can run at once under separate keys (the GUI uses one
+    per LED); each is an exposure of :class:`~bluelight.ExposureScheduler`,
+    so pausing is exact and finishing reports the actual on-time. A paused
+    run keeps its LEDs off, so the on-time leaves out exactly the dark pause.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.exposures = ExposureScheduler(clock)
+        self.runs = {}  # Key -> [Timeline, index of the next event]
+
+    def start(self, key, timeline):
+        self.runs[key] = [timeline, 0]
+        self.exposures.start(key, timeline.duration)
+
+    def cancel(self, key):
+        """Stop the run; returns the channels it drove so the caller can switch them off."""
+        run = self.runs.pop(key, None)
+        self.exposures.cancel(key)
+        return run[0].channels if run else []
+
+    def pause(self, key):
+        """Freeze the run; returns {channel: 0} to send, the light stays off until resume()."""
+        if not self.is_running(key) or self.is_paused(key):
+            return {}
+        self.exposures.pause(key)
+        return {channel: 0 for channel in self.runs[key][0].channels}
+
+    def resume(self, key):
+        """Continue a paused run; returns {channel: value} of the values it had reached to send again."""
+        if not self.is_paused(key):
+            return {}
+        self.exposures.resume(key)
+        timeline, index = self.runs[key]
+        values = {channel: 0 for channel in timeline.channels}
+        for _, changes in timeline.events[:index]:
+            values.update(changes)
+        return values
+
+    def is_running(self, key):
+        return key in self.runs
+
+    def is_paused(self, key):
+        return self.exposures.is_paused(key)
+
+    def elapsed(self, key):
+        timeline, _ = self.runs[key]
+        return timeline.duration - self.exposures.remaining(key)
+
+    def due(self):
+        """Return ({channel: value} to send now, [ExposureResult of the runs that finished])."""
+        values = {}
+        for key, run in self.runs.items():
+            timeline, index = run
+            elapsed = self.elapsed(key)
+            while index < len(timeline.events) and timeline.events[index][0] <= elapsed:
+                values.update(timeline.events[index][1])
+                index += 1
+            run[1] = index
+        finished = self.exposures.expire()
+        for result in finished:
+            timeline, _ = self.runs.pop(result.channel)
+            values.update({channel: 0 for channel in timeline.channels})
+        return values, finished
+
+    def next_wakeup(self):
+        """Seconds until the next event or end of a running (not paused) timeline, or None."""
+        delays = []
+        for key, (timeline, index) in self.runs.items():
+            if self.exposures.is_paused(key):
+                continue
+            remaining = self.exposures.remaining(key)
+            delays.append(remaining)
+            if index < len(timeline.events):
+                delays.append(timeline.events[index][0] - (timeline.duration - remaining))
+        return max(0.0, min(delays)) if delays else None
@@ -0,0 +1,259 @@
+"""Codec for the serial protocol spoken by the BlueLight firmware.
+
+Two wire formats are supported:
+
+* text (all firmware versions): ``SET1:xxx`` from the host and
+  ``BRIGHTNESS1:xxx`` from the box, one command per line. The single-LED
+  firmware uses ``SET:xxx`` / ``BRIGHTNESS:xxx`` without a channel number.
+* binary (dual firmware that answers ``BINARY``): fixed-size frames
+  ``SYNC | kind<<4 | channel | value | seq | crc8`` (5 bytes), and for
+  ``SET_MANY`` ``SYNC | kind<<4 | channel mask | value1 | value2 | seq | crc8``
+  (6 bytes).
+
+``SETM:v1,v2`` / ``SET_MANY`` set several channels at once; the firmware
+applies all of them in the same loop iteration before echoing each channel.
+
+Schedules (binary only) are uploaded as a byte table (see
+:mod:`bluelight.upload`) and then run by the box from ``millis()``:
+
+* ``UPLOAD_BEGIN`` ``SYNC | kind<<4 | length_lo | length_hi | seq | crc8``
+* ``UPLOAD_DATA`` ``SYNC | kind<<4 | count | offset_lo | offset_hi | 8 data bytes | seq | crc8``
+* ``SCHEDULE`` ``SYNC | kind<<4 | op | 0 | seq | crc8`` with op stop, start or
+  checksum query
+* ``STATUS`` (box -> host) ``SYNC | kind<<4 | event | lo | hi | seq | crc8``,
+  in text mode ``SCHEDULE:<EVENT>:<number>``
+
+The host asks for binary mode with :func:`negotiate` right after opening the
+port. Firmware that does not know the ``BINARY`` command ignores it and the
+connection stays in text mode. The box always accepts text commands, so a
+``SET1:`` typed into a terminal still works while binary mode is active.
+"""
+
+import time
+from collections import namedtuple
+
+TEXT = "text"
+BINARY = "binary"
+
+SYNC = 0xA5
+SYNC_BYTE = bytes([SYNC])
+FRAME_SIZE = 5
+SET_MANY_FRAME_SIZE = 6
+SET_MANY_CHANNELS = 2  # Channels a SET_MANY frame has room for
+
+KIND_SET = 0x1  # Host -> box: set channel to value
+KIND_REPORT = 0x2  # Box -> host: channel is now at value
+KIND_SET_MANY = 0x3  # Host -> box: set every channel in the mask at once
+KIND_UPLOAD_BEGIN = 0x4  # Host -> box: a schedule table of the given length follows
+KIND_UPLOAD_DATA = 0x5  # Host -> box: up to UPLOAD_CHUNK bytes of the table at an offset
+KIND_SCHEDULE = 0x6  # Host -> box: schedule operation in the channel field
+KIND_STATUS = 0x7  # Box -> host: schedule event in the channel field, 16-bit number as value
+
+UPLOAD_CHUNK = 8
+UPLOAD_FRAME_SIZE = 6 + UPLOAD_CHUNK
+STATUS_FRAME_SIZE = 6
+MAX_TABLE_SIZE = 512  # Bytes of schedule table the firmware has room for
+
+SCHEDULE_STOP = 0  # Stop the schedule and switch both LEDs off
+SCHEDULE_START = 1
+SCHEDULE_CHECK = 2  # Answered with EVENT_CHECKSUM
+
+# Schedule events and their text names
+EVENT_CHECKSUM = 0  # number = CRC-16 of the uploaded table
+EVENT_STEP = 1  # number = index of the table entry just applied
+EVENT_FINISHED = 2  # number = entries applied
+EVENT_STOPPED = 3  # number = entries applied before STOP
+EVENT_ERROR = 4  # Table too large, missing or malformed
+EVENT_STARTED = 5
+EVENT_NAMES = {
+    EVENT_CHECKSUM: b"CHECKSUM", EVENT_STEP: b"STEP", EVENT_FINISHED: b"FINISHED",
+    EVENT_STOPPED: b"STOPPED", EVENT_ERROR: b"ERROR", EVENT_STARTED: b"STARTED",
+}
+
+GET_REQUEST = b"GET\n"  # Dual firmware reports every channel, older firmware ignores it
+BINARY_REQUEST = b"BINARY\n"
+BINARY_ACK = b"BINARY:OK"
+TEXT_REQUEST = b"TEXT\n"
+NEGOTIATION_TIMEOUT = 0.5  # Seconds to wait for the firmware to acknowledge binary mode
+
+MAX_LINE_LENGTH = 64  # Longest line the firmware sends, anything longer is noise
+
+# Sequence number 0 marks reports that do not answer a host command
+# (encoder, buttons, boot), host commands use 1-255.
+LOCAL_SEQ = 0
+
+Report = namedtuple("Report", ["channel", "value", "seq"])
+Report.__doc__ = """Brightness reported by the box.
+
+channel is None for the single-LED firmware, seq is None for text reports.
+"""
+
+ScheduleEvent = namedtuple("ScheduleEvent", ["event", "number", "seq"])
+ScheduleEvent.__doc__ = """Progress of a schedule running on the box (event is one of the EVENT_* constants)."""
+
+
+def crc8(data):
+    """CRC-8 with polynomial 0x07 (the same routine runs in the firmware)."""
+    crc = 0
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x07) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+    return crc
+
+
+def crc16(data):
+    """CRC-16/CCITT-FALSE of the schedule table (the same routine runs in the firmware)."""
+    crc = 0xFFFF
+    for byte in data:
+        crc ^= byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) & 0xFFFF if crc & 0x8000 else (crc << 1) & 0xFFFF
+    return crc
+
+
+def next_seq(seq):
+    """Return the sequence number that follows seq, skipping LOCAL_SEQ."""
+    return seq % 255 + 1
+
+
+def encode_frame(kind, channel, value, seq):
+    body = bytes(((kind << 4) | channel, value, seq))
+    return SYNC_BYTE + body + bytes((crc8(body),))
+
+
+def encode_set(channel, value, mode=TEXT, seq=LOCAL_SEQ):
+    """Encode a SET command; channel None addresses the single-LED firmware."""
+    if mode == BINARY:
+        return encode_frame(KIND_SET, channel or 1, value, seq)
+    if channel is None:
+        return f"SET:{value}\n".encode()
+    return f"SET{channel}:{value}\n".encode()
+
+
+def encode_set_many(values, mode=TEXT, seq=LOCAL_SEQ):
+    """Encode one command that sets every channel in values ({channel: value})."""
+    if not values or min(values) < 1 or max(values) > SET_MANY_CHANNELS:
+        raise ValueError(f"SET_MANY addresses channels 1-{SET_MANY_CHANNELS}, got {sorted(values)}")
+    if mode == BINARY:
+        mask = 0
+        for channel in values:
+            mask |= 1 << (channel - 1)
+        body = bytes([(KIND_SET_MANY << 4) | mask]
+                     + [values.get(channel, 0) for channel in range(1, SET_MANY_CHANNELS + 1)]
+                     + [seq])
+        return SYNC_BYTE + body + bytes((crc8(body),))
+    fields = (str(values[channel]) if channel in values else "-" for channel in range(1, SET_MANY_CHANNELS + 1))
+    return f"SETM:{','.join(fields)}\n".encode()
+
+
+def encode_upload(table, seq=LOCAL_SEQ):
+    """Encode the frames that upload a schedule table (bytes) to the box."""
+    if len(table) > MAX_TABLE_SIZE:
+        raise ValueError(f"Schedule table has {len(table)} bytes, the firmware holds {MAX_TABLE_SIZE}")
+    body = bytes(((KIND_UPLOAD_BEGIN << 4), len(table) & 0xFF, len(table) >> 8, seq))
+    data = bytearray(SYNC_BYTE + body + bytes((crc8(body),)))
+    for offset in range(0, len(table), UPLOAD_CHUNK):
+        chunk = table[offset:offset + UPLOAD_CHUNK]
+        body = (bytes(((KIND_UPLOAD_DATA << 4) | len(chunk), offset & 0xFF, offset >> 8))
+                + chunk.ljust(UPLOAD_CHUNK, b"\0") + bytes((seq,)))
+        data += SYNC_BYTE + body + bytes((crc8(body),))
+    return bytes(data)
+
+
+def encode_schedule(op, seq=LOCAL_SEQ):
+    """Encode a SCHEDULE_STOP, SCHEDULE_START or SCHEDULE_CHECK command."""
+    return encode_frame(KIND_SCHEDULE, op, 0, seq)
+
+
+def parse_line(line):
+    """Parse one text line into a Report or ScheduleEvent, or return None for other lines."""
+    key, _, value = line.strip().partition(b":")
+    if key == b"SCHEDULE":
+        name, _, number = value.partition(b":")
+        for event, event_name in EVENT_NAMES.items():
+            if name == event_name and number.isdigit():
+                return ScheduleEvent(event, int(number), None)
+        return None
+    if not value.isdigit() or not key.startswith(b"BRIGHTNESS"):
+        return None
+    channel = key[len(b"BRIGHTNESS"):]
+    if not channel:
+        return Report(None, int(value), None)
+    if channel.isdigit():
+        return Report(int(channel), int(value), None)
+    return None
+
+
+class Decoder:
+    """Incrementally split a byte stream into brightness reports.
+
+    Text lines and binary frames may be interleaved (the ``BINARY:OK`` line
+    precedes the first frame), so both are recognised in every mode. Frames
+    with a bad CRC are skipped one byte at a time until the stream resyncs.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.crc_errors = 0
+
+    def feed(self, data):
+        """Add received bytes and return the list of complete Reports and ScheduleEvents."""
+        buffer = self.buffer
+        buffer += data
+        reports = []
+        pos = 0
+        size = len(buffer)
+        while pos < size:
+            if buffer[pos] == SYNC:
+                if size - pos < 2:
+                    break
+                frame_size = STATUS_FRAME_SIZE if buffer[pos + 1] >> 4 == KIND_STATUS else FRAME_SIZE
+                if size - pos < frame_size:
+                    break
+                body = buffer[pos + 1:pos + frame_size - 1]
+                kind = body[0] >> 4
+                if buffer[pos + frame_size - 1] == crc8(body) and kind in (KIND_REPORT, KIND_STATUS):
+                    if kind == KIND_REPORT:
+                        reports.append(Report(body[0] & 0x0F, body[1], body[2]))
+                    else:
+                        reports.append(ScheduleEvent(body[0] & 0x0F, body[1] | body[2] << 8, body[3]))
+                    pos += frame_size
+                else:
+                    self.crc_errors += 1
+                    pos += 1
+                continue
+            end = buffer.find(b"\n", pos)
+            sync = buffer.find(SYNC_BYTE, pos)
+            if sync != -1 and (end == -1 or sync < end):
+                pos = sync  # Text interrupted by a frame, drop the fragment
+                continue
+            if end == -1:
+                break
+            report = parse_line(bytes(buffer[pos:end]))
+            if report:
+                reports.append(report)
+            pos = end + 1
+        if pos:
+            del buffer[:pos]
+        if len(buffer) > MAX_LINE_LENGTH:
+            buffer.clear()
+        return reports
+
+
+def negotiate(serial_port, timeout=NEGOTIATION_TIMEOUT):
+    """Ask the box for binary frames and return BINARY if it agrees, otherwise TEXT."""
+    previous_timeout = serial_port.timeout
+    serial_port.timeout = 0.02
+    try:
+        serial_port.reset_input_buffer()
+        serial_port.write(BINARY_REQUEST)
+        received = bytearray()
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            received += serial_port.read(serial_port.in_waiting or 1)
+            if BINARY_ACK in received:
+                return BINARY
+        return TEXT
+    finally:
+        serial_port.timeout = previous_timeout
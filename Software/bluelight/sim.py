@@ -0,0 +1,523 @@
+"""Simulated BlueLight box for tests and benchmarks without hardware.
+
+:class:`Firmware` models ``SW_Dual/led/led.ino``: the boot lines, text and
+binary commands, ``SETM``/``SET_MANY``, uploaded schedules run from
+``millis()``, the echo after every change, the rotary encoder and the three buttons (including the 200 ms debounce delay
+of the LED toggle button). It records each PWM change with the loop
+iteration it happened in, so the skew between channels can be measured.
+
+Two ways to talk to it:
+
+* :class:`SimulatedDevice` is an in-process object with the parts of the
+  ``serial.Serial`` interface the host code uses.
+* :class:`PtyDevice` opens a pseudo-terminal, so ``serial.Serial(device.port)``
+  (or the GUI) opens it like a real port. Linux/macOS only.
+
+Both deliver bytes at the configured baud rate and can add link latency and
+random byte loss. From the command line::
+
+    python -m bluelight.sim --latency 0.005 --loss 0.001 --encoder-rate 200
+"""
+
+import argparse
+import os
+import random
+import select
+import threading
+import time
+from collections import deque, namedtuple
+
+from . import protocol
+
+ENCODER_STEP = 5  # Brightness change per encoder edge
+DEBOUNCE_DELAY = 0.2  # delay(200) after the LED toggle button
+HANGUP_RETRY = 0.1  # Seconds between reads of a pseudo-terminal whose host has closed it
+PTY_BUFFER = 65536  # Bytes kept for a host that is not reading, older ones are dropped
+
+Change = namedtuple("Change", ["loop", "time", "channel", "value", "seq"])
+
+
+class Firmware:
+    """Byte-level model of the dual-LED firmware."""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.brightness = {1: 0, 2: 0}
+        self.binary_mode = False
+        self.line = bytearray()
+        self.frame = bytearray()
+        self.output = bytearray()
+        self.loop_count = 0
+        self.changes = []  # Change records, in the order the PWM outputs were written
+        self.active_led = 1
+        self.encoder_edges = deque()  # +1/-1 per CLK edge, one is read per loop iteration
+        self.buttons = deque()  # Button numbers (1-3) pressed for one loop iteration each
+        self.table = bytearray(protocol.MAX_TABLE_SIZE)
+        self.table_length = 0
+        self.schedule_pos = 0
+        self.schedule_index = 0
+        self.schedule_next_at = 0  # millis() at which the next entry is due
+        self.schedule_running = False
+
+    def boot(self):
+        self.output += b"BRIGHTNESS1:0\r\nBRIGHTNESS2:0\r\n"
+
+    def turn_encoder(self, steps):
+        """Queue abs(steps) encoder edges, clockwise (brighter) for positive steps."""
+        self.encoder_edges.extend([1 if steps > 0 else -1] * abs(steps))
+
+    def press_button(self, button):
+        self.buttons.append(button)
+
+    def loop(self, data=b""):
+        """Run one iteration of loop() with data as the bytes Serial has available.
+
+        Returns the seconds the firmware blocks in delay() during this iteration.
+        """
+        self.loop_count += 1
+        delay = 0.0
+        changed = set()
+        if self.encoder_edges:
+            channel = self.active_led
+            value = self.brightness[channel] + self.encoder_edges.popleft() * ENCODER_STEP
+            self.brightness[channel] = max(0, min(255, value))
+            changed.add(channel)
+        if self.buttons:
+            button = self.buttons.popleft()
+            channel = self.active_led
+            if button == 1 and self.brightness[channel] != 0:
+                self.brightness[channel] = 0
+                changed.add(channel)
+            elif button == 2:
+                self.active_led = 2 if self.active_led == 1 else 1
+                delay = DEBOUNCE_DELAY
+            elif button == 3 and self.brightness[channel] != 255:
+                self.brightness[channel] = 255
+                changed.add(channel)
+        for channel in sorted(changed):
+            self._set(channel, self.brightness[channel], protocol.LOCAL_SEQ)
+        self._run_schedule()
+        for byte in data:
+            if self.frame or byte == protocol.SYNC:
+                self._frame_byte(byte)
+            elif byte == 0x0A:
+                self._handle_line(bytes(self.line))
+                self.line.clear()
+            elif byte != 0x0D and len(self.line) < 31:
+                self.line.append(byte)
+        return delay
+
+    def take_output(self):
+        output = bytes(self.output)
+        self.output.clear()
+        return output
+
+    def skew(self, since=0):
+        """Return (seconds, loop iterations) between the first change of each channel after index since."""
+        first = {}
+        for change in self.changes[since:]:
+            first.setdefault(change.channel, change)
+        if len(first) < 2:
+            return 0.0, 0
+        times = [change.time for change in first.values()]
+        loops = [change.loop for change in first.values()]
+        return max(times) - min(times), max(loops) - min(loops)
+
+    def _apply(self, channel, value, seq):
+        if channel not in self.brightness:
+            return False
+        self.brightness[channel] = max(0, min(255, value))
+        self.changes.append(Change(self.loop_count, self.clock(), channel, self.brightness[channel], seq))
+        return True
+
+    def _report(self, channel, seq):
+        value = self.brightness[channel]
+        if self.binary_mode:
+            self.output += protocol.encode_frame(protocol.KIND_REPORT, channel, value, seq)
+        else:
+            self.output += f"BRIGHTNESS{channel}:{value}\r\n".encode()
+
+    def _set(self, channel, value, seq):
+        if self._apply(channel, value, seq):
+            self._report(channel, seq)
+
+    def _set_many(self, values, seq):
+        for channel, value in values.items():
+            self._apply(channel, value, seq)
+        for channel in values:
+            self._report(channel, seq)
+
+    def _status(self, event, number, seq):
+        if self.binary_mode:
+            body = bytes(((protocol.KIND_STATUS << 4) | event, number & 0xFF, number >> 8, seq))
+            self.output += protocol.SYNC_BYTE + body + bytes((protocol.crc8(body),))
+        else:
+            self.output += b"SCHEDULE:" + protocol.EVENT_NAMES[event] + f":{number}\r\n".encode()
+
+    def _millis(self):
+        return int(self.clock() * 1000) & 0xFFFFFFFF
+
+    def _read_delay(self):
+        """Read the varint delay at schedule_pos; None if the table ends inside it."""
+        delay = shift = 0
+        while self.schedule_pos < self.table_length and shift < 32:
+            byte = self.table[self.schedule_pos]
+            self.schedule_pos += 1
+            delay |= (byte & 0x7F) << shift
+            if not byte & 0x80:
+                return delay
+            shift += 7
+        return None
+
+    def _fail_schedule(self):
+        self.schedule_running = False
+        self._status(protocol.EVENT_ERROR, self.schedule_index, protocol.LOCAL_SEQ)
+
+    def _start_schedule(self, seq):
+        self.schedule_pos = self.schedule_index = 0
+        delay = self._read_delay() if self.table_length else None
+        if delay is None:
+            self.schedule_running = False
+            self._status(protocol.EVENT_ERROR, 0, seq)
+            return
+        self.schedule_next_at = (self._millis() + delay) & 0xFFFFFFFF
+        self.schedule_running = True
+        self._status(protocol.EVENT_STARTED, self.table_length, seq)
+
+    def _run_schedule(self):
+        # (long)(millis() - next_at) >= 0, with unsigned 32-bit wrap-around
+        while self.schedule_running and (self._millis() - self.schedule_next_at) & 0xFFFFFFFF < 0x80000000:
+            if self.schedule_pos >= self.table_length:
+                return self._fail_schedule()
+            mask = self.table[self.schedule_pos]
+            self.schedule_pos += 1
+            channels = [channel for channel in (1, 2) if mask & (1 << (channel - 1))]
+            if self.schedule_pos + len(channels) > self.table_length:
+                return self._fail_schedule()
+            values = {}
+            for channel in channels:
+                values[channel] = self.table[self.schedule_pos]
+                self.schedule_pos += 1
+            self._set_many(values, protocol.LOCAL_SEQ)
+            self._status(protocol.EVENT_STEP, self.schedule_index, protocol.LOCAL_SEQ)
+            self.schedule_index += 1
+            if self.schedule_pos >= self.table_length:
+                self.schedule_running = False
+                self._status(protocol.EVENT_FINISHED, self.schedule_index, protocol.LOCAL_SEQ)
+                continue
+            delay = self._read_delay()
+            if delay is None:
+                return self._fail_schedule()
+            self.schedule_next_at = (self.schedule_next_at + delay) & 0xFFFFFFFF
+
+    def _handle_line(self, line):
+        if line.startswith(b"SET1:") or line.startswith(b"SET2:"):
+            self._set(line[3] - 0x30, _atoi(line[5:]), protocol.LOCAL_SEQ)
+        elif line.startswith(b"SETM:"):
+            values = {}
+            for channel, field in enumerate(line[5:].split(b",")[:2], start=1):
+                if field and field != b"-":
+                    values[channel] = _atoi(field)
+            self._set_many(values, protocol.LOCAL_SEQ)
+        elif line == b"GET":
+            for channel in self.brightness:
+                self._report(channel, protocol.LOCAL_SEQ)
+        elif line == b"BINARY":
+            self.output += b"BINARY:OK\r\n"
+            self.binary_mode = True
+        elif line == b"TEXT":
+            self.binary_mode = False
+            self.output += b"TEXT:OK\r\n"
+
+    def _frame_byte(self, byte):
+        frame = self.frame
+        frame.append(byte)
+        while len(frame) >= 2:
+            size = _FRAME_SIZES.get(frame[1] >> 4, protocol.FRAME_SIZE)
+            if len(frame) < size:
+                break
+            next_sync = 1
+            if frame[size - 1] == protocol.crc8(frame[1:size - 1]):
+                self._handle_frame(bytes(frame[:size]))
+                next_sync = size
+            while next_sync < len(frame) and frame[next_sync] != protocol.SYNC:
+                next_sync += 1
+            del frame[:next_sync]
+
+    def _handle_frame(self, frame):
+        kind, channel = frame[1] >> 4, frame[1] & 0x0F
+        if kind == protocol.KIND_SET and len(frame) == protocol.FRAME_SIZE:
+            self._set(channel, frame[2], frame[3])
+        elif kind == protocol.KIND_SET_MANY:
+            values = {bit + 1: frame[2 + bit] for bit in range(2) if channel & (1 << bit)}
+            self._set_many(values, frame[4])
+        elif kind == protocol.KIND_UPLOAD_BEGIN:
+            length = frame[2] | frame[3] << 8
+            self.schedule_running = False
+            self.table_length = 0
+            if length > protocol.MAX_TABLE_SIZE:
+                self._status(protocol.EVENT_ERROR, length, frame[4])
+            else:
+                self.table_length = length
+        elif kind == protocol.KIND_UPLOAD_DATA:
+            offset = frame[2] | frame[3] << 8
+            if channel <= protocol.UPLOAD_CHUNK and offset + channel <= self.table_length:
+                self.table[offset:offset + channel] = frame[4:4 + channel]
+        elif kind == protocol.KIND_SCHEDULE:
+            if channel == protocol.SCHEDULE_START:
+                self._start_schedule(frame[3])
+            elif channel == protocol.SCHEDULE_STOP:
+                self.schedule_running = False
+                self._set_many({1: 0, 2: 0}, protocol.LOCAL_SEQ)
+                self._status(protocol.EVENT_STOPPED, self.schedule_index, frame[3])
+            elif channel == protocol.SCHEDULE_CHECK:
+                self._status(protocol.EVENT_CHECKSUM, protocol.crc16(self.table[:self.table_length]), frame[3])
+
+
+_FRAME_SIZES = {
+    protocol.KIND_SET_MANY: protocol.SET_MANY_FRAME_SIZE,
+    protocol.KIND_UPLOAD_BEGIN: protocol.SET_MANY_FRAME_SIZE,
+    protocol.KIND_UPLOAD_DATA: protocol.UPLOAD_FRAME_SIZE,
+}
+
+
+def _atoi(text):
+    """Parse a leading integer the way the firmware's atoi() does."""
+    digits = bytearray()
+    for byte in text.lstrip():
+        if 0x30 <= byte <= 0x39 or (byte == 0x2D and not digits):
+            digits.append(byte)
+        else:
+            break
+    try:
+        return int(digits)
+    except ValueError:
+        return 0
+
+
+class _Link:
+    """One direction of the serial line, delivering bytes one by one at the baud rate.
+
+    latency is added to every byte, loss is the probability that a byte is dropped.
+    """
+
+    def __init__(self, baudrate, latency=0.0, loss=0.0, rng=None):
+        self.byte_time = 10.0 / baudrate if baudrate else 0.0  # Start + 8 data + stop bits
+        self.latency = latency
+        self.loss = loss
+        self.rng = rng or random.Random()
+        self.chunks = deque()  # [time the first byte arrives, bytes not delivered yet]
+        self.free_at = 0.0  # When the line finishes sending what is already queued
+        self.lost_count = 0
+
+    def send(self, data, now):
+        if self.loss:
+            kept = bytes(byte for byte in data if self.rng.random() >= self.loss)
+            self.lost_count += len(data) - len(kept)
+            data = kept
+        if not data:
+            return
+        start = max(now, self.free_at)
+        self.free_at = start + len(data) * self.byte_time
+        self.chunks.append([start + self.latency + self.byte_time, bytes(data)])
+
+    def receive(self, now):
+        data = bytearray()
+        while self.chunks and self.chunks[0][0] <= now:
+            arrival, chunk = self.chunks[0]
+            count = len(chunk) if not self.byte_time else int((now - arrival) / self.byte_time) + 1
+            data += chunk[:count]
+            if count >= len(chunk):
+                self.chunks.popleft()
+            else:
+                self.chunks[0] = [arrival + count * self.byte_time, chunk[count:]]
+        return bytes(data)
+
+
+class _Runner:
+    """Shared state of both device flavours: the firmware, the two links and the loop timing."""
+
+    def __init__(self, baudrate, loop_period, latency, loss, seed):
+        rng = random.Random(seed)
+        self.firmware = Firmware()
+        self.loop_period = loop_period
+        self.to_device = _Link(baudrate, latency, loss, rng)
+        self.to_host = _Link(baudrate, latency, loss, rng)
+        self.events_lock = threading.Lock()
+        self.firmware.boot()
+
+    def turn_encoder(self, steps):
+        with self.events_lock:
+            self.firmware.turn_encoder(steps)
+
+    def press_button(self, button):
+        with self.events_lock:
+            self.firmware.press_button(button)
+
+    def generate_events(self, rate, duration, buttons=False, seed=None):
+        """Feed random encoder edges (and button presses if buttons) at rate per second for duration seconds.
+
+        Runs on its own thread; returns the thread so callers can join() it.
+        """
+        rng = random.Random(seed)
+
+        def run():
+            start = time.monotonic()
+            count = 0
+            while self.is_open and count < rate * duration:
+                if buttons and rng.random() < 0.05:
+                    self.press_button(rng.choice((1, 3)))
+                else:
+                    self.turn_encoder(rng.choice((-1, 1)))
+                count += 1
+                time.sleep(max(0.0, start + count / rate - time.monotonic()))
+
+        thread = threading.Thread(target=run, name="bluelight-sim-events", daemon=True)
+        thread.start()
+        return thread
+
+    def _step(self, now):
+        """Run one firmware loop iteration; return the delay() it asked for."""
+        with self.events_lock:
+            delay = self.firmware.loop(self.to_device.receive(now))
+        output = self.firmware.take_output()
+        if output:
+            self.to_host.send(output, now)
+        return delay
+
+
+class SimulatedDevice(_Runner):
+    """A Firmware on its own thread, usable in place of an open serial.Serial."""
+
+    def __init__(self, baudrate=9600, loop_period=0.0005, timeout=1, latency=0.0, loss=0.0, seed=None):
+        super().__init__(baudrate, loop_period, latency, loss, seed)
+        self.timeout = timeout
+        self.received = bytearray()  # Bytes that reached the host and were not read yet
+        self.condition = threading.Condition()
+        self.is_open = True
+        self.thread = threading.Thread(target=self._run, name="SimulatedDevice", daemon=True)
+        self.thread.start()
+
+    @property
+    def in_waiting(self):
+        with self.condition:
+            self._deliver(time.monotonic())
+            return len(self.received)
+
+    def write(self, data):
+        with self.condition:
+            self.to_device.send(data, time.monotonic())
+        return len(data)
+
+    def read(self, size=1):
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        with self.condition:
+            while True:
+                self._deliver(time.monotonic())
+                if len(self.received) >= size or not self.is_open:
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self.condition.wait(self.loop_period if remaining is None else min(remaining, self.loop_period))
+            data = bytes(self.received[:size])
+            del self.received[:size]
+            return data
+
+    def reset_input_buffer(self):
+        with self.condition:
+            self._deliver(time.monotonic())
+            self.received.clear()
+
+    def close(self):
+        with self.condition:
+            self.is_open = False
+            self.condition.notify_all()
+        self.thread.join()
+
+    def _deliver(self, now):
+        self.received += self.to_host.receive(now)
+
+    def _run(self):
+        while self.is_open:
+            with self.condition:
+                delay = self._step(time.monotonic())
+                self.condition.notify_all()
+            time.sleep(delay or self.loop_period)
+
+
+class PtyDevice(_Runner):
+    """A Firmware behind a pseudo-terminal; open ``device.port`` with serial.Serial."""
+
+    def __init__(self, baudrate=9600, loop_period=0.0005, latency=0.0, loss=0.0, seed=None):
+        import tty  # POSIX only
+
+        super().__init__(baudrate, loop_period, latency, loss, seed)
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)  # No echo or newline translation before the host configures the port
+        self.port = os.ttyname(self.slave)
+        self.is_open = True
+        self.thread = threading.Thread(target=self._run, name="PtyDevice", daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.is_open = False
+        self.thread.join()
+        os.close(self.master)
+        os.close(self.slave)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _run(self):
+        os.set_blocking(self.master, False)  # A host that stops reading must not stop the firmware
+        delay = 0.0
+        unsent = b""
+        retry_at = 0.0  # After a failed read, the master is not read again before this time
+        while self.is_open:
+            reading = [self.master] if time.monotonic() >= retry_at else []
+            ready, _, _ = select.select(reading, [], [], delay or self.loop_period)
+            now = time.monotonic()
+            if ready:
+                try:
+                    self.to_device.send(os.read(self.master, 4096), now)
+                except BlockingIOError:
+                    pass
+                except OSError:  # Host closed its end, the master stays "readable" until one reopens it
+                    retry_at = now + HANGUP_RETRY
+            delay = self._step(now)
+            unsent = (unsent + self.to_host.receive(now))[-PTY_BUFFER:]
+            if unsent:
+                try:
+                    unsent = unsent[os.write(self.master, unsent):]
+                except BlockingIOError:
+                    pass  # Buffer full, try again next loop
+                except OSError:  # No host, the output is lost as on an unplugged cable
+                    unsent = b""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Emulate a BlueLight box on a pseudo-terminal.")
+    parser.add_argument("--baudrate", type=int, default=9600, help="0 delivers bytes instantly")
+    parser.add_argument("--latency", type=float, default=0.0, help="extra link latency in seconds")
+    parser.add_argument("--loss", type=float, default=0.0, help="probability of dropping each byte")
+    parser.add_argument("--encoder-rate", type=float, default=0.0, help="random encoder edges per second")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    with PtyDevice(args.baudrate, latency=args.latency, loss=args.loss, seed=args.seed) as device:
+        print(f"Simulated box on {device.port}, Ctrl+C to stop", flush=True)
+        if args.encoder_rate:
+            device.generate_events(args.encoder_rate, float("inf"), buttons=True, seed=args.seed)
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Schedule tables that the dual firmware runs on its own.
+
+A timeline from :mod:`bluelight.program` is packed into entries of
+
+* the time since the previous entry in milliseconds, as a varint (7 bits per
+  byte, least significant first, high bit set on all but the last byte),
+* a channel mask (bit 0 = LED 1),
+* one brightness byte per channel in the mask, LED 1 first.
+
+The box adds each delay to the absolute start time, so the schedule does not
+drift, and switches the LEDs from ``millis()`` whatever the PC is doing. A
+one-hour exposure is 7 bytes; the firmware holds
+:data:`~bluelight.protocol.MAX_TABLE_SIZE` bytes::
+
+    table = compile_table(compile_program({1: parse_program("128 60")}))
+    await box.upload_schedule(table)
+    await box.start_schedule()
+"""
+
+from . import protocol
+
+
+def _varint(number):
+    data = bytearray()
+    while True:
+        byte = number & 0x7F
+        number >>= 7
+        if number:
+            data.append(byte | 0x80)
+        else:
+            data.append(byte)
+            return data
+
+
+def compile_table(timeline):
+    """Pack a Timeline (ending with every channel off) into a schedule table."""
+    entries = list(timeline.events) + [(timeline.duration, {channel: 0 for channel in timeline.channels})]
+    table = bytearray()
+    previous = 0
+    for offset, values in entries:
+        if not values:
+            continue
+        if min(values) < 1 or max(values) > protocol.SET_MANY_CHANNELS:
+            raise ValueError(f"Schedules address channels 1-{protocol.SET_MANY_CHANNELS}, got {sorted(values)}")
+        milliseconds = round(offset * 1000)  # Absolute, so rounding errors do not add up
+        table += _varint(milliseconds - previous)
+        previous = milliseconds
+        mask = 0
+        for channel in values:
+            mask |= 1 << (channel - 1)
+        table.append(mask)
+        table += bytes(values[channel] for channel in sorted(values))
+    if len(table) > protocol.MAX_TABLE_SIZE:
+        raise ValueError(f"Schedule table has {len(table)} bytes, the firmware holds {protocol.MAX_TABLE_SIZE}")
+    return bytes(table)
+
+
+def decode_table(table):
+    """Unpack a schedule table into [(offset seconds, {channel: value})]."""
+    entries = []
+    pos = 0
+    milliseconds = 0
+    while pos < len(table):
+        delay = shift = 0
+        while True:
+            byte = table[pos]
+            pos += 1
+            delay |= (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                break
+        milliseconds += delay
+        mask = table[pos]
+        pos += 1
+        values = {}
+        for channel in range(1, protocol.SET_MANY_CHANNELS + 1):
+            if mask & (1 << (channel - 1)):
+                values[channel] = table[pos]
+                pos += 1
+        entries.append((milliseconds / 1000, values))
+    return entries
+
+
+def entry_count(table):
+    return len(decode_table(table))
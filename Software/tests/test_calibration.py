@@ -0,0 +1,71 @@
+"""Calibration models, their selection and the fit cache (python -m unittest discover Software/tests)."""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from bluelight.calibration import CACHE_SUFFIX, MODELS, calibrate, load_calibration  # noqa: E402
+from bluelight.irradiance import IRRADIANCE_COLUMN, PWM_COLUMN, fit_log  # noqa: E402
+
+PWM = np.array([1, 5, 10, 20, 40, 80, 128, 180, 255], dtype=float)
+
+
+class CalibrationTest(unittest.TestCase):
+    def test_log_model_is_the_irradiance_fit(self):
+        irradiance = 90000 * np.log(PWM) + 15000
+        params = MODELS["log"][0](np.log(PWM), irradiance)
+        a, b = fit_log(PWM, irradiance)
+        self.assertAlmostEqual(params["a"], a)
+        self.assertAlmostEqual(params["b"], b)
+
+    def test_spline_continues_linearly_beyond_the_points(self):
+        u = np.log(PWM)
+        y = 90000 * u + 15000 + 20000 * np.sin(u)
+        fit, evaluate = MODELS["spline"]
+        params = fit(u, y)
+        inside = evaluate(params, u)
+        self.assertLess(np.sqrt(np.mean((inside - y) ** 2)), 20000)
+        beyond = evaluate(params, np.array([u[-1] + 0.1, u[-1] + 0.2]))
+        self.assertAlmostEqual(beyond[1] - beyond[0], beyond[0] - evaluate(params, np.array([u[-1]]))[0], places=3)
+
+    def test_table_is_non_decreasing_and_dark_at_zero(self):
+        rng = np.random.default_rng(0)
+        irradiance = 90000 * np.log(PWM) + 15000 + rng.normal(0, 5000, len(PWM))
+        calibration = calibrate(PWM, irradiance)
+        self.assertIn(calibration.model, MODELS)
+        self.assertEqual(set(calibration.scores), set(MODELS))
+        self.assertEqual(calibration.table.irradiance(0), 0.0)
+        self.assertTrue(np.all(np.diff(calibration.table.values) >= 0))
+
+    def test_cache_is_reused_until_the_csv_changes(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "calibration.csv")
+            self.write_csv(path, 90000 * np.log(PWM) + 15000)
+            first = load_calibration(path)
+            with open(path + CACHE_SUFFIX, encoding="utf-8") as file:
+                cached = json.load(file)
+            self.assertEqual(cached["model"], first.model)
+            np.testing.assert_allclose(load_calibration(path).table.values, first.table.values)
+
+            self.write_csv(path, 45000 * np.log(PWM) + 15000)
+            changed = load_calibration(path)
+            self.assertAlmostEqual(changed.table.irradiance(255), 45000 * np.log(255) + 15000, delta=1000)
+        finally:
+            shutil.rmtree(directory)
+
+    def write_csv(self, path, irradiance):
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(f"{PWM_COLUMN};{IRRADIANCE_COLUMN}\n")
+            for pwm, value in zip(PWM, irradiance):
+                file.write(f"{pwm:.0f};{value:.3f}".replace(".", ",") + "\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
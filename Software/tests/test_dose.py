@@ -0,0 +1,55 @@
+"""Dose integrated from piecewise constant irradiance (python -m unittest discover Software/tests)."""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from bluelight.dose import DoseIntegrator  # noqa: E402
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class DoseTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.dose = DoseIntegrator(clock=self.clock)
+
+    def test_integrates_each_brightness_for_its_time(self):
+        self.dose.set(1, 1000.0, at=10.0)
+        self.dose.set(1, 250.0, at=20.0)
+        self.dose.set(1, None, at=30.0)  # Unknown brightness adds nothing
+        self.dose.set(1, 100.0, at=50.0)
+        self.assertAlmostEqual(self.dose.dose(1, at=60.0), 1000 * 10 + 250 * 10 + 100 * 10)
+        self.assertEqual(self.dose.dose(2, at=60.0), 0.0)
+
+    def test_target_deadline_moves_with_the_irradiance(self):
+        self.dose.set(1, 100.0)
+        self.dose.add_target(1, 1000.0)
+        self.assertAlmostEqual(self.dose.next_deadline(), 10.0)
+        self.clock.now = 5.0
+        self.dose.set(1, 50.0)  # 500 delivered, the rest at half the irradiance
+        self.assertAlmostEqual(self.dose.next_deadline(), 15.0)
+        self.assertEqual(self.dose.expire(), [])
+        self.clock.now = 15.0
+        (result,) = self.dose.expire()
+        self.assertEqual(result.channel, 1)
+        self.assertAlmostEqual(result.dose, 1000.0)
+        self.assertAlmostEqual(result.seconds, 15.0)
+        self.assertFalse(self.dose.has_target(1))
+
+    def test_no_deadline_while_dark(self):
+        self.dose.set(1, 0.0)
+        self.dose.add_target(1, 1000.0)
+        self.assertIsNone(self.dose.next_deadline())
+        self.assertEqual(self.dose.remaining(1), 1000.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
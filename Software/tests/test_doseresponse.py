@@ -0,0 +1,55 @@
+"""Log-linear dose-response fits and their bootstrap (python -m unittest discover Software/tests)."""
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from bluelight.analysis.doseresponse import bootstrap, fit_loglinear  # noqa: E402
+
+
+class DoseResponseTest(unittest.TestCase):
+    def test_fit_recovers_exact_curve(self):
+        dose = np.array([0.0, 100.0, 400.0, 900.0])
+        y0, slope = fit_loglinear(dose, 350 * np.exp(-0.0008 * dose))
+        self.assertAlmostEqual(y0, 350.0)
+        self.assertAlmostEqual(slope, -0.0008)
+
+    def test_batched_fits_match_single_fits(self):
+        rng = np.random.default_rng(0)
+        dose = np.array([0.0, 100.0, 400.0, 900.0])
+        values = 350 * np.exp(-0.0008 * dose) * np.exp(rng.normal(0, 0.1, (5, len(dose))))
+        y0, slope = fit_loglinear(dose, values)
+        for row in range(len(values)):
+            single = fit_loglinear(dose, values[row])
+            self.assertAlmostEqual(y0[row], single[0])
+            self.assertAlmostEqual(slope[row], single[1])
+
+    def test_interval_covers_true_rate(self):
+        rng = np.random.default_rng(1)
+        dose = np.linspace(0, 1000, 8)
+        values = 350 * np.exp(-0.0008 * dose) * np.exp(rng.normal(0, 0.05, len(dose)))
+        for method in ("residuals", "cases"):
+            result = bootstrap(dose, values, resamples=2000, method=method, seed=0)
+            low, high = np.nanpercentile(result.samples[:, 1], [2.5, 97.5])
+            self.assertLess(low, -0.0008, method)
+            self.assertGreater(high, -0.0008, method)
+
+    def test_too_few_distinct_doses(self):
+        for dose in ([100.0, 400.0], [100.0, 100.0, 100.0], [100.0, 100.0, 400.0, 400.0]):
+            with self.assertRaises(ValueError):
+                bootstrap(dose, [300.0] * len(dose), resamples=10)
+
+    def test_non_positive_values(self):
+        with self.assertRaises(ValueError):
+            bootstrap([0.0, 100.0, 400.0], [300.0, 0.0, 100.0], resamples=10)
+
+    def test_unknown_method(self):
+        with self.assertRaises(ValueError):
+            bootstrap([0.0, 100.0, 400.0], [300.0, 200.0, 100.0], resamples=10, method="jackknife")
+
+
+if __name__ == "__main__":
+    unittest.main()
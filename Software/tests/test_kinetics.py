@@ -0,0 +1,67 @@
+"""Kinetic fits after light on (python -m unittest discover Software/tests)."""
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from bluelight.analysis.align import LIGHT_OFF, LIGHT_ON  # noqa: E402
+from bluelight.analysis.kinetics import fit_curve, fit_run  # noqa: E402
+from bluelight.analysis.oroboros import TIME_COLUMN  # noqa: E402
+from bluelight.analysis.slope import concentration_column  # noqa: E402
+
+
+class Run(dict):
+    """Columns of a stored run and its metadata, as Store.open() returns them."""
+
+    def __init__(self, columns, events, chambers=("1A",)):
+        super().__init__(columns)
+        self.meta = {"events": events, "chambers": list(chambers)}
+
+
+def first_order_run(c_inf, seed=0):
+    """10 min dark, 60 min light, concentrations falling first-order towards c_inf after light on."""
+    rng = np.random.default_rng(seed)
+    minutes = np.arange(0, 80, 2 / 60)
+    lit = np.clip(minutes - 10, 0, None)
+    if c_inf is None:
+        concentration = 200 - 2.5 * lit  # A straight fall, the fit ends on c_inf = 0
+    else:
+        concentration = c_inf + (200 - c_inf) * np.exp(-0.05 * lit)
+    concentration = concentration + rng.normal(0, 0.1, len(minutes))
+    events = [(10.0, LIGHT_ON, "", ""), (70.0, LIGHT_OFF, "", "")]
+    return Run({TIME_COLUMN: minutes, concentration_column("1A"): concentration}, events)
+
+
+def estimates(rows):
+    return {row["parameter"]: (row["estimate"], row["se"]) for row in rows}
+
+
+class KineticsTest(unittest.TestCase):
+    def test_recovers_first_order_parameters(self):
+        result = estimates(fit_run(first_order_run(120.0), "run", models=("first_order",)))
+        self.assertAlmostEqual(result["c_inf"][0], 120.0, delta=0.5)
+        self.assertAlmostEqual(result["k"][0], 0.05, delta=0.001)
+        self.assertTrue(all(np.isfinite(se) and se > 0 for _, se in result.values()))
+
+    def test_parameter_at_bound_has_no_standard_error(self):
+        result = estimates(fit_run(first_order_run(None), "run", models=("first_order",)))
+        c_inf, c_inf_se = result["c_inf"]
+        self.assertLess(c_inf, 1e-6)
+        self.assertTrue(np.isnan(c_inf_se))
+        # The others, rate0 included, are estimated with c_inf fixed at 0
+        for parameter in ("c0", "k", "rate0"):
+            self.assertTrue(np.isfinite(result[parameter][1]), parameter)
+
+    def test_covariance_of_bound_parameter_is_nan(self):
+        t = np.arange(0, 60, 2 / 60)
+        y = 200 - 2.5 * t + np.random.default_rng(1).normal(0, 0.1, len(t))
+        _, covariance, _, _ = fit_curve("first_order", t, y)
+        self.assertTrue(np.isnan(covariance[1]).all() and np.isnan(covariance[:, 1]).all())
+        self.assertTrue(np.isfinite(covariance[np.ix_([0, 2], [0, 2])]).all())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+"""Matching of SET commands with their echoes (python -m unittest discover Software/tests)."""
+
+import asyncio
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from bluelight import LightController  # noqa: E402
+from bluelight.sim import SimulatedDevice  # noqa: E402
+
+COMMANDS = 40
+
+
+class SlowWriteDevice(SimulatedDevice):
+    """Returns from write() only after the echo is back, like a writer thread descheduled right after the write."""
+
+    def write(self, data):
+        written = super().write(data)
+        time.sleep(0.01)
+        return written
+
+
+class LatencyTest(unittest.TestCase):
+    def test_echoes_before_write_returns_are_matched(self):
+        device = SlowWriteDevice(baudrate=10_000_000, loop_period=0.0, latency=0.0)
+
+        async def main():
+            async with LightController(device) as box:
+                for index in range(COMMANDS):
+                    await box.set(1 + index % 2, index % 256)
+                return box.latency.summary()
+
+        try:
+            summary = asyncio.run(main())
+        finally:
+            device.close()
+        self.assertEqual(sum(row["count"] for row in summary.values()), COMMANDS)
+        self.assertEqual(sum(row["unanswered"] for row in summary.values()), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
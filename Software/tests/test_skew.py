@@ -0,0 +1,47 @@
+"""Skew between the LED channels, measured on the simulated box (python -m unittest discover Software/tests)."""
+
+import asyncio
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from bluelight import LightController  # noqa: E402
+from bluelight.sim import SimulatedDevice  # noqa: E402
+
+
+class SkewTest(unittest.TestCase):
+    def run_box(self, commands):
+        """Run commands(box) against a fresh simulated box and return the firmware's skew of the new changes."""
+        device = SimulatedDevice()
+        firmware = device.firmware
+
+        async def main():
+            async with LightController(device) as box:
+                since = len(firmware.changes)
+                await commands(box)
+                return firmware.skew(since)
+
+        try:
+            return asyncio.run(main())
+        finally:
+            device.close()
+
+    def test_set_many_switches_both_channels_in_one_loop(self):
+        async def commands(box):
+            await box.set_many({1: 200, 2: 100})
+
+        _, loops = self.run_box(commands)
+        self.assertEqual(loops, 0)  # Same loop iteration; the simulator still stamps each PWM write separately
+
+    def test_separate_sets_land_in_different_loops(self):
+        async def commands(box):
+            await box.set(1, 200)
+            await box.set(2, 100)
+
+        _, loops = self.run_box(commands)
+        self.assertGreater(loops, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+"""Slope recomputed from the O2 concentration (python -m unittest discover Software/tests)."""
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from bluelight.analysis.slope import SLOPE_FACTOR, StreamingSlope, regression_slope  # noqa: E402
+
+
+def recording(count=18000, seed=0):
+    """Seconds and µM of a chamber sampled every 2 s (10 h by default), consuming O2 with noise."""
+    rng = np.random.default_rng(seed)
+    seconds = 36000 + 2.0 * np.arange(count)
+    concentration = 200 * np.exp(-(seconds - seconds[0]) / 20000) + rng.normal(0, 0.05, count)
+    return seconds, concentration
+
+
+class SlopeTest(unittest.TestCase):
+    def test_streaming_matches_batch(self):
+        seconds, concentration = recording()
+        for window in (5, 40, 100):
+            slope = StreamingSlope(window)
+            streamed = [slope.update(t, y) for t, y in zip(seconds, concentration)]
+            # Hours of samples must not wear down the running sums of either
+            np.testing.assert_allclose(streamed, regression_slope(seconds, concentration, window),
+                                       rtol=0, atol=1e-5, equal_nan=True)
+
+    def test_batch_is_the_regression_over_the_window(self):
+        seconds, concentration = recording(200)
+        slopes = regression_slope(seconds, concentration, window=40)
+        self.assertTrue(np.isnan(slopes[:4]).all())
+        for index in (4, 39, 150):
+            start = max(index - 39, 0)
+            expected = np.polyfit(seconds[start:index + 1], concentration[start:index + 1], 1)[0] * SLOPE_FACTOR
+            self.assertAlmostEqual(slopes[index], expected, places=6)
+
+
+if __name__ == "__main__":
+    unittest.main()
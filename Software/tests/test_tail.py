@@ -0,0 +1,93 @@
+"""Following a DatLab export while it is written (python -m unittest discover Software/tests)."""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from bluelight.analysis.tail import CsvTail, RingBuffer  # noqa: E402
+
+HEADER = ('"Time [min]","Event Name","Chamber","Event Text","1A: O2 concentration [M]",'
+          '"1B: O2 concentration [M]"\n')
+REEXPORT_HEADER = '"Time [min]","Event Name","Chamber","Event Text","1B: O2 concentration [M]"\n'
+
+
+def row(minutes, *values, event=""):
+    return f'{minutes:.2f},"{event}","","",' + ",".join(f"{value:.4f}" for value in values) + "\n"
+
+
+class CsvTailTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "live.csv")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, text, mode="a", path=None):
+        with open(path or self.path, mode, encoding="utf-8") as file:
+            file.write(text)
+
+    def test_reads_only_complete_new_rows(self):
+        self.write(HEADER + row(0.03, 190, 203) + row(0.07, 189, 202), "w")
+        tail = CsvTail(self.path)
+        self.assertEqual(tail.poll(), 2)
+        self.write(row(0.10, 188, 201, event="light on") + "0.13,\"\",\"\",\"\",18")  # The last row is half written
+        self.assertEqual(tail.poll(), 1)
+        self.write("7.5,200.5\n")
+        self.assertEqual(tail.poll(), 1)
+        self.assertEqual(tail.poll(), 0)
+        np.testing.assert_allclose(tail.time.values(), [0.03, 0.07, 0.10, 0.13])
+        np.testing.assert_allclose(tail["1A: O2 concentration [M]"].values(), [190, 189, 188, 187.5])
+        self.assertEqual([event[:2] for event in tail.events], [(0.10, "light on")])
+
+    def test_reexport_with_changed_header(self):
+        self.write(HEADER + row(0.03, 190, 203) + row(0.07, 189, 202), "w")
+        tail = CsvTail(self.path)
+        self.assertEqual(tail.poll(), 2)
+
+        # DatLab re-exports into a new file without the 1A column, longer than what was read
+        replacement = os.path.join(self.directory, "export.tmp")
+        self.write(REEXPORT_HEADER + "".join(row(minutes, 200) for minutes in (0.03, 0.07, 0.10, 0.13)), "w",
+                   replacement)
+        os.replace(replacement, self.path)
+        self.assertEqual(tail.poll(), 4)
+        self.assertEqual(tail.generation, 1)
+        self.assertEqual(sorted(tail.buffers), ["1B: O2 concentration [M]"])
+        np.testing.assert_allclose(tail.time.values(), [0.03, 0.07, 0.10, 0.13])
+        np.testing.assert_allclose(tail["1B: O2 concentration [M]"].values(), [200] * 4)
+
+    def test_rewritten_in_place_with_other_header(self):
+        self.write(HEADER + row(0.03, 190, 203), "w")
+        tail = CsvTail(self.path, columns=["1B: O2 concentration [M]"])
+        self.assertEqual(tail.poll(), 1)
+        self.write(REEXPORT_HEADER + row(0.03, 150) + row(0.07, 149), "w")  # Same inode, longer
+        self.assertEqual(tail.poll(), 2)
+        self.assertEqual(tail.generation, 1)
+        np.testing.assert_allclose(tail["1B: O2 concentration [M]"].values(), [150, 149])
+
+    def test_unreadable_data_is_no_data(self):
+        tail = CsvTail(os.path.join(self.directory, "missing.csv"))
+        self.assertEqual(tail.poll(), 0)
+        self.write(HEADER + "0.03,\"\",\"\",\"\",abc,203\n", "w")
+        tail = CsvTail(self.path)
+        self.assertEqual(tail.poll(), 0)
+
+
+class RingBufferTest(unittest.TestCase):
+    def test_keeps_newest_values_in_order(self):
+        buffer = RingBuffer(5)
+        buffer.extend([1, 2, 3])
+        buffer.extend([4, 5, 6, 7])
+        np.testing.assert_array_equal(buffer.values(), [3, 4, 5, 6, 7])
+        buffer.extend(np.arange(10, 22))
+        np.testing.assert_array_equal(buffer.values(), [17, 18, 19, 20, 21])
+        self.assertEqual(buffer.last(), 21)
+
+
+if __name__ == "__main__":
+    unittest.main()